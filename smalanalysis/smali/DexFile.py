@@ -0,0 +1,1506 @@
+# Reading of DEX files, classes being written as baksmali 2.2.1 disassembles them
+# Author: Vincenzo Musco (http://www.vmusco.com)
+# Creation date: 2026-10-18
+
+import math
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+
+NO_INDEX = 0xffffffff
+
+# Access flags, in the order baksmali writes them, with the kind of items they apply to
+CLASS, METHOD, FIELD = 1, 2, 4
+ACCESS_FLAGS = ((0x1, 'public', CLASS | METHOD | FIELD), (0x2, 'private', CLASS | METHOD | FIELD),
+                (0x4, 'protected', CLASS | METHOD | FIELD), (0x8, 'static', CLASS | METHOD | FIELD),
+                (0x10, 'final', CLASS | METHOD | FIELD), (0x20, 'synchronized', METHOD), (0x40, 'volatile', FIELD),
+                (0x40, 'bridge', METHOD), (0x80, 'transient', FIELD), (0x80, 'varargs', METHOD),
+                (0x100, 'native', METHOD), (0x200, 'interface', CLASS), (0x400, 'abstract', CLASS | METHOD),
+                (0x800, 'strictfp', METHOD), (0x1000, 'synthetic', CLASS | METHOD | FIELD),
+                (0x2000, 'annotation', CLASS), (0x4000, 'enum', CLASS | FIELD), (0x10000, 'constructor', METHOD),
+                (0x20000, 'declared-synchronized', METHOD))
+ACC_STATIC, ACC_FINAL, ACC_SYNTHETIC = 0x8, 0x10, 0x1000
+
+VISIBILITIES = ('build', 'runtime', 'system')
+
+# Printable ASCII characters but quotes and backslashes (nothing to escape)
+PLAIN_STRING = re.compile('[ !#-&(-\\[\\]-~]*')
+
+# Kinds of references of instructions
+STRING, TYPE, FIELD_REF, METHOD_REF, CALL_SITE, METHOD_HANDLE, METHOD_PROTO = 1, 2, 3, 4, 5, 6, 7
+
+# Kinds of method handles (method_handle_item), fields ones first
+METHOD_HANDLE_TYPES = ('static-put', 'static-get', 'instance-put', 'instance-get', 'invoke-static',
+                       'invoke-instance', 'invoke-constructor', 'invoke-direct', 'invoke-interface')
+
+# Items of the map list
+TYPE_CALL_SITE_ID_ITEM, TYPE_METHOD_HANDLE_ITEM = 0x7, 0x8
+
+
+def buildOpcodes():
+    """
+    :return: list of (name, format, reference kind) of the opcodes (None for unused ones)
+    """
+    opcodes = [None] * 256
+
+    def define(first, fmt, names, ref=None):
+        for i, name in enumerate(names.split()):
+            opcodes[first + i] = (name, fmt, ref)
+
+    define(0x00, '10x', 'nop')
+    define(0x01, '12x', 'move')
+    define(0x02, '22x', 'move/from16')
+    define(0x03, '32x', 'move/16')
+    define(0x04, '12x', 'move-wide')
+    define(0x05, '22x', 'move-wide/from16')
+    define(0x06, '32x', 'move-wide/16')
+    define(0x07, '12x', 'move-object')
+    define(0x08, '22x', 'move-object/from16')
+    define(0x09, '32x', 'move-object/16')
+    define(0x0a, '11x', 'move-result move-result-wide move-result-object move-exception')
+    define(0x0e, '10x', 'return-void')
+    define(0x0f, '11x', 'return return-wide return-object')
+    define(0x12, '11n', 'const/4')
+    define(0x13, '21s', 'const/16')
+    define(0x14, '31i', 'const')
+    define(0x15, '21ih', 'const/high16')
+    define(0x16, '21s', 'const-wide/16')
+    define(0x17, '31i', 'const-wide/32')
+    define(0x18, '51l', 'const-wide')
+    define(0x19, '21lh', 'const-wide/high16')
+    define(0x1a, '21c', 'const-string', STRING)
+    define(0x1b, '31c', 'const-string/jumbo', STRING)
+    define(0x1c, '21c', 'const-class', TYPE)
+    define(0x1d, '11x', 'monitor-enter monitor-exit')
+    define(0x1f, '21c', 'check-cast', TYPE)
+    define(0x20, '22c', 'instance-of', TYPE)
+    define(0x21, '12x', 'array-length')
+    define(0x22, '21c', 'new-instance', TYPE)
+    define(0x23, '22c', 'new-array', TYPE)
+    define(0x24, '35c', 'filled-new-array', TYPE)
+    define(0x25, '3rc', 'filled-new-array/range', TYPE)
+    define(0x26, '31t', 'fill-array-data')
+    define(0x27, '11x', 'throw')
+    define(0x28, '10t', 'goto')
+    define(0x29, '20t', 'goto/16')
+    define(0x2a, '30t', 'goto/32')
+    define(0x2b, '31t', 'packed-switch sparse-switch')
+    define(0x2d, '23x', 'cmpl-float cmpg-float cmpl-double cmpg-double cmp-long')
+    define(0x32, '22t', 'if-eq if-ne if-lt if-ge if-gt if-le')
+    define(0x38, '21t', 'if-eqz if-nez if-ltz if-gez if-gtz if-lez')
+    define(0x44, '23x', 'aget aget-wide aget-object aget-boolean aget-byte aget-char aget-short '
+                        'aput aput-wide aput-object aput-boolean aput-byte aput-char aput-short')
+    define(0x52, '22c', 'iget iget-wide iget-object iget-boolean iget-byte iget-char iget-short '
+                        'iput iput-wide iput-object iput-boolean iput-byte iput-char iput-short', FIELD_REF)
+    define(0x60, '21c', 'sget sget-wide sget-object sget-boolean sget-byte sget-char sget-short '
+                        'sput sput-wide sput-object sput-boolean sput-byte sput-char sput-short', FIELD_REF)
+    define(0x6e, '35c', 'invoke-virtual invoke-super invoke-direct invoke-static invoke-interface', METHOD_REF)
+    define(0x74, '3rc', 'invoke-virtual/range invoke-super/range invoke-direct/range invoke-static/range '
+                        'invoke-interface/range', METHOD_REF)
+    define(0x7b, '12x', 'neg-int not-int neg-long not-long neg-float neg-double int-to-long int-to-float '
+                        'int-to-double long-to-int long-to-float long-to-double float-to-int float-to-long '
+                        'float-to-double double-to-int double-to-long double-to-float int-to-byte int-to-char '
+                        'int-to-short')
+
+    binops = 'add-int sub-int mul-int div-int rem-int and-int or-int xor-int shl-int shr-int ushr-int ' \
+             'add-long sub-long mul-long div-long rem-long and-long or-long xor-long shl-long shr-long ushr-long ' \
+             'add-float sub-float mul-float div-float rem-float add-double sub-double mul-double div-double ' \
+             'rem-double'
+    define(0x90, '23x', binops)
+    define(0xb0, '12x', ' '.join('%s/2addr' % op for op in binops.split()))
+    define(0xd0, '22s', 'add-int/lit16 rsub-int mul-int/lit16 div-int/lit16 rem-int/lit16 and-int/lit16 '
+                        'or-int/lit16 xor-int/lit16')
+    define(0xd8, '22b', 'add-int/lit8 rsub-int/lit8 mul-int/lit8 div-int/lit8 rem-int/lit8 and-int/lit8 '
+                        'or-int/lit8 xor-int/lit8 shl-int/lit8 shr-int/lit8 ushr-int/lit8')
+    # DEX 038 and 039
+    define(0xfa, '45cc', 'invoke-polymorphic', METHOD_REF)
+    define(0xfb, '4rcc', 'invoke-polymorphic/range', METHOD_REF)
+    define(0xfc, '35c', 'invoke-custom', CALL_SITE)
+    define(0xfd, '3rc', 'invoke-custom/range', CALL_SITE)
+    define(0xfe, '21c', 'const-method-handle', METHOD_HANDLE)
+    define(0xff, '21c', 'const-method-type', METHOD_PROTO)
+
+    return opcodes
+
+
+OPCODES = buildOpcodes()
+FORMAT_SIZES = {'10x': 1, '12x': 1, '11n': 1, '11x': 1, '10t': 1, '20t': 2, '22x': 2, '21t': 2, '21s': 2,
+                '21ih': 2, '21lh': 2, '21c': 2, '23x': 2, '22b': 2, '22t': 2, '22s': 2, '22c': 2, '30t': 3,
+                '32x': 3, '31i': 3, '31t': 3, '31c': 3, '35c': 3, '3rc': 3, '45cc': 4, '4rcc': 4, '51l': 5}
+PACKED_SWITCH_PAYLOAD, SPARSE_SWITCH_PAYLOAD, ARRAY_PAYLOAD = 0x100, 0x200, 0x300
+OP_PACKED_SWITCH, OP_SPARSE_SWITCH, OP_FILL_ARRAY_DATA = 0x2b, 0x2c, 0x26
+
+# Synthetic accessors (see accessorType())
+ACCESSOR_COMMENTS = ('invokes: ', 'getter for: ', 'setter for: ', 'operator++ for: ', '++operator for: ',
+                     'operator-- for: ', '--operator for: ', '+= operator for: ', '-= operator for: ',
+                     '*= operator for: ', '/= operator for: ', '%= operator for: ', '&= operator for: ',
+                     '|= operator for: ', '^= operator for: ', '<<= operator for: ', '>>= operator for: ',
+                     '>>>= operator for: ')
+METHOD_ACCESS, GETTER, SETTER = 0, 1, 2
+POSTFIX_INCREMENT, PREFIX_INCREMENT, POSTFIX_DECREMENT, PREFIX_DECREMENT = 3, 4, 5, 6
+ADD, SUB = 7, 8
+# Math operation of the binary opcodes (for the compound assignments accessors)
+MATH_OPS = {}
+for i, op in enumerate((ADD, SUB, 9, 10, 11, 12, 13, 14, 15, 16, 17)):
+    for base in (0x90, 0xb0):
+        MATH_OPS[base + i] = op
+    if op < 15:
+        for base in (0x9b, 0xbb):
+            MATH_OPS[base + i] = op
+for i, op in enumerate((ADD, SUB, 9, 10, 11)):
+    for base in (0xa6, 0xab, 0xc6, 0xcb):
+        MATH_OPS[base + i] = op
+del i, op, base
+INT, LONG, FLOAT, DOUBLE = 0, 1, 2, 3
+
+
+def mathType(op):
+    op = op - 0x20 if op >= 0xb0 else op
+    return INT if op < 0x9b else LONG if op < 0xa6 else FLOAT if op < 0xab else DOUBLE
+
+
+def signed(value, bits):
+    return value - (1 << bits) if value >= 1 << (bits - 1) else value
+
+
+def hexLiteral(value):
+    """
+    Integer literal of an instruction (LongRenderer.writeSignedIntOrLongTo)
+    """
+    if value < 0:
+        return '-0x%x%s' % (-value, 'L' if value < -0x80000000 else '')
+    return '0x%x%s' % (value, 'L' if value > 0x7fffffff else '')
+
+
+def escapeString(value):
+    """
+    Escaping of the characters (UTF-16 units) of a string literal (dexlib2 StringUtils.escapeString)
+    """
+    if PLAIN_STRING.fullmatch(value):
+        return value
+
+    escaped = []
+    for c in value:
+        code = ord(c)
+        if 0x20 <= code < 0x7f:
+            escaped.append('\\' + c if c in '\'"\\' else c)
+        elif c == '\n':
+            escaped.append('\\n')
+        elif c == '\r':
+            escaped.append('\\r')
+        elif c == '\t':
+            escaped.append('\\t')
+        elif code > 0xffff:
+            code -= 0x10000
+            escaped.append('\\u%04x\\u%04x' % (0xd800 + (code >> 10), 0xdc00 + (code & 0x3ff)))
+        else:
+            escaped.append('\\u%04x' % code)
+
+    return ''.join(escaped)
+
+
+def javaFloatToString(value, single=False):
+    """
+    Float.toString() / Double.toString(): the shortest decimal (of 2 digits at least) rounding to the value
+    """
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return 'Infinity' if value > 0 else '-Infinity'
+    if value == 0:
+        return '-0.0' if math.copysign(1, value) < 0 else '0.0'
+
+    for precision in range(1, 17):
+        text = '%.*e' % (precision, value)
+        parsed = float(text)
+        if single:
+            try:
+                parsed = struct.unpack('<f', struct.pack('<f', parsed))[0]
+            except OverflowError:
+                continue
+        if parsed == value:
+            break
+
+    mantissa, exponent = text.split('e')
+    sign = '-' if mantissa[0] == '-' else ''
+    digits = mantissa.lstrip('-').replace('.', '').rstrip('0') or '0'
+    exponent = int(exponent)
+
+    if 1e-3 <= abs(value) < 1e7:
+        if exponent >= 0:
+            digits = digits.ljust(exponent + 1, '0')
+            return '%s%s.%s' % (sign, digits[:exponent + 1], digits[exponent + 1:] or '0')
+        return '%s0.%s%s' % (sign, '0' * (-exponent - 1), digits)
+
+    return '%s%s.%sE%d' % (sign, digits[0], digits[1:] or '0', exponent)
+
+
+def scientific(value):
+    """
+    Formatting of a number with DecimalFormat("0.####################E0")
+    """
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '-∞' if value < 0 else '∞'
+        if value == 0:
+            return '-0E0' if math.copysign(1, value) < 0 else '0E0'
+        mantissa, exponent = ('%r' % abs(value)).partition('e')[::2]
+        exponent = int(exponent) if exponent else 0
+        integer, fraction = mantissa.partition('.')[::2]
+        digits = (integer + fraction).lstrip('0')
+        exponent += len(integer.lstrip('0')) - 1 if integer.lstrip('0') else \
+            -(len(fraction) - len(fraction.lstrip('0')) + 1)
+    else:
+        if value == 0:
+            return '0E0'
+        digits = str(abs(value))
+        exponent = len(digits) - 1
+
+    digits = digits.rstrip('0')
+    return '%s%s%sE%d' % ('-' if value < 0 else '', digits[0], '.' + digits[1:] if len(digits) > 1 else '',
+                          exponent)
+
+
+def shorterAsFloatingPoint(integer, floating):
+    """
+    NumberUtils.isLikelyFloat/isLikelyDouble last test: is the number shorter as a floating point one?
+    """
+    asInt = scientific(integer)
+    asFloat = scientific(floating)
+
+    point, exponent = asFloat.find('.'), asFloat.find('E')
+    zeros = asFloat.find('000')
+    if point < zeros < exponent:
+        asFloat = asFloat[:zeros] + asFloat[exponent:]
+    else:
+        nines = asFloat.find('999')
+        if point < nines < exponent:
+            asFloat = asFloat[:nines] + asFloat[exponent:]
+
+    return len(asFloat) < len(asInt)
+
+
+def floatComment(value):
+    """
+    Comment written after a 32 bits literal looking like a float
+    """
+    if value not in (0x7fc00000, 0x7f7fffff, 0x40490fdb, 0x402df854):
+        if value in (0x7fffffff, -0x80000000):
+            return ''
+        if (value >> 24) in (0x7f, 1) and (value >> 16) & 0xff < 0x1f and value & 0xffff < 0xfff:
+            return ''
+
+    fval = struct.unpack('<f', struct.pack('<i', value))[0]
+    if value not in (0x7fc00000, 0x7f7fffff, 0x40490fdb, 0x402df854):
+        if math.isnan(fval) or not shorterAsFloatingPoint(value, fval):
+            return ''
+
+    if value == 0x7f800000:
+        return '    # Float.POSITIVE_INFINITY'
+    if value == -0x800000:
+        return '    # Float.NEGATIVE_INFINITY'
+    if value == 0x7f7fffff:
+        return '    # Float.MAX_VALUE'
+    if value == 0x40490fdb:
+        return '    # (float)Math.PI'
+    if value == 0x402df854:
+        return '    # (float)Math.E'
+    return '    # %sf' % javaFloatToString(fval, True)
+
+
+def doubleComment(value):
+    """
+    Comment written after a 64 bits literal looking like a double
+    """
+    named = (0x7ff8000000000000, 0x7fefffffffffffff, 0x400921fb54442d18, 0x4005bf0a8b145769)
+    if value not in named and value in (0x7fffffffffffffff, -0x8000000000000000):
+        return ''
+
+    dval = struct.unpack('<d', struct.pack('<q', value))[0]
+    if value not in named and (math.isnan(dval) or not shorterAsFloatingPoint(value, dval)):
+        return ''
+
+    if value == 0x7ff0000000000000:
+        return '    # Double.POSITIVE_INFINITY'
+    if value == -0x10000000000000:
+        return '    # Double.NEGATIVE_INFINITY'
+    if value == 0x7fefffffffffffff:
+        return '    # Double.MAX_VALUE'
+    if value == 0x400921fb54442d18:
+        return '    # Math.PI'
+    if value == 0x4005bf0a8b145769:
+        return '    # Math.E'
+    return '    # %s' % javaFloatToString(dval)
+
+
+def decodeMutf8(data):
+    """
+    :return: the string of the MUTF-8 bytes (surrogate pairs are combined, unpaired ones are kept)
+    """
+    units = []
+    i, length = 0, len(data)
+
+    while i < length:
+        b = data[i]
+        if b < 0x80:
+            units.append(b)
+            i += 1
+        elif b < 0xe0:
+            units.append(((b & 0x1f) << 6) | (data[i + 1] & 0x3f))
+            i += 2
+        else:
+            units.append(((b & 0x0f) << 12) | ((data[i + 1] & 0x3f) << 6) | (data[i + 2] & 0x3f))
+            i += 3
+
+    return array('H', units).tobytes().decode('utf-16-le' if sys.byteorder == 'little' else 'utf-16-be',
+                                              'surrogatepass')
+
+
+class DexFile(object):
+    """
+    Items of a DEX file, read as they are needed.
+    Classes are turned into the lines baksmali writes (see classLines()).
+    """
+    def __init__(self, data):
+        if data[:4] != b'dex\n':
+            raise ValueError('Not a DEX file')
+
+        self.data = data
+        (self.stringsSize, self.stringsOffset, self.typesSize, self.typesOffset, self.protosSize,
+         self.protosOffset, self.fieldsSize, self.fieldsOffset, self.methodsSize, self.methodsOffset,
+         self.classesSize, self.classesOffset) = struct.unpack_from('<12I', data, 56)
+
+        # Call sites and method handles (DEX 038) are only listed in the map
+        self.callSitesOffset, self.methodHandlesOffset = 0, 0
+        mapOffset = self.u32(52)
+        for i in range(self.u32(mapOffset)):
+            type, unused, size, offset = struct.unpack_from('<2H2I', data, mapOffset + 4 + 12 * i)
+            if type == TYPE_CALL_SITE_ID_ITEM:
+                self.callSitesOffset = offset
+            elif type == TYPE_METHOD_HANDLE_ITEM:
+                self.methodHandlesOffset = offset
+
+        self.strings = [None] * self.stringsSize
+        self.types = [None] * self.typesSize
+        self.fieldRefs = [None] * self.fieldsSize
+        self.methodRefs = [None] * self.methodsSize
+        self.protos = [None] * self.protosSize
+        self.classesByType = None
+        self.accessors = {}
+        self.accessFlagsTexts = {}
+
+    # Encoded values
+    def uleb128(self, offset):
+        data = self.data
+        result = data[offset]
+        if result < 0x80:
+            return result, offset + 1
+
+        result &= 0x7f
+        shift = 7
+        while True:
+            offset += 1
+            b = data[offset]
+            result |= (b & 0x7f) << shift
+            if b < 0x80:
+                return result, offset + 1
+            shift += 7
+
+    def sleb128(self, offset):
+        value, end = self.uleb128(offset)
+        bits = 7 * (end - offset)
+        return signed(value, bits), end
+
+    def u16(self, offset):
+        return struct.unpack_from('<H', self.data, offset)[0]
+
+    def u32(self, offset):
+        return struct.unpack_from('<I', self.data, offset)[0]
+
+    # Ids
+    def string(self, idx):
+        s = self.strings[idx]
+
+        if s is None:
+            size, offset = self.uleb128(self.u32(self.stringsOffset + 4 * idx))
+            end = self.data.index(b'\0', offset)
+            raw = self.data[offset:end]
+            try:
+                s = raw.decode('ascii')
+            except UnicodeDecodeError:
+                s = decodeMutf8(raw)
+            self.strings[idx] = s
+
+        return s
+
+    def optionalString(self, idx):
+        return None if idx < 0 or idx == NO_INDEX else self.string(idx)
+
+    def type(self, idx):
+        t = self.types[idx]
+
+        if t is None:
+            t = self.types[idx] = self.string(self.u32(self.typesOffset + 4 * idx))
+
+        return t
+
+    def optionalType(self, idx):
+        return None if idx < 0 or idx == NO_INDEX else self.type(idx)
+
+    def typeList(self, offset):
+        if offset == 0:
+            return ()
+
+        size = self.u32(offset)
+        return tuple(self.type(t) for t in struct.unpack_from('<%dH' % size, self.data, offset + 4))
+
+    def proto(self, idx):
+        """
+        :return: (parameters types, return type)
+        """
+        p = self.protos[idx]
+
+        if p is None:
+            shorty, ret, params = struct.unpack_from('<3I', self.data, self.protosOffset + 12 * idx)
+            p = self.protos[idx] = (self.typeList(params), self.type(ret))
+
+        return p
+
+    def fieldId(self, idx):
+        """
+        :return: (class, name, type)
+        """
+        clazz, type, name = struct.unpack_from('<HHI', self.data, self.fieldsOffset + 8 * idx)
+        return self.type(clazz), self.string(name), self.type(type)
+
+    def fieldReference(self, idx):
+        ref = self.fieldRefs[idx]
+
+        if ref is None:
+            ref = self.fieldRefs[idx] = '%s->%s:%s' % self.fieldId(idx)
+
+        return ref
+
+    def methodId(self, idx):
+        """
+        :return: (class, name, parameters types, return type)
+        """
+        clazz, proto, name = struct.unpack_from('<HHI', self.data, self.methodsOffset + 8 * idx)
+        params, ret = self.proto(proto)
+        return self.type(clazz), self.string(name), params, ret
+
+    def methodReference(self, idx):
+        ref = self.methodRefs[idx]
+
+        if ref is None:
+            clazz, name, params, ret = self.methodId(idx)
+            ref = self.methodRefs[idx] = '%s->%s(%s)%s' % (clazz, name, ''.join(params), ret)
+
+        return ref
+
+    def protoReference(self, idx):
+        params, ret = self.proto(idx)
+        return '(%s)%s' % (''.join(params), ret)
+
+    def methodHandleReference(self, idx):
+        type, unused, member = struct.unpack_from('<3H', self.data, self.methodHandlesOffset + 8 * idx)
+        if type >= len(METHOD_HANDLE_TYPES):
+            raise ValueError('Unsupported method handle type 0x%x' % type)
+
+        if type < 4:
+            return '%s@%s' % (METHOD_HANDLE_TYPES[type], self.fieldReference(member))
+        return '%s@%s' % (METHOD_HANDLE_TYPES[type], self.methodReference(member))
+
+    def callSiteReference(self, idx):
+        """
+        Call site of invoke-custom, as smali writes it: call_site_N("name", (proto)ret, extra arguments)@method
+        """
+        (kind, values), end = self.encodedArray(self.u32(self.callSitesOffset + 4 * idx))
+        if len(values) < 3 or values[0][0] != 0x16 or values[1][0] != 0x17 or values[2][0] != 0x15:
+            raise ValueError('Invalid call site %d' % idx)
+
+        type, unused, member = struct.unpack_from('<3H', self.data, self.methodHandlesOffset + 8 * values[0][1])
+        arguments = ''.join(', ' + ' '.join(l.strip() for l in self.encodedValueLines(v)) for v in values[3:])
+
+        return 'call_site_%d("%s", %s%s)@%s' % (idx, escapeString(self.string(values[1][1])),
+                                                self.protoReference(values[2][1]), arguments,
+                                                self.methodReference(member))
+
+    def reference(self, kind, idx):
+        if kind == STRING:
+            return '"%s"' % escapeString(self.string(idx))
+        if kind == TYPE:
+            return self.type(idx)
+        if kind == FIELD_REF:
+            return self.fieldReference(idx)
+        if kind == METHOD_REF:
+            return self.methodReference(idx)
+        if kind == METHOD_PROTO:
+            return self.protoReference(idx)
+        if kind == METHOD_HANDLE:
+            return self.methodHandleReference(idx)
+        return self.callSiteReference(idx)
+
+    def accessFlags(self, flags, kind):
+        text = self.accessFlagsTexts.get((flags, kind))
+
+        if text is None:
+            text = ''.join('%s ' % name for flag, name, kinds in ACCESS_FLAGS if flags & flag and kinds & kind)
+            self.accessFlagsTexts[(flags, kind)] = text
+
+        return text
+
+    # Classes
+    def classDef(self, idx):
+        """
+        :return: (class, access flags, superclass, interfaces, source file, annotations, class data, static values)
+        offsets or indexes
+        """
+        return struct.unpack_from('<8I', self.data, self.classesOffset + 32 * idx)
+
+    def className(self, idx):
+        return self.type(self.classDef(idx)[0])
+
+    def classData(self, offset):
+        """
+        :return: (static fields, instance fields, direct methods, virtual methods) lists of (index, access flags) for
+                 fields and (index, access flags, code offset) for methods
+        """
+        if offset == 0:
+            return [], [], [], []
+
+        sizes = []
+        for i in range(4):
+            size, offset = self.uleb128(offset)
+            sizes.append(size)
+
+        items = []
+        for i, size in enumerate(sizes):
+            members = []
+            idx = 0
+            for j in range(size):
+                diff, offset = self.uleb128(offset)
+                flags, offset = self.uleb128(offset)
+                idx += diff
+                if i < 2:
+                    members.append((idx, flags))
+                else:
+                    code, offset = self.uleb128(offset)
+                    members.append((idx, flags, code))
+            items.append(members)
+
+        return items
+
+    def annotationsDirectory(self, offset):
+        """
+        :return: (class annotations offset, {field: annotations offset}, {method: annotations offset},
+                  {method: parameters annotations offset})
+        """
+        if offset == 0:
+            return 0, {}, {}, {}
+
+        classAnnotations, fields, methods, parameters = struct.unpack_from('<4I', self.data, offset)
+        offset += 16
+        maps = []
+        for size in (fields, methods, parameters):
+            items = struct.unpack_from('<%dI' % (2 * size), self.data, offset)
+            maps.append(dict(zip(items[::2], items[1::2])))
+            offset += 8 * size
+
+        return (classAnnotations,) + tuple(maps)
+
+    # Encoded values, as (type, value)
+    def encodedValue(self, offset):
+        data = self.data
+        header = data[offset]
+        offset += 1
+        kind, arg = header & 0x1f, header >> 5
+
+        if kind == 0x1c:
+            return self.encodedArray(offset)
+        if kind == 0x1d:
+            return self.encodedAnnotation(offset)
+        if kind == 0x1e:
+            return (kind, None), offset
+        if kind == 0x1f:
+            return (kind, arg == 1), offset
+
+        size = arg + 1
+        raw = int.from_bytes(data[offset:offset + size], 'little')
+        offset += size
+
+        if kind in (0x00, 0x02, 0x04, 0x06):
+            value = signed(raw, 8 * size)
+        elif kind == 0x10:
+            value = struct.unpack('<f', struct.pack('<I', raw << (8 * (4 - size))))[0]
+        elif kind == 0x11:
+            value = struct.unpack('<d', struct.pack('<Q', raw << (8 * (8 - size))))[0]
+        else:
+            value = raw
+
+        return (kind, value), offset
+
+    def encodedArray(self, offset):
+        size, offset = self.uleb128(offset)
+        values = []
+        for i in range(size):
+            value, offset = self.encodedValue(offset)
+            values.append(value)
+
+        return (0x1c, values), offset
+
+    def encodedAnnotation(self, offset):
+        """
+        :return: ((0x1d, (type, [(name, value)...])), end offset)
+        """
+        type, offset = self.uleb128(offset)
+        size, offset = self.uleb128(offset)
+        elements = []
+        for i in range(size):
+            name, offset = self.uleb128(offset)
+            value, offset = self.encodedValue(offset)
+            elements.append((self.string(name), value))
+
+        return (0x1d, (self.type(type), elements)), offset
+
+    def encodedValueLines(self, value):
+        """
+        Lines of an encoded value (EncodedValueAdaptor.writeTo)
+        """
+        kind, v = value
+
+        if kind == 0x1c:
+            if len(v) == 0:
+                return ['{}']
+
+            lines = ['{']
+            for i, element in enumerate(v):
+                elines = self.encodedValueLines(element)
+                if i < len(v) - 1:
+                    elines[-1] += ','
+                lines.extend('    ' + l for l in elines)
+            lines.append('}')
+            return lines
+
+        if kind == 0x1d:
+            return ['.subannotation %s' % v[0]] + self.annotationElementsLines(v[1]) + ['.end subannotation']
+
+        return [self.encodedValueText(kind, v)]
+
+    def encodedValueText(self, kind, v):
+        if kind == 0x00:
+            return '-0x%xt' % -v if v < 0 else '0x%xt' % v
+        if kind == 0x02:
+            return '-0x%xs' % -v if v < 0 else '0x%xs' % v
+        if kind == 0x03:
+            return "'%s'" % escapeString(chr(v))
+        if kind == 0x04:
+            return '-0x%x' % -v if v < 0 else '0x%x' % v
+        if kind == 0x06:
+            return '-0x%xL' % -v if v < 0 else '0x%xL' % v
+        if kind == 0x10:
+            return javaFloatToString(v, True) + 'f'
+        if kind == 0x11:
+            return javaFloatToString(v)
+        if kind == 0x17:
+            return '"%s"' % escapeString(self.string(v))
+        if kind == 0x18:
+            return self.type(v)
+        if kind == 0x19:
+            return self.fieldReference(v)
+        if kind == 0x1a:
+            return self.methodReference(v)
+        if kind == 0x15:
+            return self.protoReference(v)
+        if kind == 0x16:
+            return self.methodHandleReference(v)
+        if kind == 0x1b:
+            return '.enum %s' % self.fieldReference(v)
+        if kind == 0x1e:
+            return 'null'
+        if kind == 0x1f:
+            return 'true' if v else 'false'
+
+        raise ValueError('Unsupported encoded value type 0x%x' % kind)
+
+    def annotationElementsLines(self, elements):
+        lines = []
+        for name, value in elements:
+            vlines = self.encodedValueLines(value)
+            lines.append('    %s = %s' % (name, vlines[0]))
+            lines.extend('    ' + l for l in vlines[1:])
+
+        return lines
+
+    def annotationSet(self, offset):
+        """
+        :return: list of (visibility, type, elements) of an annotation_set_item
+        """
+        if offset == 0:
+            return []
+
+        size = self.u32(offset)
+        annotations = []
+        for entry in struct.unpack_from('<%dI' % size, self.data, offset + 4):
+            visibility = self.data[entry]
+            (kind, (type, elements)), end = self.encodedAnnotation(entry + 1)
+            annotations.append((visibility, type, elements))
+
+        return annotations
+
+    def annotationsLines(self, annotations):
+        lines = []
+        for visibility, type, elements in annotations:
+            lines.append('.annotation %s %s' % (VISIBILITIES[visibility], type))
+            lines.extend(self.annotationElementsLines(elements))
+            lines.append('.end annotation')
+
+        return lines
+
+    def parametersAnnotations(self, offset):
+        """
+        :return: list of the annotations of each parameter (annotation_set_ref_list)
+        """
+        if offset == 0:
+            return []
+
+        size = self.u32(offset)
+        return [self.annotationSet(o) for o in struct.unpack_from('<%dI' % size, self.data, offset + 4)]
+
+    def classLines(self, idx):
+        """
+        Lines of a class as written by baksmali 2.2.1 (with its default options), without the empty lines and the
+        comments at the beginning of a line (which SmaliProject.parseClassLines() ignores)
+        """
+        clazz, flags, superclass, interfaces, source, annotations, classdata, staticvalues = self.classDef(idx)
+        type = self.type(clazz)
+
+        lines = ['.class %s%s' % (self.accessFlags(flags, CLASS), type)]
+        if superclass != NO_INDEX:
+            lines.append('.super %s' % self.type(superclass))
+        if source != NO_INDEX:
+            lines.append('.source "%s"' % escapeString(self.string(source)))
+        for interface in self.typeList(interfaces):
+            lines.append('.implements %s' % interface)
+
+        classAnnotations, fieldsAnnotations, methodsAnnotations, parametersAnnotations = \
+            self.annotationsDirectory(annotations)
+        lines.extend(self.annotationsLines(self.annotationSet(classAnnotations)))
+
+        staticFields, instanceFields, directMethods, virtualMethods = self.classData(classdata)
+
+        # Static fields
+        initialValues = []
+        if staticvalues != 0:
+            (kind, initialValues), end = self.encodedArray(staticvalues)
+        setInStaticConstructor = self.fieldsSetInStaticConstructor(type, directMethods)
+        written = set()
+        for i, (field, fflags) in enumerate(staticFields):
+            initialValue = initialValues[i] if i < len(initialValues) else None
+            fclass, name, ftype = self.fieldId(field)
+            if (name, ftype) in written:
+                # Duplicate field, commented out
+                continue
+            written.add((name, ftype))
+
+            if initialValue is not None and (name, ftype) in setInStaticConstructor and \
+                    fflags & ACC_STATIC and fflags & ACC_FINAL and isDefaultValue(initialValue):
+                initialValue = None
+            lines.extend(self.fieldLines(field, fflags, initialValue, fieldsAnnotations))
+
+        written = set()
+        for field, fflags in instanceFields:
+            fclass, name, ftype = self.fieldId(field)
+            if (name, ftype) in written:
+                continue
+            written.add((name, ftype))
+            lines.extend(self.fieldLines(field, fflags, None, fieldsAnnotations))
+
+        # Methods
+        written = set()
+        for methods in (directMethods, virtualMethods):
+            for method, mflags, code in methods:
+                mclass, name, params, ret = self.methodId(method)
+                if (name, params, ret) in written:
+                    continue
+                written.add((name, params, ret))
+                lines.extend(self.methodLines(method, mflags, code, methodsAnnotations.get(method, 0),
+                                              parametersAnnotations.get(method, 0)))
+
+        return lines
+
+    def fieldLines(self, field, flags, initialValue, fieldsAnnotations):
+        fclass, name, ftype = self.fieldId(field)
+        lines = ['.field %s%s:%s' % (self.accessFlags(flags, FIELD), name, ftype)]
+        if initialValue is not None:
+            vlines = self.encodedValueLines(initialValue)
+            lines[0] += ' = ' + vlines[0]
+            lines.extend(vlines[1:])
+
+        annotations = self.annotationSet(fieldsAnnotations.get(field, 0))
+        if len(annotations) == 0:
+            return lines
+
+        return lines + ['    ' + l for l in self.annotationsLines(annotations)] + ['.end field']
+
+    def fieldsSetInStaticConstructor(self, type, directMethods):
+        fields = set()
+
+        for method, flags, code in directMethods:
+            if code != 0 and self.methodId(method)[1] == '<clinit>':
+                for addr, op, a, literal, ref in self.instructions(code):
+                    if 0x67 <= op <= 0x6d:
+                        fclass, name, ftype = self.fieldId(ref)
+                        if fclass == type:
+                            fields.add((name, ftype))
+
+        return fields
+
+    # Methods
+    def codeItem(self, offset):
+        """
+        :return: (registers, debug info offset, instructions code units, tries offset, tries size)
+        """
+        registers, ins, outs, triesSize, debug, size = struct.unpack_from('<4H2I', self.data, offset)
+        insns = array('H', self.data[offset + 16:offset + 16 + 2 * size])
+        if sys.byteorder != 'little':
+            insns.byteswap()
+
+        tries = offset + 16 + 2 * size
+        if size % 2 == 1 and triesSize > 0:
+            tries += 2
+
+        return registers, debug, insns, tries, triesSize
+
+    def instructions(self, code):
+        """
+        Minimal decoding of the instructions of a method
+        :return: list of (address, opcode, first register, literal, reference index) of the instructions
+                 (payloads excluded)
+        """
+        registers, debug, insns, tries, triesSize = self.codeItem(code)
+        result = []
+        addr, size = 0, len(insns)
+
+        while addr < size:
+            unit = insns[addr]
+            op = unit & 0xff
+
+            if op == 0 and unit in (PACKED_SWITCH_PAYLOAD, SPARSE_SWITCH_PAYLOAD, ARRAY_PAYLOAD):
+                addr += self.payloadSize(insns, addr)
+                continue
+
+            opcode = OPCODES[op]
+            if opcode is None:
+                raise ValueError('Unsupported opcode 0x%02x' % op)
+
+            name, fmt, ref = opcode
+            hi = unit >> 8
+            a, literal, idx = hi, None, None
+
+            if fmt in ('12x', '22t', '22s', '22c', '11n'):
+                a = hi & 0xf
+            if fmt == '11n':
+                literal = signed(hi >> 4, 4)
+            elif fmt == '22b':
+                literal = signed(insns[addr + 1] >> 8, 8)
+            elif fmt == '21s' or fmt == '22s':
+                literal = signed(insns[addr + 1], 16)
+            elif fmt == '21ih':
+                literal = signed(insns[addr + 1], 16) << 16
+            elif fmt == '21lh':
+                literal = signed(insns[addr + 1], 16) << 48
+            elif fmt == '31i':
+                literal = signed(insns[addr + 1] | (insns[addr + 2] << 16), 32)
+            elif fmt == '51l':
+                literal = signed(insns[addr + 1] | (insns[addr + 2] << 16) | (insns[addr + 3] << 32) |
+                                 (insns[addr + 4] << 48), 64)
+
+            if ref is not None:
+                idx = insns[addr + 1] if fmt != '31c' else insns[addr + 1] | (insns[addr + 2] << 16)
+
+            result.append((addr, op, a, literal, idx))
+            addr += FORMAT_SIZES[fmt]
+
+        return result
+
+    @staticmethod
+    def payloadSize(insns, addr):
+        unit = insns[addr]
+        if unit == PACKED_SWITCH_PAYLOAD:
+            return 4 + insns[addr + 1] * 2
+        if unit == SPARSE_SWITCH_PAYLOAD:
+            return 2 + insns[addr + 1] * 4
+        width = insns[addr + 1]
+        count = insns[addr + 2] | (insns[addr + 3] << 16)
+        return 4 + (width * count + 1) // 2
+
+    def methodLines(self, method, flags, code, annotations, parametersAnnotations):
+        mclass, name, params, ret = self.methodId(method)
+        lines = ['.method %s%s(%s)%s' % (self.accessFlags(flags, METHOD), name, ''.join(params), ret)]
+
+        parametersAnnotations = self.parametersAnnotations(parametersAnnotations)
+        names = []
+
+        if code != 0:
+            registers, debug, insns, tries, triesSize = self.codeItem(code)
+            lines.append('    .registers %d' % registers)
+            if debug != 0:
+                names = self.parametersNames(debug, len(params))
+
+        # Parameters, named (from the debug information) or annotated
+        register = 0 if flags & ACC_STATIC else 1
+        for i, ptype in enumerate(params):
+            pname = names[i] if i < len(names) else None
+            pannotations = parametersAnnotations[i] if i < len(parametersAnnotations) else []
+
+            if pname is not None or len(pannotations) > 0:
+                if pname is not None:
+                    lines.append('    .param p%d, "%s"    # %s' % (register, escapeString(pname), ptype))
+                else:
+                    lines.append('    .param p%d    # %s' % (register, ptype))
+
+                if len(pannotations) > 0:
+                    lines.extend('        ' + l for l in self.annotationsLines(pannotations))
+                    lines.append('    .end param')
+
+            register += 2 if ptype in ('J', 'D') else 1
+
+        lines.extend('    ' + l for l in self.annotationsLines(self.annotationSet(annotations)))
+
+        if code != 0:
+            lines.extend(self.codeLines(mclass, flags, params, code, names, parametersAnnotations))
+
+        lines.append('.end method')
+        return lines
+
+    def parametersNames(self, debug, count):
+        """
+        :return: the names of the parameters (None for unnamed ones) in the debug information
+        """
+        line, offset = self.uleb128(debug)
+        size, offset = self.uleb128(offset)
+        names = []
+        for i in range(size):
+            idx, offset = self.uleb128(offset)
+            names.append(self.optionalString(idx - 1))
+
+        return names
+
+    def codeLines(self, type, flags, params, code, names, parametersAnnotations):
+        """
+        Lines of the code of a method: instructions, labels, tries and debug information, sorted as baksmali does
+        (by address, then by kind of item)
+        """
+        registers, debug, insns, tries, triesSize = self.codeItem(code)
+
+        parameterRegisters = (0 if flags & ACC_STATIC else 1) + sum(2 if p in ('J', 'D') else 1 for p in params)
+        firstParameter = registers - parameterRegisters
+
+        def reg(r):
+            return 'p%d' % (r - firstParameter) if r >= firstParameter else 'v%d' % r
+
+        # (address, sort order, label prefix, text)
+        items = []
+        labels = set()
+        addresses = []
+        payloads = []
+        packedSwitches, sparseSwitches = {}, {}
+
+        # Instructions
+        addr, size = 0, len(insns)
+        while addr < size:
+            addresses.append(addr)
+            unit = insns[addr]
+            op = unit & 0xff
+
+            if op == 0 and unit in (PACKED_SWITCH_PAYLOAD, SPARSE_SWITCH_PAYLOAD, ARRAY_PAYLOAD):
+                payloads.append(addr)
+                addr += self.payloadSize(insns, addr)
+                continue
+
+            opcode = OPCODES[op]
+            if opcode is None:
+                raise ValueError('Unsupported opcode 0x%02x in %s' % (op, type))
+
+            name, fmt, ref = opcode
+            hi = unit >> 8
+
+            if fmt == '10x':
+                text = name
+            elif fmt == '12x':
+                text = '%s %s, %s' % (name, reg(hi & 0xf), reg(hi >> 4))
+            elif fmt == '11x':
+                text = '%s %s' % (name, reg(hi))
+            elif fmt == '11n':
+                text = '%s %s, %s' % (name, reg(hi & 0xf), hexLiteral(signed(hi >> 4, 4)))
+            elif fmt == '21c':
+                text = '%s %s, %s' % (name, reg(hi), self.reference(ref, insns[addr + 1]))
+            elif fmt == '22c':
+                text = '%s %s, %s, %s' % (name, reg(hi & 0xf), reg(hi >> 4), self.reference(ref, insns[addr + 1]))
+            elif fmt == '35c' or fmt == '45cc':
+                unit2 = insns[addr + 2]
+                regs = (unit2 & 0xf, (unit2 >> 4) & 0xf, (unit2 >> 8) & 0xf, unit2 >> 12, hi & 0xf)[:hi >> 4]
+                text = '%s {%s}, %s' % (name, ', '.join(map(reg, regs)), self.reference(ref, insns[addr + 1]))
+                if fmt == '45cc':
+                    text += ', ' + self.protoReference(insns[addr + 3])
+            elif fmt == '3rc' or fmt == '4rcc':
+                first = insns[addr + 2]
+                if hi == 0:
+                    regs = '{}'
+                elif first >= firstParameter:
+                    regs = '{p%d .. p%d}' % (first - firstParameter, first + hi - 1 - firstParameter)
+                else:
+                    regs = '{v%d .. v%d}' % (first, first + hi - 1)
+                text = '%s %s, %s' % (name, regs, self.reference(ref, insns[addr + 1]))
+                if fmt == '4rcc':
+                    text += ', ' + self.protoReference(insns[addr + 3])
+            elif fmt == '23x':
+                unit2 = insns[addr + 1]
+                text = '%s %s, %s, %s' % (name, reg(hi), reg(unit2 & 0xff), reg(unit2 >> 8))
+            elif fmt == '22b':
+                unit2 = insns[addr + 1]
+                text = '%s %s, %s, %s' % (name, reg(hi), reg(unit2 & 0xff), hexLiteral(signed(unit2 >> 8, 8)))
+            elif fmt == '22s':
+                text = '%s %s, %s, %s' % (name, reg(hi & 0xf), reg(hi >> 4), hexLiteral(signed(insns[addr + 1], 16)))
+            elif fmt == '22x':
+                text = '%s %s, %s' % (name, reg(hi), reg(insns[addr + 1]))
+            elif fmt == '32x':
+                text = '%s %s, %s' % (name, reg(insns[addr + 1]), reg(insns[addr + 2]))
+            elif fmt in ('10t', '20t', '30t'):
+                offset = signed(hi, 8) if fmt == '10t' else signed(insns[addr + 1], 16) if fmt == '20t' else \
+                    signed(insns[addr + 1] | (insns[addr + 2] << 16), 32)
+                labels.add(('goto_', addr + offset))
+                text = '%s :goto_%x' % (name, addr + offset)
+            elif fmt == '21t':
+                offset = signed(insns[addr + 1], 16)
+                labels.add(('cond_', addr + offset))
+                text = '%s %s, :cond_%x' % (name, reg(hi), addr + offset)
+            elif fmt == '22t':
+                offset = signed(insns[addr + 1], 16)
+                labels.add(('cond_', addr + offset))
+                text = '%s %s, %s, :cond_%x' % (name, reg(hi & 0xf), reg(hi >> 4), addr + offset)
+            elif fmt == '31t':
+                offset = signed(insns[addr + 1] | (insns[addr + 2] << 16), 32)
+                prefix = 'array_' if op == OP_FILL_ARRAY_DATA else 'pswitch_data_' if op == OP_PACKED_SWITCH else \
+                    'sswitch_data_'
+                labels.add((prefix, addr + offset))
+                text = '%s %s, :%s%x' % (name, reg(hi), prefix, addr + offset)
+                if op == OP_PACKED_SWITCH:
+                    packedSwitches[addr + offset] = addr
+                elif op == OP_SPARSE_SWITCH:
+                    sparseSwitches[addr + offset] = addr
+            elif fmt == '31c':
+                text = '%s %s, %s' % (name, reg(hi), self.reference(ref, insns[addr + 1] | (insns[addr + 2] << 16)))
+            else:
+                # Literals
+                if fmt == '21s':
+                    literal = signed(insns[addr + 1], 16)
+                elif fmt == '21ih':
+                    literal = signed(insns[addr + 1], 16) << 16
+                elif fmt == '21lh':
+                    literal = signed(insns[addr + 1], 16) << 48
+                elif fmt == '31i':
+                    literal = signed(insns[addr + 1] | (insns[addr + 2] << 16), 32)
+                else:
+                    literal = signed(insns[addr + 1] | (insns[addr + 2] << 16) | (insns[addr + 3] << 32) |
+                                     (insns[addr + 4] << 48), 64)
+
+                text = '%s %s, %s' % (name, reg(hi), hexLiteral(literal))
+                if fmt == '21lh' or fmt == '51l' or op in (0x16, 0x17):
+                    text += doubleComment(literal)
+                else:
+                    text += floatComment(literal)
+
+            if (op == 0x71 or op == 0x77) and self.string(self.u32(self.methodsOffset + 8 * insns[addr + 1] + 4)) \
+                    .startswith('access$'):
+                accessor = self.accessedMember(insns[addr + 1])
+                if accessor is not None:
+                    items.append((addr, 99.8, '', '# ' + accessor))
+
+            items.append((addr, 100, '', text))
+            addr += FORMAT_SIZES[fmt]
+
+        # Payloads, now that the switches using them are known
+        for addr in payloads:
+            items.append((addr, 100, '', '\n'.join(self.payloadLines(insns, addr, addresses, packedSwitches,
+                                                                     sparseSwitches, labels))))
+
+        # Tries
+        if triesSize > 0:
+            handlers = tries + 8 * triesSize
+            for i in range(triesSize):
+                start, count, handler = struct.unpack_from('<IHH', self.data, tries + 8 * i)
+                end = start + count
+                lastCovered = addresses[bisect_right(addresses, end - 1) - 1]
+
+                labels.add(('try_start_', start))
+                labels.add(('try_end_', end))
+
+                hsize, offset = self.sleb128(handlers + handler)
+                catches = []
+                for j in range(abs(hsize)):
+                    htype, offset = self.uleb128(offset)
+                    haddr, offset = self.uleb128(offset)
+                    catches.append((self.type(htype), haddr))
+                if hsize <= 0:
+                    haddr, offset = self.uleb128(offset)
+                    catches.append((None, haddr))
+
+                for htype, haddr in catches:
+                    if htype is None:
+                        labels.add(('catchall_', haddr))
+                        text = '.catchall {:try_start_%x .. :try_end_%x} :catchall_%x' % (start, end, haddr)
+                    else:
+                        labels.add(('catch_', haddr))
+                        text = '.catch %s {:try_start_%x .. :try_end_%x} :catch_%x' % (htype, start, end, haddr)
+                    items.append((lastCovered, 102, '', text))
+
+                # The end label is written after the last covered instruction
+                items.append((lastCovered, 101, 'try_end_', ':try_end_%x' % end))
+                labels.discard(('try_end_', end))
+
+        # Debug information
+        if debug != 0:
+            items.extend(self.debugItems(debug, registers, type, flags, params, names, parametersAnnotations, reg))
+
+        for prefix, addr in labels:
+            items.append((addr, 0, prefix, ':%s%x' % (prefix, addr)))
+
+        items.sort(key=lambda item: item[:3])
+
+        lines = []
+        seen = set()
+        for addr, order, prefix, text in items:
+            if order == 101:
+                # Same end of try for several tries
+                if text in seen:
+                    continue
+                seen.add(text)
+            for line in text.split('\n'):
+                lines.append('    ' + line)
+
+        return lines
+
+    def payloadLines(self, insns, addr, addresses, packedSwitches, sparseSwitches, labels):
+        unit = insns[addr]
+
+        if unit == PACKED_SWITCH_PAYLOAD:
+            size = insns[addr + 1]
+            first = signed(insns[addr + 2] | (insns[addr + 3] << 16), 32) if size > 0 else 0
+            base = self.switchBase(packedSwitches, addr, addresses, insns)
+            lines = ['.packed-switch %s' % ('-0x%x' % -first if first < 0 else '0x%x' % first)]
+            for i in range(size):
+                target = base + signed(insns[addr + 4 + 2 * i] | (insns[addr + 5 + 2 * i] << 16), 32)
+                labels.add(('pswitch_', target))
+                lines.append('    :pswitch_%x' % target)
+            lines.append('.end packed-switch')
+            return lines
+
+        if unit == SPARSE_SWITCH_PAYLOAD:
+            size = insns[addr + 1]
+            base = self.switchBase(sparseSwitches, addr, addresses, insns)
+            lines = ['.sparse-switch']
+            for i in range(size):
+                key = signed(insns[addr + 2 + 2 * i] | (insns[addr + 3 + 2 * i] << 16), 32)
+                target = base + signed(insns[addr + 2 + 2 * size + 2 * i] |
+                                       (insns[addr + 3 + 2 * size + 2 * i] << 16), 32)
+                labels.add(('sswitch_', target))
+                lines.append('    %s -> :sswitch_%x' % ('-0x%x' % -key if key < 0 else '0x%x' % key, target))
+            lines.append('.end sparse-switch')
+            return lines
+
+        width = insns[addr + 1]
+        count = insns[addr + 2] | (insns[addr + 3] << 16)
+        data = insns[addr + 4:addr + 4 + (width * count + 1) // 2].tobytes()
+        if sys.byteorder != 'little':
+            data = array('H', data)
+            data.byteswap()
+            data = data.tobytes()
+
+        suffix = {1: 't', 2: 's'}.get(width, '')
+        lines = ['.array-data %d' % width]
+        for i in range(count):
+            value = int.from_bytes(data[i * width:(i + 1) * width], 'little', signed=True)
+            text = '    ' + hexLiteral(value) + suffix
+            if width == 8:
+                text += doubleComment(value)
+            elif width == 4:
+                text += floatComment(value)
+            lines.append(text)
+        lines.append('.end array-data')
+        return lines
+
+    @staticmethod
+    def switchBase(switches, addr, addresses, insns):
+        """
+        Address of the switch instruction using a payload (which may be referenced through its padding nop)
+        """
+        if addr in switches:
+            return switches[addr]
+
+        i = bisect_right(addresses, addr) - 1
+        if i > 0 and insns[addresses[i - 1]] == 0 and addresses[i - 1] in switches:
+            return switches[addresses[i - 1]]
+
+        return addr
+
+    def debugItems(self, debug, registers, type, flags, params, names, parametersAnnotations, reg):
+        """
+        Items of the debug information (dexlib2 DebugInfo and baksmali DebugMethodItem)
+        """
+        line, offset = self.uleb128(debug)
+        size, offset = self.uleb128(offset)
+        for i in range(size):
+            idx, offset = self.uleb128(offset)
+
+        # Locals of the parameters, so that their end or restart can be described
+        locals = [None] * registers
+        parameters = []
+        if not flags & ACC_STATIC:
+            parameters.append(('this', type, None))
+        for i, ptype in enumerate(params):
+            signature = None
+            if i < len(parametersAnnotations):
+                signature = self.signature(parametersAnnotations[i])
+            parameters.append((names[i] if i < len(names) else None, ptype, signature))
+
+        count = len(parameters)
+        locals[:min(count, registers)] = parameters[:registers]
+        if count < registers:
+            index = registers - 1
+            count -= 1
+            while count > -1:
+                local = locals[count]
+                if local is not None and local[1] in ('J', 'D'):
+                    index -= 1
+                    if index == count:
+                        break
+                locals[index] = local
+                locals[count] = None
+                index -= 1
+                count -= 1
+
+        def describe(local):
+            name, ltype, signature = local
+            text = '"%s"' % escapeString(name) if name is not None else 'null'
+            text += ':%s' % (ltype if ltype is not None else 'V')
+            if signature is not None:
+                text += ', "%s"' % escapeString(signature)
+            return text
+
+        items = []
+        data = self.data
+        addr = 0
+        while True:
+            op = data[offset]
+            offset += 1
+
+            if op == 0x00:
+                break
+            elif op == 0x01:
+                diff, offset = self.uleb128(offset)
+                addr += diff
+            elif op == 0x02:
+                diff, offset = self.sleb128(offset)
+                line += diff
+            elif op == 0x03 or op == 0x04:
+                register, offset = self.uleb128(offset)
+                name, offset = self.uleb128(offset)
+                ltype, offset = self.uleb128(offset)
+                signature = 0
+                if op == 0x04:
+                    signature, offset = self.uleb128(offset)
+                local = (self.optionalString(name - 1), self.optionalType(ltype - 1),
+                         self.optionalString(signature - 1))
+                if 0 <= register < registers:
+                    locals[register] = ('start',) + local
+                text = '.local %s' % reg(register)
+                if local != (None, None, None):
+                    text += ', ' + describe(local)
+                items.append((addr, -1, '', text))
+            elif op == 0x05:
+                register, offset = self.uleb128(offset)
+                local = locals[register] if 0 <= register < registers else None
+                replace = 0 <= register < registers
+                if local is not None and local[0] == 'end':
+                    local = None
+                    replace = False
+                info = local[1:] if local is not None and len(local) == 4 else local
+                if replace:
+                    locals[register] = ('end',) + (info if info is not None else (None, None, None))
+                text = '.end local %s' % reg(register)
+                if info is not None and info != (None, None, None):
+                    text += '    # ' + describe(info)
+                items.append((addr, -1, '', text))
+            elif op == 0x06:
+                register, offset = self.uleb128(offset)
+                local = locals[register] if 0 <= register < registers else None
+                info = local[1:] if local is not None and len(local) == 4 else local
+                if 0 <= register < registers:
+                    locals[register] = ('restart',) + (info if info is not None else (None, None, None))
+                text = '.restart local %s' % reg(register)
+                if info is not None and info != (None, None, None):
+                    text += '    # ' + describe(info)
+                items.append((addr, -1, '', text))
+            elif op == 0x07:
+                items.append((addr, -4, '', '.prologue'))
+            elif op == 0x08:
+                items.append((addr, -4, '', '.epilogue'))
+            elif op == 0x09:
+                name, offset = self.uleb128(offset)
+                name = self.optionalString(name - 1)
+                items.append((addr, -3, '', '.source' if name is None else '.source "%s"' % escapeString(name)))
+            else:
+                adjusted = op - 0x0a
+                addr += adjusted // 15
+                line = signed((line + adjusted % 15 - 4) & 0xffffffff, 32)
+                items.append((addr, -2, '', '.line %d' % line))
+
+        return items
+
+    def signature(self, annotations):
+        for visibility, type, elements in annotations:
+            if type == 'Ldalvik/annotation/Signature;':
+                for name, (kind, value) in elements:
+                    if name == 'value' and kind == 0x1c:
+                        return ''.join(self.string(v) for k, v in value if k == 0x17)
+
+        return None
+
+    # Synthetic accessors
+    def accessedMember(self, method):
+        """
+        Comment of an invocation of a synthetic accessor method (dexlib2 SyntheticAccessorResolver)
+        :return: the comment, None if the method is not a synthetic accessor defined in this file
+        """
+        mclass, name, params, ret = self.methodId(method)
+        key = (mclass, name, params, ret)
+
+        if key in self.accessors:
+            return self.accessors[key]
+
+        if self.classesByType is None:
+            self.classesByType = {}
+            for i in range(self.classesSize):
+                self.classesByType.setdefault(self.className(i), i)
+
+        comment = None
+        idx = self.classesByType.get(mclass)
+        if idx is not None:
+            for methods in self.classData(self.classDef(idx)[6])[2:]:
+                found = None
+                for m, flags, code in methods:
+                    if code != 0 and self.methodId(m)[1:] == (name, params, ret):
+                        found = (flags, code)
+                        break
+                if found is not None:
+                    break
+
+            if found is not None and found[0] & ACC_SYNTHETIC:
+                instructions = self.instructions(found[1])
+                access = accessorType(instructions)
+                if access >= 0:
+                    kind = FIELD_REF if OPCODES[instructions[0][1]][2] == FIELD_REF else METHOD_REF
+                    comment = ACCESSOR_COMMENTS[access] + self.reference(kind, instructions[0][4])
+
+        self.accessors[key] = comment
+        return comment
+
+
+def accessorType(instructions):
+    """
+    Kind of synthetic accessor of the instructions of a method (dexlib2 SyntheticAccessorFSM)
+    :param instructions: list of (address, opcode, first register, literal, reference index)
+    :return: one of the *_ACCESS, GETTER, SETTER... constants, -1 if this is not an accessor
+    """
+    ops = [i[1] for i in instructions]
+
+    def isGet(op):
+        return 0x52 <= op <= 0x58 or 0x60 <= op <= 0x66
+
+    def isPut(op):
+        return 0x59 <= op <= 0x5f or 0x67 <= op <= 0x6d
+
+    def isReturn(op):
+        return 0x0f <= op <= 0x11
+
+    def isConversion(op):
+        return 0x81 <= op <= 0x8f
+
+    if len(ops) < 2:
+        return -1
+
+    first = ops[0]
+    if isGet(first) and isReturn(ops[1]):
+        return GETTER
+    if isPut(first) and isReturn(ops[1]):
+        return SETTER
+    if 0x6e <= first <= 0x72 or 0x74 <= first <= 0x78:
+        if ops[1] == 0x0e or (len(ops) > 2 and 0x0a <= ops[1] <= 0x0c and isReturn(ops[2])):
+            return METHOD_ACCESS
+        return -1
+    if not isGet(first):
+        return -1
+
+    def tail(i):
+        # put return_something
+        if i + 1 < len(ops) and isPut(ops[i]) and isReturn(ops[i + 1]):
+            return instructions[i][2], instructions[i + 1][2]
+        return None
+
+    def incrementType(mathOp, type, constant, registers):
+        putRegister, returnRegister = registers
+        if type in (INT, LONG):
+            value = constant
+        elif type == FLOAT:
+            value = struct.unpack('<f', struct.pack('<i', signed(constant & 0xffffffff, 32)))[0]
+        else:
+            value = struct.unpack('<d', struct.pack('<q', constant))[0]
+
+        if value not in (1, -1):
+            return -1
+
+        isAdd = (mathOp == ADD) == (value == 1)
+        if putRegister == returnRegister:
+            return PREFIX_INCREMENT if isAdd else PREFIX_DECREMENT
+        return POSTFIX_INCREMENT if isAdd else POSTFIX_DECREMENT
+
+    # get add-int/lit* type_conversion? put return_something
+    if len(ops) > 2 and ops[1] in (0xd0, 0xd8):
+        for i in (2, 3):
+            if i == 3 and not isConversion(ops[2]):
+                break
+            registers = tail(i)
+            if registers is not None:
+                return incrementType(ADD, INT, instructions[1][3], registers)
+
+    # get const_literal (add | sub) put return_something
+    if len(ops) > 3 and 0x12 <= ops[1] <= 0x19 and MATH_OPS.get(ops[2]) in (ADD, SUB):
+        registers = tail(3)
+        if registers is not None:
+            return incrementType(MATH_OPS[ops[2]], mathType(ops[2]), instructions[1][3], registers)
+
+    # get type_conversion? math type_conversion{0,2} put return_something
+    i = 1
+    if i < len(ops) and isConversion(ops[i]):
+        i += 1
+    if i < len(ops) and ops[i] in MATH_OPS:
+        mathOp = MATH_OPS[ops[i]]
+        i += 1
+        for conversions in range(3):
+            if tail(i) is not None:
+                return mathOp
+            if i < len(ops) and isConversion(ops[i]):
+                i += 1
+            else:
+                break
+
+    return -1
+
+
+def isDefaultValue(value):
+    kind, v = value
+    return kind == 0x1e or (kind in (0x00, 0x02, 0x03, 0x04, 0x06, 0x10, 0x11, 0x1f) and not v)
@@ -2,7 +2,11 @@
 # Author: Vincenzo Musco (http://www.vmusco.com)
 # Creation date: 2017-09-15
 
-from smalanalysis.smali import ChangesTypes, SmaliObject
+import functools
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from smalanalysis.smali import ChangesTypes, SmaliObject, SmaliProject
 
 def isEvolution(l):
     atLeastOne = False
@@ -64,90 +68,369 @@ def initMetricsDict(key, ret):
 
 
 def computeMetrics(r, out, metricKey="", diffOpOnly=True, aggregateOps=False):
-    changedclass = set()
+    """
+    Add the metrics of r (a diff, or an iterable of records of SmaliProject.iterDifferences()) to out,
+    a dict initialized with initMetricsDict(metricKey, out)
+    """
+    metrics = ScopeMetrics()
+    metrics.add(r, diffOpOnly, aggregateOps)
+    metrics.addToDict(out, metricKey)
+
+
+def classMetrics(pair, diff, diffOpOnly=True, aggregateOps=False):
+    """
+    Metrics of the differences of a pair of matched classes, to be added in the order of the classes
+    (see ScopeMetrics.addClass). Summarizes the differences for SmaliProject.iterDifferences.
+    """
+    metrics = ScopeMetrics()
+    metrics.addRecord([pair, diff], diffOpOnly, aggregateOps)
+    return metrics
+
+
+def changedOps(lines, diffOpOnly, aggregateOps):
+    if diffOpOnly:
+        lines = map(lambda x: x.split(' ')[0], lines)
+
+    if aggregateOps:
+        lines = map(lambda x: x.split('/')[0].split('-')[0], lines)
+
+    return lines
+
+
+class ScopeMetrics(object):
+    """
+    Metrics of a scope (outer classes, inner classes or all classes): one counter for each of keys, and the
+    added and removed lines (or operators) of changed methods, counted as multisets.
+    Metrics of parts of a diff can be merged into the metrics of the whole diff.
+    """
+    __slots__ = ('counters', 'addedLines', 'removedLines', 'changedClasses', 'changedRecords')
+
+    def __init__(self):
+        self.counters = dict.fromkeys(keys, 0)
+        self.addedLines = Counter()
+        self.removedLines = Counter()
+        # Changed class name -> index of the first changed record of this class
+        self.changedClasses = {}
+        self.changedRecords = 0
+
+    def __getitem__(self, key):
+        return self.counters[key]
+
+    def __setitem__(self, key, value):
+        if key not in self.counters:
+            raise KeyError(key)
+
+        self.counters[key] = value
+
+    def merge(self, other):
+        """
+        Add the metrics of the records which come after the ones of self (see add()).
+        CC adds up the number of classes changed so far at each changed record: each changed record of other also
+        counts the classes of self, but the ones it had already counted itself (a class may be changed by several
+        records, e.g. when it is found in several dex files).
+        """
+        cc = len(self.changedClasses) * other.changedRecords
+
+        for name, first in other.changedClasses.items():
+            if name in self.changedClasses:
+                # Counted by the records of other from the first one changing this class
+                cc -= other.changedRecords - first
+
+        for k, v in other.counters.items():
+            self.counters[k] += v
+
+        self.counters["CC"] += cc
+
+        for name, first in other.changedClasses.items():
+            self.changedClasses.setdefault(name, self.changedRecords + first)
+
+        self.changedRecords += other.changedRecords
+
+        self.addedLines.update(other.addedLines)
+        self.removedLines.update(other.removedLines)
+
+        return self
+
+    def addClass(self, metrics):
+        """
+        Add the metrics of the differences of one class (see classMetrics), as addRecord() adds its differences
+        """
+        for k, v in metrics.counters.items():
+            if k != "CC":
+                self.counters[k] += v
+
+        self.addedLines.update(metrics.addedLines)
+        self.removedLines.update(metrics.removedLines)
+
+        if metrics.changedRecords > 0:
+            for name in metrics.changedClasses:
+                self.changedClasses.setdefault(name, self.changedRecords)
+
+            self.changedRecords += 1
+            self.counters["CC"] += len(self.changedClasses)
+
+    def add(self, r, diffOpOnly=True, aggregateOps=False):
+        """
+        Add the metrics of a diff computed by SmaliProject.differences() (or of records of iterDifferences())
+        :param diffOpOnly: only keep the operators of the added and removed lines
+        :param aggregateOps: keep only the first keyword of the operators
+        """
+        for rr in r:
+            self.addRecord(rr, diffOpOnly, aggregateOps)
+
+    def addRecord(self, rr, diffOpOnly=True, aggregateOps=False):
+        """
+        Add the metrics of the differences of one class (see add())
+        """
+        counters = self.counters
+        changedclass = self.changedClasses
 
-    for rr in r:
         if rr[1] is None:
             # Class change level here...
             if rr[0][1] is None:
-                out["{}CD".format(metricKey)] += 1
-                out["{}#C-".format(metricKey)] += 1
-                continue
+                counters["CD"] += 1
+                counters["#C-"] += 1
+                return
             elif rr[0][0] is None:
-                out["{}CA".format(metricKey)] += 1
-                out["{}#C+".format(metricKey)] += 1
-                continue
+                counters["CA"] += 1
+                counters["#C+"] += 1
+                return
 
-        out["{}#C-".format(metricKey)] += 1
-        out["{}#C+".format(metricKey)] += 1
+        counters["#C-"] += 1
+        counters["#C+"] += 1
 
         if len(rr[1]) == 0:
-            continue
+            return
 
-        changedclass.add(rr[0][0].name)
+        changedclass.setdefault(rr[0][0].name, self.changedRecords)
+        self.changedRecords += 1
 
         l = rr[1]
 
         if isEvolution(l):
-            out["{}E".format(metricKey)] += 1
+            counters["E"] += 1
 
         if isMethodBodyChangeOnly(l):
-            out["{}B".format(metricKey)] += 1
+            counters["B"] += 1
 
         if isChange(l):
-            out["{}C".format(metricKey)] += 1
+            counters["C"] += 1
 
         atLeastOneMethodAdded, atLeastOneMethodDeleted = False, False
         for rrr in rr[1]:
             if rrr[0] is not None and rrr[0].isField() and rrr[1] is None:
-                out["{}FD".format(metricKey)] += 1
+                counters["FD"] += 1
             elif rrr[1] is not None and rrr[1].isField() and rrr[0] is None:
-                out["{}FA".format(metricKey)] += 1
+                counters["FA"] += 1
             elif rrr[0] is not None and rrr[1] is not None and rrr[0].isField():
                 if len(rrr) > 3 and len(rrr[3]) == 1 and rrr[3][0] == SmaliObject.NOT_SAME_NAME:
-                    out["{}FR".format(metricKey)] += 1
+                    counters["FR"] += 1
                 else:
-                    out["{}FC".format(metricKey)] += 1
+                    counters["FC"] += 1
             elif rrr[0] is not None and rrr[0].isMethod() and rrr[1] is None:
-                out["{}MD".format(metricKey)] += 1
+                counters["MD"] += 1
                 atLeastOneMethodDeleted = True
             elif rrr[1] is not None and rrr[1].isMethod() and rrr[0] is None:
-                out["{}MA".format(metricKey)] += 1
+                counters["MA"] += 1
                 atLeastOneMethodAdded = True
             elif rrr[0] is not None and rrr[1] is not None and rrr[0].isMethod():
                 if rrr[2] == ChangesTypes.RENAMED_METHOD:
-                    out["{}MR".format(metricKey)] += 1
+                    counters["MR"] += 1
                 else:
-                    out["{}MC".format(metricKey)] += 1
+                    counters["MC"] += 1
                     if not rrr[0].areSourceCodeSimilars(rrr[1]):
-                        out["{}MRev".format(metricKey)] += 1
+                        counters["MRev"] += 1
+
+                    oldlines, newlines = set(rrr[0].getCleanLines()), set(rrr[1].getCleanLines())
+                    self.addedLines.update(changedOps(newlines - oldlines, diffOpOnly, aggregateOps))
+                    self.removedLines.update(changedOps(oldlines - newlines, diffOpOnly, aggregateOps))
+
+        counters["CC"] += len(changedclass)
+        counters["A"] += 1 if atLeastOneMethodAdded else 0
+        counters["D"] += 1 if atLeastOneMethodDeleted else 0
+
+    def addToDict(self, out, key=""):
+        """
+        Add these metrics to a dict initialized with initMetricsDict(key, out)
+        """
+        for k, v in self.counters.items():
+            out["{}{}".format(key, k)] += v
+
+        out["{}addedLines".format(key)].update(self.addedLines)
+        out["{}removedLines".format(key)].update(self.removedLines)
+
+
+class MetricsAccumulator(object):
+    """
+    Metrics of several scopes (see ScopeMetrics), in the order of their creation
+    """
+
+    def __init__(self, scopes=("",)):
+        self.scopes = {}
+
+        for scope in scopes:
+            self.scopes[scope] = ScopeMetrics()
+
+    def __getitem__(self, scope):
+        return self.scopes[scope]
+
+    def __iter__(self):
+        return iter(self.scopes)
+
+    def merge(self, other):
+        """
+        Add the metrics of the records which come after the ones of self, scope by scope (see ScopeMetrics.merge)
+        """
+        for scope, metrics in other.scopes.items():
+            if scope not in self.scopes:
+                self.scopes[scope] = ScopeMetrics()
+
+            self.scopes[scope].merge(metrics)
+
+        return self
+
+    def toDict(self):
+        """
+        :return: the metrics in a dict as filled by initMetricsDict() and computeMetrics()
+        """
+        ret = {}
+
+        for scope, metrics in self.scopes.items():
+            initMetricsDict(scope, ret)
+            metrics.addToDict(ret, scope)
+
+        return ret
+
+
+def projectsMetrics(old, new, split=True, diffOpOnly=True, aggregateOps=False, workers=None, countsOnly=False):
+    """
+    Metrics of the evolution from old to new, as computed by sa-metrics
+    :param split: compute the metrics of inner classes (IN) and outer classes (OUT) separately
+    :param workers: number of processes diffing the projects
+    :param countsOnly: the projects are only used for these metrics: the differences of each class are counted
+                       where they are computed (by the worker processes, if any) and dropped right away, only their
+                       metrics are kept (see classMetrics). The views and indexes built to diff a class are released
+                       once it is counted (see SmaliClass.forgetCaches).
+    :return: a MetricsAccumulator
+    """
+    mold, moldin = countMethodsInProject(old)
+    mnew, mnewin = countMethodsInProject(new)
+
+    if not split:
+        metrics = MetricsAccumulator([""])
+        metrics[""]["#M-"] = mold + moldin
+        metrics[""]["#M+"] = mnew + mnewin
+
+    else:
+        metrics = MetricsAccumulator(["OUT", "IN"])
+        metrics["IN"]["#M-"] = moldin
+        metrics["IN"]["#M+"] = mnewin
+        metrics["OUT"]["#M-"] = mold
+        metrics["OUT"]["#M+"] = mnew
+
+    summarize = None
+    if countsOnly:
+        summarize = functools.partial(classMetrics, diffOpOnly=diffOpOnly, aggregateOps=aggregateOps)
+
+    # Differences are consumed as they are computed, and never held all together
+    for d in old.iterDifferences(new, [], workers=workers, summarize=summarize):
+        if not split:
+            scope = metrics[""]
+        else:
+            scope = metrics["IN" if isInnerChanged(d) else "OUT"]
+
+        if summarize is not None and d[1] is not None:
+            scope.addClass(d[1])
+        else:
+            scope.addRecord(d, diffOpOnly, aggregateOps)
+
+        if countsOnly:
+            for clazz in d[0]:
+                if clazz is not None:
+                    clazz.forgetCaches()
+
+    return metrics
+
+
+def parseVersion(path, *args, **kwargs):
+    """
+    Parse a version of an app (arguments are the ones of SmaliProject.parseProject)
+    :raise ProjectObfuscatedException: if the app is obfuscated
+    """
+    project = SmaliProject.SmaliProject()
+    project.parseProject(path, *args, **kwargs)
+
+    if project.isProjectObfuscated():
+        raise ProjectObfuscatedException(path)
+
+    return project
+
+
+def versionsMetrics(versions, parse=parseVersion, *args, **kwargs):
+    """
+    Metrics of each evolution between two consecutive versions. Each version is parsed once and at most two
+    versions are loaded at a time. The lines of the discarded versions are dropped from the InstructionTable (see
+    compact()): the methods of projects parsed outside of this function must not be used afterwards.
+    :param versions: paths of the versions, in order
+    :param parse: function parsing a new project for a version (see parseVersion)
+    :param args: passed to projectsMetrics(), as well as kwargs
+    :return: generator of (old path, new path, MetricsAccumulator or None if one of the versions is obfuscated)
+    """
+    previous = None
+
+    for i, path in enumerate(versions):
+        try:
+            current = parse(path)
+        except ProjectObfuscatedException:
+            current = None
+
+        if i > 0:
+            if previous is None or current is None:
+                yield versions[i - 1], path, None
+            else:
+                yield versions[i - 1], path, projectsMetrics(previous, current, *args, **kwargs)
+
+        if previous is not None:
+            previous.close()
+
+        # Lines only used by the discarded versions are dropped, once in a while
+        SmaliObject.InstructionTable.compact([current] if current is not None else [])
+        previous = current
+
+    if previous is not None:
+        previous.close()
+
+
+def versionsMetricsList(versions, parse, *args, **kwargs):
+    return list(versionsMetrics(versions, parse, *args, **kwargs))
+
+
+def versionsMetricsInParallel(versions, parse, workers, *args, **kwargs):
+    """
+    versionsMetrics() with consecutive versions split in segments computed by several processes.
+    Only the versions at the boundaries of the segments are parsed twice.
+    :param parse: picklable function parsing a version (see parseVersion)
+    """
+    pairs = len(versions) - 1
+    size = max(1, -(-pairs // workers))
+    segments = [versions[i:i + size + 1] for i in range(0, pairs, size)]
 
-                    l = set(rrr[1].getCleanLines()) - set(rrr[0].getCleanLines())
-                    if diffOpOnly:
-                        l = list(map(lambda x: x.split(' ')[0], l))
-                    for cmd in l:
-                        if aggregateOps:
-                            cmd = cmd.split('/')[0].split('-')[0]
-                        out["{}addedLines".format(metricKey)].add(cmd)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for results in executor.map(functools.partial(versionsMetricsList, **kwargs), segments,
+                                    [parse] * len(segments), *[[arg] * len(segments) for arg in args]):
+            for result in results:
+                yield result
 
-                    l = set(rrr[0].getCleanLines()) - set(rrr[1].getCleanLines())
-                    if diffOpOnly:
-                        l = list(map(lambda x: x.split(' ')[0], l))
-                    for cmd in l:
-                        if aggregateOps:
-                            cmd = cmd.split('/')[0].split('-')[0]
-                        out["{}removedLines".format(metricKey)].add(cmd)
 
-        out["{}CC".format(metricKey)] += len(changedclass)
-        out["{}A".format(metricKey)] += 1 if atLeastOneMethodAdded else 0
-        out["{}D".format(metricKey)] += 1 if atLeastOneMethodDeleted else 0
+def isInnerChanged(d):
+    return (d[0][0] is not None and "$" in d[0][0].name) or (d[0][1] is not None and "$" in d[0][1].name)
 
 
 def splitInnerOuterChanged(diff):
     innerDiff, outerDiff = [], []
 
     for d in diff:
-        if (d[0][0] is not None and "$" in d[0][0].name) or (d[0][1] is not None and "$" in d[0][1].name):
+        if isInnerChanged(d):
             innerDiff.append(d)
         else:
             outerDiff.append(d)
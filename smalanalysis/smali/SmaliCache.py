@@ -0,0 +1,147 @@
+# On-disk cache of parsed smali archives
+# Author: Vincenzo Musco (http://www.vmusco.com)
+# Creation date: 2026-10-18
+
+import gc
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+# To be increased each time the parsed objects change (attributes, parsing rules...)
+CACHE_FORMAT = 6
+
+
+@contextmanager
+def gcDisabled():
+    """
+    Unpickling creates a lot of objects, cyclic GC passes make it much slower
+    """
+    gcenabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        yield
+    finally:
+        if gcenabled:
+            gc.enable()
+
+
+def archiveDigest(path, blocksize=1 << 20):
+    h = hashlib.sha256()
+
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(blocksize), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def projectKey(path, package, skips, includes, include_unpackaged, lazy=False):
+    """
+    Key of a parsed archive: its content and the arguments filtering its classes.
+    Lazily parsed archives refer to their path, which is part of their key.
+    """
+    options = json.dumps([package,
+                          None if skips is None else sorted(skips),
+                          None if includes is None else sorted(includes),
+                          include_unpackaged] + ([os.path.abspath(path)] if lazy else []))
+
+    return hashlib.sha256('{}\n{}'.format(archiveDigest(path), options).encode('utf-8')).hexdigest()
+
+
+def cacheFile(cachedir, key):
+    return os.path.join(cachedir, '{}.pickle'.format(key))
+
+
+def load(cachedir, key):
+    """
+    Load an object stored with store()
+    :return: the object or None if not in cache. Stale or corrupted entries are dropped (and None is returned)
+    """
+    path = cacheFile(cachedir, key)
+
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with open(path, 'rb') as fp:
+            header = pickle.load(fp)
+            payload = fp.read()
+
+        if header != (CACHE_FORMAT, key, hashlib.sha256(payload).hexdigest()):
+            raise ValueError('Stale cache entry')
+
+        with gcDisabled():
+            return pickle.loads(payload)
+    except Exception:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+        return None
+
+
+def store(cachedir, key, obj):
+    os.makedirs(cachedir, exist_ok=True)
+    payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # Written in a temporary file first so that concurrent readers never see partial entries
+    fd, tmppath = tempfile.mkstemp(dir=cachedir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            pickle.dump((CACHE_FORMAT, key, hashlib.sha256(payload).hexdigest()), fp,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+            fp.write(payload)
+
+        os.replace(tmppath, cacheFile(cachedir, key))
+    except BaseException:
+        os.remove(tmppath)
+        raise
+
+
+class EntriesCache(object):
+    """
+    Persistent cache of parsed archive entries, keyed by their name, CRC and size in the archive,
+    so that entries unchanged between two versions of an app are not parsed again
+    """
+    def __init__(self, cachedir):
+        os.makedirs(cachedir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cachedir, 'entries.sqlite'), timeout=60)
+        self.db.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, data BLOB)')
+
+    @staticmethod
+    def entryKey(zinfo, op):
+        return '{}:{}:{:08x}:{}:{}'.format(CACHE_FORMAT, op, zinfo.CRC, zinfo.file_size, zinfo.filename)
+
+    def get(self, key):
+        """
+        :return: the parsed entry or None if not in cache (or not readable anymore)
+        """
+        row = self.db.execute('SELECT data FROM entries WHERE key = ?', (key,)).fetchone()
+
+        if row is None:
+            return None
+
+        try:
+            return pickle.loads(row[0])
+        except Exception:
+            return None
+
+    @staticmethod
+    def serialize(parsed):
+        return pickle.dumps(parsed, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def put(self, entries):
+        """
+        :param entries: list of (key, serialized parsed entry)
+        """
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO entries (key, data) VALUES (?, ?)', entries)
+
+    def close(self):
+        self.db.close()
@@ -1,7 +1,10 @@
 # Smali Objects
 # Author: Vincenzo Musco (http://www.vmusco.com)
 # Date: 2017-09-15
+import hashlib
 import re
+import sys
+from array import array
 
 from smalanalysis.smali import ComparisonIgnores, ChangesTypes
 import smalanalysis.smali.SmaliProject
@@ -30,11 +33,164 @@ RREFERENCE_PATTERN = re.compile('^const [vp][0-9]{1,2}, (0x[0-9a-f]{5,})$')
 class_ref_pattern = re.compile('L(.*?);')
 method_access_pattern = re.compile('L(.*?)->(.*?)\\)')
 field_access_pattern = re.compile('L(.*?)->(.*?):')
+field_reference_pattern = re.compile('(L[^\\s;]+;)->([^\\s:(]+):(\\[*(?:L[^\\s;]+;|[ZBSCIJFDV]))')
 jumps_pattern = re.compile(':[a-zA-Z0-9_\\-]+')
 local_registers_pattern = re.compile('v[0-9]+')
 param_registers_pattern = re.compile('p[0-9]+')
 
 inner_anonymous_class_reference_matcher = re.compile("\$[0-9$]+;")
+mapping_key_pattern = re.compile("(\\[*?)L(.*?)(\\$(.*))?;")
+
+class SmaliLines(object):
+    """
+    Immutable normalized view of some smali lines, read as a sequence of strings.
+    Lines are stored as an array of InstructionTable ids: same ids, same lines.
+    """
+    __slots__ = ('ids', 'sha1')
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.sha1 = None
+
+    @property
+    def digest(self):
+        """
+        Digest of the lines content (unlike ids, the same in all processes)
+        """
+        if self.sha1 is None:
+            self.sha1 = hashlib.sha1('\n'.join(self).encode('utf-8', 'surrogatepass')).digest()
+
+        return self.sha1
+
+    def key(self):
+        """
+        :return: a hashable key of these lines, only valid in this process
+        """
+        return self.ids.tobytes()
+
+    def sameAs(self, other):
+        return self.ids == other.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return InstructionTable.toLines(self.ids[item])
+
+        return InstructionTable.texts[self.ids[item]]
+
+    def __iter__(self):
+        texts = InstructionTable.texts
+        return (texts[id] for id in self.ids)
+
+    def __repr__(self):
+        return 'SmaliLines(%r)' % (list(self),)
+
+
+class InstructionTable(object):
+    """
+    Process wide table of the distinct lines found in method bodies, which are stored as arrays of ids in this table.
+    The normalizations of a line (see SmaliWithLines views) are computed once for all its occurrences.
+    """
+    texts = []
+    ids = {}
+    # 1 for instructions, 0 for debug directives, labels and comments (see SmaliWithLines.keepThisLine)
+    kept = bytearray()
+    # name -> array: id -> id of the normalized line (-1 if not computed yet)
+    normalizations = {}
+    # Number of lines after the last compaction (see compact())
+    compacted = 0
+
+    @staticmethod
+    def idOf(line):
+        id = InstructionTable.ids.get(line)
+
+        if id is None:
+            id = len(InstructionTable.texts)
+            line = sys.intern(line)
+            InstructionTable.texts.append(line)
+            InstructionTable.ids[line] = id
+            InstructionTable.kept.append(1 if SmaliWithLines.keepThisLine(line) else 0)
+
+        return id
+
+    @staticmethod
+    def normalize(ids, name, func):
+        """
+        :param ids: array of lines ids
+        :param func: normalization of a line
+        :return: array of the normalized lines ids
+        """
+        cache = InstructionTable.normalizations.get(name)
+
+        if cache is None:
+            cache = InstructionTable.normalizations[name] = array('i')
+
+        ret = array('I')
+
+        for id in ids:
+            if id >= len(cache):
+                cache.extend([-1] * (len(InstructionTable.texts) - len(cache)))
+
+            normalized = cache[id]
+
+            if normalized < 0:
+                normalized = InstructionTable.idOf(func(InstructionTable.texts[id]))
+                cache[id] = normalized
+
+            ret.append(normalized)
+
+        return ret
+
+    @staticmethod
+    def toLines(ids):
+        texts = InstructionTable.texts
+        return [texts[id] for id in ids]
+
+    @staticmethod
+    def compact(projects, growth=2):
+        """
+        Drop the lines which are not used by projects anymore, once the table has more than growth times the lines
+        it had after the last compaction. Ids of the lines of other projects are not valid anymore: these projects
+        must have been discarded. Views are computed again when used afterwards.
+        :return: True if the table has been compacted
+        """
+        if len(InstructionTable.texts) <= growth * InstructionTable.compacted:
+            return False
+
+        oldtexts, oldkept = InstructionTable.texts, InstructionTable.kept
+        texts, ids, kept = [], {}, bytearray()
+        remap = array('i', [-1]) * len(oldtexts)
+
+        def translate(id):
+            new = remap[id]
+
+            if new < 0:
+                new = remap[id] = len(texts)
+                texts.append(oldtexts[id])
+                ids[oldtexts[id]] = new
+                kept.append(oldkept[id])
+
+            return new
+
+        for project in projects:
+            for clazz in project.iterAllClasses():
+                for obj in [clazz] + clazz.methods + clazz.fields:
+                    if isinstance(obj, SmaliWithLines):
+                        obj.remapLines(translate)
+
+                    for annotation in obj.annotations:
+                        annotation.remapLines(translate)
+
+        InstructionTable.texts = texts
+        InstructionTable.ids = ids
+        InstructionTable.kept = kept
+        InstructionTable.normalizations = {}
+        InstructionTable.compacted = len(texts)
+
+        return True
+
 
 def compareStringSets(m1, m2):
     return len(m1 ^ m2) == 0
@@ -105,6 +261,9 @@ def compareLists(l1, l2, ignores = None, mappings = None):
     if l1 is None and l2 is None:
         return missings
     elif l1 is not None and l2 is not None:
+        if all(type(it) == str for it in l1) and all(type(it) == str for it in l2):
+            return compareStringLists(l1, l2, mappings)
+
         for it1 in l1:
             found = False
 
@@ -127,6 +286,39 @@ def compareLists(l1, l2, ignores = None, mappings = None):
 
     return missings
 
+def compareStringLists(l1, l2, mappings=None):
+    """
+    compareLists() for strings: instead of trying every pair, what each string of l1 may be equal to through
+    compareWithMapping() is computed once and looked up in sets
+    """
+    if len(l2) == 0:
+        return list(l1)
+
+    l2set = set(l2)
+    l2anonymized = None
+    missings = []
+
+    for it1 in l1:
+        if it1 in l2set:
+            continue
+
+        if mappings is not None:
+            key = mappingKey(it1)
+
+            if key in mappings:
+                if mappings[key] in l2set:
+                    continue
+
+                if l2anonymized is None:
+                    l2anonymized = set(map(lambda x: inner_anonymous_class_reference_matcher.sub("$?;", x), l2))
+
+                if applyMapping(it1, mappings) in l2anonymized:
+                    continue
+
+        missings.append(it1)
+
+    return missings
+
 def compareListsBoolean(l1, l2, mappings=None):
     return len(compareLists(l1, l2, mappings)) == 0
 
@@ -145,12 +337,139 @@ def compareListsBoolean(l1, l2, mappings=None):
 
 
 
+class Modifiers(object):
+    """
+    Set of modifiers stored as bit flags, which behaves as the set of their names
+    """
+    __slots__ = ('bits',)
+
+    # Bit of each modifier, the unusual ones are registered as they are met
+    names = ['public', 'private', 'protected', 'static', 'final', 'synchronized', 'volatile', 'bridge', 'transient',
+             'varargs', 'native', 'interface', 'abstract', 'strictfp', 'synthetic', 'annotation', 'enum',
+             'constructor', 'declared-synchronized']
+    flags = {name: 1 << bit for bit, name in enumerate(names)}
+
+    def __init__(self, names=()):
+        self.bits = 0
+
+        for name in names:
+            self.add(name)
+
+    @staticmethod
+    def flag(name):
+        flag = Modifiers.flags.get(name)
+
+        if flag is None:
+            flag = 1 << len(Modifiers.names)
+            Modifiers.names.append(name)
+            Modifiers.flags[name] = flag
+
+        return flag
+
+    @staticmethod
+    def fromBits(bits):
+        ret = Modifiers()
+        ret.bits = bits
+        return ret
+
+    @staticmethod
+    def bitsOf(other):
+        if isinstance(other, Modifiers):
+            return other.bits
+
+        return Modifiers(other).bits
+
+    def add(self, name):
+        self.bits |= Modifiers.flag(name)
+
+    def discard(self, name):
+        self.bits &= ~Modifiers.flags.get(name, 0)
+
+    def __contains__(self, name):
+        return self.bits & Modifiers.flags.get(name, 0) != 0
+
+    def __iter__(self):
+        bits, bit = self.bits, 0
+
+        while bits:
+            if bits & 1:
+                yield Modifiers.names[bit]
+            bits >>= 1
+            bit += 1
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+    def __xor__(self, other):
+        return Modifiers.fromBits(self.bits ^ Modifiers.bitsOf(other))
+
+    def __and__(self, other):
+        return Modifiers.fromBits(self.bits & Modifiers.bitsOf(other))
+
+    def __or__(self, other):
+        return Modifiers.fromBits(self.bits | Modifiers.bitsOf(other))
+
+    def __sub__(self, other):
+        return Modifiers.fromBits(self.bits & ~Modifiers.bitsOf(other))
+
+    def __eq__(self, other):
+        if isinstance(other, (Modifiers, set, frozenset)):
+            return self.bits == Modifiers.bitsOf(other)
+
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{%s}' % ', '.join(map(repr, self)) if self.bits else 'set()'
+
+    def __reduce__(self):
+        # Bits depend on the order modifiers were met in, names are pickled instead
+        return Modifiers, (tuple(self),)
+
+
 class SmaliAnnotableModifiable(object):
+    __slots__ = ('annotations', 'modifiers', 'parent')
+
+    # String attributes interned when unpickled (see __setstate__)
+    interned = ()
+
+    # Slots which are not pickled as they are (see __getstate__)
+    transient = ()
+
+    # Slots of each class, see __getstate__
+    classslots = {}
+
     def __init__(self, parent):
         self.annotations = []
-        self.modifiers = set()
+        self.modifiers = Modifiers()
         self.parent = parent
 
+    def __getstate__(self):
+        slots = SmaliAnnotableModifiable.classslots.get(type(self))
+
+        if slots is None:
+            slots = [name for cls in type(self).__mro__ for name in cls.__dict__.get('__slots__', ())
+                     if name not in type(self).transient]
+            SmaliAnnotableModifiable.classslots[type(self)] = slots
+
+        return {name: getattr(self, name) for name in slots if hasattr(self, name)}
+
+    def __setstate__(self, state):
+        # Each unpickled entry has its own copies of the strings, share them again
+        for name in type(self).interned:
+            value = state.get(name)
+
+            if type(value) == str:
+                state[name] = sys.intern(value)
+            elif type(value) == list:
+                state[name] = [sys.intern(v) for v in value]
+            elif type(value) == set:
+                state[name] = set(map(sys.intern, value))
+
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def getParentProjectIfAny(self):
         trg = self.parent
 
@@ -161,6 +480,7 @@ class SmaliAnnotableModifiable(object):
 
     def addAnnotation(self, a):
         self.annotations.append(a)
+        self.contentChanged()
 
     def addModifiersFromList(self, modifiers):
         if modifiers is None:
@@ -169,6 +489,17 @@ class SmaliAnnotableModifiable(object):
         for m in modifiers:
             self.modifiers.add(m.strip())
 
+        self.contentChanged()
+
+    def contentChanged(self):
+        # Members are part of their class digest (and field usages)
+        if isinstance(self.parent, SmaliClass):
+            self.parent.contentChanged()
+
+    @staticmethod
+    def computeDigest(content):
+        return hashlib.sha1(repr(content).encode('utf-8', 'surrogatepass')).digest()
+
     def isField(self):
         return False
 
@@ -208,20 +539,188 @@ class SmaliAnnotableModifiable(object):
 
 
 class SmaliWithLines(SmaliAnnotableModifiable):
+    """
+    Lines are encoded as ids in the InstructionTable: instructions in code, and the debug directives, labels and
+    comments (the lines dropped by the clean views) in debug, as (position in lines, id) pairs.
+    Lazily parsed bodies (see setBodyLocation) have neither code nor debug until they are first used.
+    """
+    __slots__ = ('name', 'code', 'debug', 'views', 'body')
+    interned = ('name',)
+    transient = ('code', 'debug', 'views')
+
     def __init__(self, name, modifiers, parent):
         SmaliAnnotableModifiable.__init__(self, parent)
-        self.name = name.strip()
-        self.lines = list()
+        self.name = sys.intern(name.strip())
+        self.code = array('I')
+        self.debug = array('I')
+        self.views = None
+        self.body = None
         self.addModifiersFromList(modifiers)
 
+    def __getattr__(self, name):
+        # Only called for unset attributes
+        if name in ('code', 'debug') and self.body is not None:
+            self.loadBody()
+            return getattr(self, name)
+
+        raise AttributeError(name)
+
+    def setBodyLocation(self, location):
+        """
+        Do not hold the lines, but read them from the archive when they are first used
+        :param location: (archive path, entry name, entry CRC, offset, length) of the lines in the decoded entry
+        """
+        self.body = location
+        self.views = None
+        del self.code, self.debug
+
+    def loadBody(self):
+        path, name, crc, offset, length = self.body
+        content = smalanalysis.smali.SmaliProject.SmaliProject.readArchiveEntry(path, name, crc)
+
+        self.code = array('I')
+        self.debug = array('I')
+        self.body = None
+
+        # Same filtering as SmaliProject.parseClassLines
+        for line in content[offset:offset + length].split('\n'):
+            if len(line) > 0 and line[0] != '#':
+                self.appendLine(line.strip())
+
     def getName(self):
         return self.name
 
     def addLine(self, line):
-        self.lines.append(line)
+        if self.views is not None:
+            # The clean view shares the code array
+            self.code = array('I', self.code)
+
+        self.appendLine(line)
+        self.views = None
+        self.contentChanged()
+
+    def appendLine(self, line):
+        id = InstructionTable.ids.get(line)
+
+        if id is None:
+            id = InstructionTable.idOf(line)
+
+        if InstructionTable.kept[id]:
+            self.code.append(id)
+        else:
+            self.debug.append(len(self.code) + len(self.debug) // 2)
+            self.debug.append(id)
+
+    @property
+    def lines(self):
+        """
+        The lines of the body, as a list built when first used and kept with the views until the body changes
+        (use addLine() to add some, or set them all, instead of changing the list)
+        """
+        if self.views is None:
+            self.views = {}
+
+        lines = self.views.get('lines')
+
+        if lines is None:
+            lines = self.views['lines'] = self.decodeLines()
+
+        return lines
+
+    def decodeLines(self):
+        """
+        :return: a new list of the lines of the body, built from their ids
+        """
+        texts = InstructionTable.texts
+        ret = []
+        code = iter(self.code)
+
+        for i in range(0, len(self.debug), 2):
+            while len(ret) < self.debug[i]:
+                ret.append(texts[next(code)])
+            ret.append(texts[self.debug[i + 1]])
+
+        ret.extend(texts[id] for id in code)
+
+        return ret
+
+    @lines.setter
+    def lines(self, lines):
+        self.code = array('I')
+        self.debug = array('I')
+        self.body = None
+        self.views = None
+
+        for line in lines:
+            self.appendLine(line)
+
+        self.contentChanged()
+
+    def __getstate__(self):
+        # Compact pickling: lines as a single string (ids are only valid in this process), views are recomputed.
+        # Bodies not loaded yet are pickled as their location.
+        state = SmaliAnnotableModifiable.__getstate__(self)
+
+        if self.body is None:
+            lines = self.decodeLines()
+            state['lines'] = (len(lines), '\n'.join(lines))
+        else:
+            state['lines'] = None
+
+        return state
+
+    def __setstate__(self, state):
+        lines = state.pop('lines')
+        SmaliAnnotableModifiable.__setstate__(self, state)
+        self.views = None
+
+        if lines is not None:
+            count, lines = lines
+            self.lines = lines.split('\n') if count > 0 else []
+
+    def getView(self, key, compute):
+        """
+        Normalized views of the lines are computed once and kept until a line is added
+        :param key: the view identifier
+        :param compute: function returning the InstructionTable ids of the view lines
+        :return: the view as a SmaliLines object
+        """
+        if self.views is None:
+            self.views = {}
+
+        view = self.views.get(key)
+
+        if view is None:
+            view = SmaliLines(compute())
+            self.views[key] = view
+
+        return view
+
+    def forgetViews(self):
+        # Views are computed again when used afterwards
+        self.views = None
+
+    def remapLines(self, translate):
+        """
+        Change the ids of the lines (see InstructionTable.compact)
+        :param translate: function old id -> new id
+        """
+        self.views = None
+
+        if self.body is not None:
+            # Not loaded yet, no ids
+            return
+
+        self.code = array('I', map(translate, self.code))
+        debug = array('I', self.debug)
+
+        for i in range(1, len(debug), 2):
+            debug[i] = translate(debug[i])
+
+        self.debug = debug
 
     def getLines(self):
-        return list(self.lines)
+        return self.lines
 
     # def __eq__(self, other):
     #     #FIXIT Do not use __eq__ directly !
@@ -249,18 +748,20 @@ class SmaliWithLines(SmaliAnnotableModifiable):
         return ret
 
     def getIdentityLines(self):
-        ret = list()
+        return self.getView('identity', self.computeIdentityLines)
 
-        for l in self.getCleanLines():
-            l = class_ref_pattern.sub('L', l)
-            l = method_access_pattern.sub('m', l)
-            l = field_access_pattern.sub('f', l)
-            l = jumps_pattern.sub('JMP', l)
-            l = local_registers_pattern.sub('vr', l)
-            l = param_registers_pattern.sub('pr', l)
-            ret.append(l)
+    def computeIdentityLines(self):
+        return InstructionTable.normalize(self.code, 'identity', SmaliWithLines.identityLine)
 
-        return ret
+    @staticmethod
+    def identityLine(l):
+        l = class_ref_pattern.sub('L', l)
+        l = method_access_pattern.sub('m', l)
+        l = field_access_pattern.sub('f', l)
+        l = jumps_pattern.sub('JMP', l)
+        l = local_registers_pattern.sub('vr', l)
+        l = param_registers_pattern.sub('pr', l)
+        return l
 
     @staticmethod
     def cleanLines(lines):
@@ -276,20 +777,40 @@ class SmaliWithLines(SmaliAnnotableModifiable):
         slines = list()
         for line in lines:
             if SmaliWithLines.keepThisLine(line):
-                line = field_access_pattern.sub(r'\1->///FIELD///:', line)
-                line = method_access_pattern.sub(r'\1->///METHOD///:', line)
-                slines.append(line)
+                slines.append(SmaliWithLines.cleanIdentityLine(line))
         return slines
 
+    @staticmethod
+    def cleanIdentityLine(line):
+        line = field_access_pattern.sub(r'\1->///FIELD///:', line)
+        return method_access_pattern.sub(r'\1->///METHOD///:', line)
 
     def getCleanIdentityLines(self):
-        return SmaliWithLines.cleanIdentityLines(self.lines)
+        return self.getView('cleanidentity', lambda: InstructionTable.normalize(self.code, 'cleanidentity',
+                                                                                 SmaliWithLines.cleanIdentityLine))
 
     def getCleanLines(self):
-        return SmaliWithLines.cleanLines(self.lines)
+        return self.getView('clean', lambda: self.code)
+
+    def getComparableLines(self, considerRReferences=False, dropAnonymousClassContent=True):
+        """
+        Lines as compared by areSourceCodeSimilars (see this method for parameters)
+        """
+        def compute():
+            ids = InstructionTable.normalize(self.code, 'cleanidentity', SmaliWithLines.cleanIdentityLine)
+
+            if not considerRReferences:
+                ids = InstructionTable.normalize(ids, 'rreferences', SmaliWithLines.clearRReference)
+
+            if dropAnonymousClassContent:
+                ids = InstructionTable.normalize(ids, 'innerclasses', SmaliWithLines.clearInnerClassesReference)
+
+            return ids
+
+        return self.getView(('comparable', bool(considerRReferences), bool(dropAnonymousClassContent)), compute)
 
     def moreThanNInstruction(self, n):
-        return len(self.getCleanLines()) > n
+        return len(self.code) > n
 
     def areSourceCodeSimilars(self, other, considerRReferences=False, dropAnonymousClassContent=True, mappings=None):
         """
@@ -301,57 +822,38 @@ class SmaliWithLines(SmaliAnnotableModifiable):
                                             two versions.
         :return:
         """
-        slines = self.getCleanIdentityLines()
-        olines = other.getCleanIdentityLines()
-
-        if not considerRReferences:
-            slines = SmaliMethod.clearRReferences(slines)
-            olines = SmaliMethod.clearRReferences(olines)
-
-        if dropAnonymousClassContent:
-            slines = SmaliMethod.clearInnerClassesReferences(slines)
-            olines = SmaliMethod.clearInnerClassesReferences(olines)
+        slines = self.getComparableLines(considerRReferences, dropAnonymousClassContent)
+        olines = other.getComparableLines(considerRReferences, dropAnonymousClassContent)
 
         if mappings is not None:
             slines = self.transposeWithNewReferences(slines, mappings)
+            return compareListsSameposition(slines, olines)
 
-
-        return compareListsSameposition(slines, olines)
+        return slines.sameAs(olines)
 
     def transposeWithNewReferences(self, old, mappings):
-        ret = []
-
-        for line in old:
-            thisline = line
-            for m in mappings:
-                thisline = thisline.replace(m.replace(";", ""), mappings[m].replace(";", ""))
-
-            ret.append(thisline)
-
-        return ret
+        return list(map(Mappings.of(mappings).transpose, old))
 
     @staticmethod
     def clearRReferences(lines):
-        ret = list()
+        return list(map(SmaliWithLines.clearRReference, lines))
 
-        for line in lines:
-            mtch = RREFERENCE_PATTERN.search(line)
+    @staticmethod
+    def clearRReference(line):
+        mtch = RREFERENCE_PATTERN.search(line)
 
-            if mtch is not None:
-                ret.append(line.replace(mtch.group(1), '<R_REF>'))
-            else:
-                ret.append(line)
+        if mtch is not None:
+            return line.replace(mtch.group(1), '<R_REF>')
 
-        return ret
+        return line
 
     @staticmethod
     def clearInnerClassesReferences(lines):
-        ret = list()
-
-        for line in lines:
-            ret.append(inner_anonymous_class_reference_matcher.sub("$?", line))
+        return list(map(SmaliWithLines.clearInnerClassesReference, lines))
 
-        return ret
+    @staticmethod
+    def clearInnerClassesReference(line):
+        return inner_anonymous_class_reference_matcher.sub("$?", line)
 
     @staticmethod
     def keepThisLine(line):
@@ -359,10 +861,13 @@ class SmaliWithLines(SmaliAnnotableModifiable):
         return len(lline) > 0 and lline[0] != '.' and lline[0] != ':' and lline[0] != '#'
 
 class SmaliField(SmaliAnnotableModifiable):
+    __slots__ = ('name', 'type', 'init')
+    interned = ('name', 'type')
+
     def __init__(self, name, type, modifiers, init, clazz):
         super(SmaliField, self).__init__(clazz)
-        self.name = name
-        self.type = type
+        self.name = sys.intern(name)
+        self.type = sys.intern(type)
         self.init = init
         self.addModifiersFromList(modifiers)
 
@@ -399,12 +904,22 @@ class SmaliField(SmaliAnnotableModifiable):
     def isField(self):
         return True
 
+    def getDigest(self):
+        """
+        Digest of everything compared by equals()
+        """
+        return SmaliAnnotableModifiable.computeDigest((self.name, self.type, self.init, sorted(self.modifiers),
+                                                       len(self.annotations)))
+
 
 class SmaliMethod(SmaliWithLines):
+    __slots__ = ('params', 'ret')
+    interned = ('name', 'params', 'ret')
+
     def __init__(self, name, params, ret, modifiers, clazz):
         SmaliWithLines.__init__(self, name, modifiers, clazz)
-        self.params = params
-        self.ret = ret
+        self.params = [sys.intern(p) for p in params]
+        self.ret = sys.intern(ret) if ret is not None else None
 
     # def __eq__(self, other):
     #     #FIXIT Do not use __eq__ directly !
@@ -445,6 +960,15 @@ class SmaliMethod(SmaliWithLines):
     def isMethod(self):
         return True
 
+    def getDigest(self):
+        """
+        Digest of everything compared by equals() (without mappings).
+        Comparable lines are derived from the clean ones, which are much cheaper to compute.
+        """
+        return SmaliAnnotableModifiable.computeDigest((self.name, self.params, self.ret,
+                                                       self.getCleanLines().digest, sorted(self.modifiers),
+                                                       len(self.annotations)))
+
     def getSignature(self):
         return ('%s(%s)%s'%(self.name, ''.join(self.params), self.ret)).strip()
 
@@ -453,32 +977,191 @@ class SmaliMethod(SmaliWithLines):
 
 
 class SmaliAnnotation(SmaliWithLines):
-    pass
+    __slots__ = ()
+
+
+
+
 
 
+class Mappings(dict):
+    """
+    Old class names to new ones. References to the old classes (and to their inner classes) are renamed with
+    a trie of the old names, kept up to date as mappings are added: remapping is done in a single pass over
+    the text whatever the number of mappings.
+    """
+    root = None
 
+    @staticmethod
+    def of(mappings):
+        return mappings if isinstance(mappings, Mappings) else Mappings(mappings)
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+
+        if self.root is not None:
+            self.insert(key, value)
+
+    def changed(self):
+        self.root = None
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.changed()
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self.changed()
+
+    def setdefault(self, key, default=None):
+        self.changed()
+        return dict.setdefault(self, key, default)
+
+    def pop(self, *args):
+        self.changed()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self.changed()
+        return dict.popitem(self)
+
+    def clear(self):
+        dict.clear(self)
+        self.changed()
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.changed()
+
+    def insert(self, key, value):
+        node = self.root
+
+        for c in key.replace(";", ""):
+            node = node.setdefault(c, {})
+
+        node[''] = value.replace(";", "")
+
+    def trie(self):
+        """
+        :return: the trie of the old names without their ';'. Leaves ('' keys) are the new names without ';'
+        """
+        if self.root is None:
+            self.root = {}
+
+            for key, value in self.items():
+                self.insert(key, value)
+
+        return self.root
 
+    @staticmethod
+    def matchAt(root, text, start):
+        """
+        :return: (end, new name) of the longest old name found at start in text, or None
+        """
+        node, ret = root, None
+
+        for i in range(start, len(text)):
+            node = node.get(text[i])
+
+            if node is None:
+                break
+
+            if '' in node:
+                ret = (i + 1, node[''])
+
+        return ret
+
+    @staticmethod
+    def nextStart(root, text, start):
+        """
+        :return: the first position from start where an old name may begin, or -1
+        """
+        ret = -1
+
+        for c in root:
+            pos = text.find(c, start)
+            if pos >= 0 and (ret < 0 or pos < ret):
+                ret = pos
+
+        return ret
 
+    def matches(self, text):
+        """
+        Leftmost longest matches of old names in text
+        :return: generator of (start, end, new name)
+        """
+        root = self.trie()
+        start = Mappings.nextStart(root, text, 0)
+
+        while start >= 0:
+            mtch = Mappings.matchAt(root, text, start)
+
+            if mtch is None:
+                start = Mappings.nextStart(root, text, start + 1)
+            else:
+                yield start, mtch[0], mtch[1]
+                start = Mappings.nextStart(root, text, mtch[0])
+
+    def transpose(self, line):
+        """
+        All the references are renamed at once: a new name is not renamed again when it is an old name too (with
+        A -> B and B -> C, A is renamed B, and B is renamed C). Where old names overlap, the longest one is renamed.
+        The result does not depend on the order of the mappings.
+        :return: line with all the references to old classes renamed
+        """
+        parts, last = [], 0
+
+        for start, end, new in self.matches(line):
+            parts.append(line[last:start])
+            parts.append(new)
+            last = end
+
+        if last == 0:
+            return line
+
+        parts.append(line[last:])
+        return ''.join(parts)
+
+    def renameFirst(self, old):
+        """
+        The first old class is the leftmost one in old (the longest one if several start there), whatever the
+        order of the mappings.
+        :return: old with the first old class it refers to renamed (wherever it appears)
+        """
+        for start, end, new in self.matches(old):
+            return old.replace(old[start:end], new)
+
+        return old
+
+
+def mappingKey(old):
+    """
+    :return: the name under which old (a type) is looked up in mappings: inner classes are looked up by their outer one
+    """
+    if "$" in old:
+        return "L{};".format(mapping_key_pattern.match(old).group(2))
+
+    return old
+
+def applyMapping(old, mappings):
+    """
+    :return: old with its anonymous inner classes references anonymized and the first mapped class it contains renamed
+    """
+    return Mappings.of(mappings).renameFirst(inner_anonymous_class_reference_matcher.sub("$?;", old))
 
 def compareWithMapping(old, new, mappings):
     oldres = old
 
-    if mappings is not None and "$" in old:
-        oldres = "L{};".format(re.match("(\[*?)L(.*?)(\$(.*))?;", old).group(2))
+    if mappings is not None:
+        oldres = mappingKey(old)
 
     if mappings is not None and oldres in mappings:
         if(mappings[oldres] == new):
             return True
 
-        oold = inner_anonymous_class_reference_matcher.sub("$?;", old)
-        onew = inner_anonymous_class_reference_matcher.sub("$?;", new)
-
-        for m in mappings:
-            if m.replace(";", "") in oold:
-                oold = oold.replace(m.replace(";", ""), mappings[m].replace(";", ""))
-                break
-
-        return oold == onew
+        return applyMapping(old, mappings) == inner_anonymous_class_reference_matcher.sub("$?;", new)
     else:
         return old == new
 
@@ -494,6 +1177,10 @@ def compareWithMapping(old, new, mappings):
 
 
 class SmaliClass(SmaliAnnotableModifiable):
+    __slots__ = ('name', 'innername', 'zuper', 'source', 'implements', 'innerclasses', 'methods', 'fields', 'digest',
+                 'fieldusages')
+    interned = ('name', 'zuper', 'implements')
+
     def __init__(self, project):
         super(SmaliClass, self).__init__(project)
         self.name = None
@@ -504,6 +1191,8 @@ class SmaliClass(SmaliAnnotableModifiable):
         self.innerclasses = {}
         self.methods = []
         self.fields = []
+        self.digest = None
+        self.fieldusages = None
 
     def getName(self):
         return self.name
@@ -518,23 +1207,20 @@ class SmaliClass(SmaliAnnotableModifiable):
         return filter(lambda x: not re.match(("^[0-9]+$"), x), self.innerclasses)
 
     def determineParentClass(self):
-        if self.parent is not None:
-            if self.zuper is not None:
-                return self.parent.searchClass(self.zuper)
+        project = self.getParentProjectIfAny()
+
+        if project is not None and self.zuper is not None:
+            return project.searchClass(self.zuper)
 
         return None
 
     def determineParentClassHierarchy(self):
-        ret = []
-
-        parent = self.determineParentClass()
+        project = self.getParentProjectIfAny()
 
-        while parent is not None:
-            ret.append(parent)
-            parent = parent.determineParentClass()
-
-        return ret
+        if project is None:
+            return []
 
+        return list(project.getSuperClasses(self))
 
     def determineParentClassHierarchyNames(self):
         ret = self.determineParentClassHierarchy()
@@ -566,22 +1252,53 @@ class SmaliClass(SmaliAnnotableModifiable):
 
     def addMethod(self, m):
         self.methods.append(m)
+        self.contentChanged()
 
     def addField(self, f):
         self.fields.append(f)
+        self.contentChanged()
 
     def setName(self, name):
-        self.name = name
+        self.name = sys.intern(name) if name is not None else None
+        self.contentChanged()
 
     def setSuper(self, zuper):
-        self.zuper = zuper
+        self.zuper = sys.intern(zuper) if zuper is not None else None
+        self.contentChanged()
+
+    def contentChanged(self):
+        self.digest = None
+        self.fieldusages = None
+
+    def getDigest(self):
+        """
+        Digest of everything compared by differences() (inner classes excluded).
+        Two classes with the same digest have no difference.
+        """
+        if self.digest is None:
+            self.digest = SmaliAnnotableModifiable.computeDigest((self.name, self.zuper, sorted(self.implements),
+                                                                  sorted(m.getDigest() for m in self.methods),
+                                                                  sorted(f.getDigest() for f in self.fields)))
+
+        return self.digest
+
+    def forgetCaches(self):
+        """
+        Release the views of the methods and the field usages index, once this class is not compared anymore.
+        The digest, which is small and still valid, is kept.
+        """
+        self.fieldusages = None
+
+        for m in self.methods:
+            m.forgetViews()
 
 
     def getSuper(self):
         return self.zuper[1:-1]
 
     def addImplementedInterface(self, ifce):
-        self.implements.add(ifce)
+        self.implements.add(sys.intern(ifce))
+        self.contentChanged()
 
     #def __eq__(self, other):
     # FIXIT Do not use __eq__ directly !
@@ -638,82 +1355,136 @@ class SmaliClass(SmaliAnnotableModifiable):
         self.source = param
 
     def methodsComparison(self, other, ignores, mappings=None):
-        mself = list(self.methods)
+        """
+        Pair the methods of self with the ones of other.
+        Each stage looks up its candidates in hash buckets (exact signature and body, same name, same body...)
+        instead of comparing all the remaining pairs. Candidates are still tried in the order of other.methods,
+        so that pairs and change types are the ones a full pairwise comparison would give.
+        """
         mother = list(other.methods)
-        mttemp = list()
+        matched = set()
 
         sames = list()
         diffs = list()
 
-        while len(mself) > 0:
-            meth = mself.pop()
+        def body(m, considerRReferences=False):
+            return m.getComparableLines(considerRReferences).key()
+
+        def bucketize(keyfunc):
+            buckets = {}
+            for pos in range(len(mother)):
+                buckets.setdefault(keyfunc(mother[pos]), []).append(pos)
+            return buckets
+
+        def remaining(positions):
+            # Forget the already matched positions at the head of the bucket
+            while len(positions) > 0 and positions[0] in matched:
+                positions.pop(0)
+
+            return filter(lambda x: x not in matched, positions)
+
+        # 1. Exactly the same methods (see SmaliMethod.equals)
+        def exactKey(m, params):
+            return m.name, tuple(params), m.ret, body(m), frozenset(m.modifiers), len(m.annotations)
+
+        buckets = bucketize(lambda m: exactKey(m, m.params))
+        mttemp = list()
+
+        for meth in reversed(self.methods):
+            params = meth.params
+            if mappings is not None:
+                params = [mappings[p] if p in mappings else p for p in params]
 
             found = False
 
-            for m in mother:
-                if meth.equals(m, mappings):
-                    found = True
-                    sames.append([meth, m])
-                    mother.remove(m)
-                    break
+            for pos in remaining(buckets.get(exactKey(meth, params), [])):
+                found = True
+                sames.append([meth, mother[pos]])
+                matched.add(pos)
+                break
 
             if not found:
                 mttemp.append(meth)
 
+        # 2. Revised, renamed or same name methods
+        def changeType(meth, m):
+            op = None
+            diff = meth.differences(m, ignores, mappings)
+
+            if len(diff) == 1:
+                if diff[0] == NOT_SAME_SOURCECODE_LINES:
+                    op = ChangesTypes.REVISED_METHOD
+                elif diff[0] == NOT_SAME_NAME and meth.moreThanNInstruction(1):
+                    op = ChangesTypes.RENAMED_METHOD
+            if op is None and meth.name == m.name:
+                # More than one change but they have the same source code,
+                # so we can suppose they are the same changed methods...
+                op = ChangesTypes.SAME_NAME
+
+            return op
+
+        def renamedKey(m):
+            # Everything differences() looks at but the name (and the return type, compared with mappings)
+            return tuple(m.params) if ComparisonIgnores.METHOD_PARAMS not in ignores else None, \
+                   body(m) if ComparisonIgnores.WITHLINES_SOURCECODE not in ignores else None, \
+                   frozenset(m.modifiers) if ComparisonIgnores.ANOT_MOD_MODIFIERS not in ignores else None
+
+        if ComparisonIgnores.WITHLINES_NAME in ignores:
+            # Any method may be a revision, no way to narrow down the candidates
+            namesbuckets, renamedbuckets = None, None
+        else:
+            namesbuckets = bucketize(lambda m: m.name)
+            renamedbuckets = bucketize(renamedKey)
+
         mself = mttemp
         mttemp = list()
 
-        while len(mself) > 0:
-            meth = mself.pop()
+        for meth in reversed(mself):
+            if namesbuckets is None:
+                candidates = range(len(mother))
+            else:
+                candidates = list(remaining(namesbuckets.get(meth.name, [])))
+                if meth.moreThanNInstruction(1):
+                    candidates = sorted(set(candidates).union(remaining(renamedbuckets.get(renamedKey(meth), []))))
 
-            op = None
             found = False
 
-            for m in mother:
-                diff = meth.differences(m, ignores, mappings)
+            for pos in candidates:
+                if pos in matched:
+                    continue
 
-                if len(diff) == 1:
-                    if diff[0] == NOT_SAME_SOURCECODE_LINES:
-                        op = [m, ChangesTypes.REVISED_METHOD]
-                    elif diff[0] == NOT_SAME_NAME and meth.moreThanNInstruction(1):
-                        op = [m, ChangesTypes.RENAMED_METHOD]
-                if op is None and meth.name == m.name:
-                    # More than one change but they have the same source code,
-                    # so we can suppose they are the same changed methods...
-                    op = [m, ChangesTypes.SAME_NAME]
+                op = changeType(meth, mother[pos])
 
                 if op is not None:
                     found = True
-                    diffs.append([meth, op[0], op[1]])
-                    mother.remove(m)
+                    diffs.append([meth, mother[pos], op])
+                    matched.add(pos)
                     break
 
             if not found:
                 mttemp.append(meth)
 
-        mself = mttemp
-        mttemp = list()
-
-        while len(mself) > 0:
-            meth = mself.pop()
+        # 3. Renamed methods with the same source code
+        considerRReferences = bool(mappings)    # As done by areSourceCodeSimilars(m, mappings)
+        buckets = bucketize(lambda m: body(m, considerRReferences))
 
+        for meth in reversed(mttemp):
             op = None
 
-            for m in mother:
-                if meth.areSourceCodeSimilars(m,mappings) and meth.moreThanNInstruction(1):
-                    op = [m, ChangesTypes.RENAMED_METHOD]
-
-                if op is not None:
-                    diffs.append([meth, op[0], op[1]])
-                    mother.remove(m)
+            if meth.moreThanNInstruction(1):
+                for pos in remaining(buckets.get(body(meth, considerRReferences), [])):
+                    op = [mother[pos], ChangesTypes.RENAMED_METHOD]
+                    matched.add(pos)
                     break
 
-            if op is None:
+            if op is not None:
+                diffs.append([meth, op[0], op[1]])
+            else:
                 diffs.append([meth, None, ChangesTypes.NOT_FOUND])
 
-        while len(mother) > 0:
-            meth = mother.pop()
-            diffs.append([None, meth, ChangesTypes.NOT_FOUND])
+        for pos in reversed(range(len(mother))):
+            if pos not in matched:
+                diffs.append([None, mother[pos], ChangesTypes.NOT_FOUND])
 
         return sames, diffs
 
@@ -741,6 +1512,7 @@ class SmaliClass(SmaliAnnotableModifiable):
                 mttemp.append(field)
 
         fself = mttemp
+        counterparts = None
 
         while len(fself) > 0:
             field = fself.pop()
@@ -754,8 +1526,11 @@ class SmaliClass(SmaliAnnotableModifiable):
                     break
 
             if not found:
+                if counterparts is None:
+                    counterparts = SmaliClass.matchedCounterparts(ret)
+
                 whereIsUsed = self.whereIsFieldUsed(field)
-                f = self.tryToDetectFieldRenamingWithComputedSets(field, whereIsUsed, other, fother, ret)
+                f = self.tryToDetectFieldRenamingWithComputedSets(field, whereIsUsed, other, fother, ret, counterparts)
 
                 if f is not None:
                     diffs.append([field, f, ChangesTypes.FIELD_CHANGED, field.differences(f, [])])
@@ -769,22 +1544,35 @@ class SmaliClass(SmaliAnnotableModifiable):
 
         return sames, diffs
 
+    def getFieldUsages(self):
+        """
+        Index of the fields accessed by the methods of this class, built in one pass over their clean lines.
+        :return: dict (owner, name, type) -> list of (method, clean line number), in methods and lines order
+        """
+        if self.fieldusages is None:
+            self.fieldusages = {}
+
+            for m in self.methods:
+                lnr = 0
+
+                for lc in m.getCleanLines():
+                    if '->' in lc:
+                        for ref in set(field_reference_pattern.findall(lc)):
+                            self.fieldusages.setdefault(ref, []).append((m, lnr))
+                    lnr += 1
+
+        return self.fieldusages
+
     def whereIsFieldUsed(self, field):
         ret = []
 
-        fieldCall = "%s->%s:%s"%(self.name.strip(), field.name.strip(), field.type.strip())
-        for m in self.methods:
-            lnr = 0
-
+        for m, lnr in self.getFieldUsages().get((self.name.strip(), field.name.strip(), field.type.strip()), []):
             if m.getName() == '<init>' and len(m.params) == 0:
                 # Lets skip similarities in the def cstr
                 # as init value are put here for non static fields
                 continue
 
-            for lc in m.getCleanLines():
-                if fieldCall in lc:
-                    ret.append([m, lnr])
-                lnr+=1
+            ret.append([m, lnr])
 
         return ret
 
@@ -813,23 +1601,31 @@ class SmaliClass(SmaliAnnotableModifiable):
 
         return None
 
-    def tryToDetectFieldRenamingWithComputedSets(self, field, whereIsUsed, newClass, nfields, ret):
+    @staticmethod
+    def matchedCounterparts(ret):
+        """
+        :param ret: list of differences, as returned by differences()
+        :return: dict id(object) -> the object it is paired with in the first difference involving both of them
+        """
+        counterparts = {}
+
+        for ent in ret:
+            if ent[0] is not None and ent[1] is not None:
+                counterparts.setdefault(id(ent[0]), ent[1])
+                counterparts.setdefault(id(ent[1]), ent[0])
+
+        return counterparts
+
+    def tryToDetectFieldRenamingWithComputedSets(self, field, whereIsUsed, newClass, nfields, ret, counterparts=None):
         fieldCall = "%s->%s:%s"%(self.name.strip(), field.name.strip(), field.type.strip())
 
+        if counterparts is None:
+            counterparts = SmaliClass.matchedCounterparts(ret)
+
         for usage in whereIsUsed:
             usageline = usage[1]
 
-            simeth = None
-
-            for ent in ret:
-
-                if ent[0] is not None and ent[1] is not None:
-                    if id(ent[0]) == id(usage[0]):
-                        simeth = ent[1]
-                        break
-                    elif id(ent[1]) == id(usage[0]):
-                        simeth = ent[0]
-                        break
+            simeth = counterparts.get(id(usage[0]))
 
             if simeth is None:
                 simeth = newClass.findSimilarMethod(usage[0])
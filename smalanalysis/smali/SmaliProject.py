@@ -2,15 +2,23 @@
 # Author: Vincenzo Musco (http://www.vmusco.com)
 # Creation date: 2017-09-15
 
+import functools
+import gc
+import io
+import multiprocessing
 import re
 import os
+import struct
 
 import sys
 import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import smalanalysis.smali.SmaliObject
-from smalanalysis.smali import ComparisonIgnores
+from smalanalysis.smali import ComparisonIgnores, SmaliCache
 from smalanalysis.smali.ChangesTypes import REVISED_METHOD, SAME_NAME
+from smalanalysis.smali.DexFile import DexFile
 
 
 class MATCHERS:
@@ -25,26 +33,73 @@ class MATCHERS:
     annotation = re.compile("\\.annotation( [a-z ]+)*( L[a-zA-Z0-9_/$]*);")
     ressource_classes = re.compile("^.*/R(\\$[a-z]+)?\\.smali$")
     hex_ref = re.compile("0x[0-9abcdef]{2,}")
+    dex_files = re.compile("^classes[0-9]*\\.dex$")
+    non_ascii = re.compile("[^\\x00-\\x7f]")
+    # Leading tokens of the class level lines (anything else goes through all the matchers)
+    directives = {'.class', '.super', '.source', '.implements', '.annotation', '.method', '.field'}
 
 
 class SmaliProject(object):
     def __init__(self):
         self.classes = []
         self.classesdict = {}
+        self.namesindex = {}
+        self.simplenamesindex = {}
         self.ressources_id = set()
+        # Lazily built from the classes (see classesIndex() and getSuperClasses())
+        self.index = None
+        self.hierarchy = {}
+        self.interfaces = {}
+        self.subclasses = None
+        # Archives the lazily parsed methods bodies are read from (see close())
+        self.lazyarchives = set()
 
     def addClass(self, c):
         self.classes.append(c)
         self.classesdict[c.name] = c
+        # Multimaps (in self.classes order) used for matching classes between projects
+        self.namesindex.setdefault(c.name, []).append(c)
+        if c.name is not None:
+            self.simplenamesindex.setdefault(SmaliProject.simpleName(c.name), []).append(c)
+        self.indexesChanged()
+
+    def indexesChanged(self):
+        """
+        To be called when classes are added (or inner classes attached), drops the memoized index and hierarchy
+        """
+        self.index = None
+        self.hierarchy = {}
+        self.interfaces = {}
+        self.subclasses = None
+
+    def addProject(self, other):
+        """
+        Add the classes and ressources of other, as if they were parsed in this project
+        """
+        for c in other.classes:
+            if c.parent is other:
+                c.parent = self
+            self.addClass(c)
+
+        self.ressources_id.update(other.ressources_id)
+        self.lazyarchives.update(getattr(other, 'lazyarchives', ()))
+
+    @staticmethod
+    def simpleName(clazzName):
+        return clazzName.split('/')[-1]
 
     def parseRessource(self, ctnt):
-        for line in ctnt.split('\n'):
-            refs = MATCHERS.hex_ref.findall(line)
+        self.ressources_id.update(SmaliProject.findRessources(ctnt.split('\n')))
+
+    @staticmethod
+    def findRessources(lines):
+        ret = set()
 
-            for r in refs:
-                self.ressources_id.add(r)
+        for line in lines:
+            for r in MATCHERS.hex_ref.findall(line):
+                ret.add(r)
 
-        pass
+        return ret
 
     def isProjectObfuscated(self):
         keep, skip = 0, 0
@@ -130,7 +185,16 @@ class SmaliProject(object):
 
         return 0
 
-    def parseProject(self, folder, package=None, skiplists=None, includelist=None, include_unpackaged=False):
+    def parseProject(self, folder, package=None, skiplists=None, includelist=None, include_unpackaged=False,
+                     workers=None, streaming=False, cache=None, lazy=False):
+        """
+        Parse a smali archive produced by sa-disassemble, or the dex files of an APK (which is not disassembled)
+        :param workers: if more than 1, the archive entries are parsed by this number of processes
+        :param streaming: read the archive entries line by line instead of decoding them at once
+        :param cache: if not None, folder where parsed archives (and their entries) are stored and loaded from
+        :param lazy: only keep the location of methods bodies, they are read from the archive when first used
+                     (the archive must not change meanwhile, APKs are always fully parsed)
+        """
         skips = None
         includes = None
         if skiplists is not None:
@@ -145,26 +209,96 @@ class SmaliProject(object):
         if os.path.exists(folder):
             if os.path.isfile(folder):
                 # This is a ZIP
-                zp = zipfile.ZipFile(folder, 'r')
-                SmaliProject.parseZipLoop(zp, self, package, skips=skips, includes=includes,
-                                          include_unpackaged=include_unpackaged)
+                if lazy:
+                    self.lazyarchives.add(os.path.abspath(folder))
+
+                if cache is not None:
+                    key = SmaliCache.projectKey(folder, package, skips, includes, include_unpackaged, lazy)
+                    parsed = SmaliCache.load(cache, key)
+
+                    if parsed is None:
+                        parsed = SmaliProject()
+                        # Lazy entries refer to this archive, they are not shared with other ones
+                        entriescache = SmaliCache.EntriesCache(cache) if not lazy else None
+
+                        try:
+                            with zipfile.ZipFile(folder, 'r') as zp:
+                                SmaliProject.parseZipLoop(zp, parsed, package, skips=skips, includes=includes,
+                                                          include_unpackaged=include_unpackaged, workers=workers,
+                                                          streaming=streaming, entriescache=entriescache, lazy=lazy)
+                        finally:
+                            if entriescache is not None:
+                                entriescache.close()
+
+                        SmaliCache.store(cache, key, parsed)
+
+                    self.addProject(parsed)
+                else:
+                    with zipfile.ZipFile(folder, 'r') as zp:
+                        SmaliProject.parseZipLoop(zp, self, package, skips=skips, includes=includes,
+                                                  include_unpackaged=include_unpackaged, workers=workers,
+                                                  streaming=streaming, lazy=lazy)
             else:
                 print("Parsing folder not supported anymore. Please use archive mode.")
                 # SmaliProject.parseFolderLoop(folder, folder, self, package, skips=skips, includes=includes, include_unpackaged = includeUnpackaged)
         else:
             print("File {} not found!".format(folder))
 
+    def parseApk(self, path, package=None, skiplists=None, includelist=None, include_unpackaged=False, workers=None,
+                 cache=None):
+        """
+        Parse the dex files of an APK, without disassembling it first (see parseProject, which accepts APKs too).
+        Classes are the same as the ones parsed from the archive produced by sa-disassemble.
+        """
+        self.parseProject(path, package, skiplists, includelist, include_unpackaged, workers=workers, cache=cache)
+
+    def parseDex(self, data, package=None, skips=None, includes=None, include_unpackaged=False):
+        """
+        Parse the classes of a dex file
+        :param data: content of the dex file
+        :param skips: set of rules of the classes to skip (see keepThisFile)
+        :param includes: set of rules of the classes to include (see keepThisFile)
+        """
+        dexes = {None: DexFile(data)}
+        entries = SmaliProject.listDexEntries(dexes, package, skips, includes, include_unpackaged)
+        SmaliProject.addParsedEntries(self, SmaliProject.parseDexEntries(dexes, entries))
+
     @staticmethod
-    def parseZipLoop(zp, target, package=None, skips=None, includes=None, include_unpackaged=False):
-        classes = {}
-        inner_classes = []
+    def parseZipLoop(zp, target, package=None, skips=None, includes=None, include_unpackaged=False, workers=None,
+                     streaming=False, entriescache=None, lazy=False):
+        dexes = {n: DexFile(zp.read(n)) for n in zp.namelist() if MATCHERS.dex_files.match(n)}
+
+        if len(dexes) > 0:
+            # This is an APK, its classes are read from its dex files
+            entries = SmaliProject.listDexEntries(dexes, package, skips, includes, include_unpackaged)
+            SmaliProject.addParsedEntries(target, SmaliProject.parseDexEntriesWith(zp, dexes, entries, workers))
+            return
 
+        entries = []
         for n in zp.namelist():
             op = SmaliProject.keepThisFile(n, package, includes, skips, include_unpackaged)
 
+            if op != 0:
+                entries.append((n, op))
+
+        if entriescache is not None:
+            parsed = SmaliProject.parseZipEntriesCached(zp, entries, entriescache, workers, streaming)
+        else:
+            parsed = SmaliProject.parseZipEntriesWith(zp, entries, workers, streaming, lazy)
+
+        SmaliProject.addParsedEntries(target, parsed)
+
+    @staticmethod
+    def addParsedEntries(target, parsed):
+        """
+        Add the parsed entries (see parseZipEntries) to the target project, inner classes to their outer class
+        """
+        classes = {}
+        inner_classes = []
+
+        for op, parsedEntry in parsed:
             if op == 1:
-                ccontent = "".join(map(chr, zp.read(n)))
-                cls = SmaliProject.parseClass(ccontent)
+                cls = parsedEntry
                 cls.parent = target
 
                 m2 = cls.name[1:-1].split("$")
@@ -175,8 +309,7 @@ class SmaliProject(object):
                     target.addClass(cls)
 
             elif op == 2:
-                ccontent = "".join(map(chr, zp.read(n)))
-                target.parseRessource(ccontent)
+                target.ressources_id.update(parsedEntry)
 
         # Deal with inner classes now
         looplevel = 0
@@ -188,7 +321,7 @@ class SmaliProject(object):
 
             for e in inner_classes:
                 if e[1] not in classes:
-                    missing_class = smalanalysis.smali.SmaliObject.SmaliClass(e[1])
+                    missing_class = smalanalysis.smali.SmaliObject.SmaliClass(target)
                     missing_class.name = "L{};".format(e[1])
                     classes[e[1]] = missing_class
                     target.addClass(missing_class)
@@ -210,85 +343,407 @@ class SmaliProject(object):
                     e[0].innername = '$'.join(e[2])
                     processed_at_least_one = True
 
-    def searchClass(self, clazzName):
-        searchfor = clazzName
+        target.indexesChanged()
+
+    @staticmethod
+    def readZipEntry(zp, name):
+        # Each byte is one character (same as "".join(map(chr, zp.read(name))))
+        return zp.read(name).decode('latin-1')
+
+    @staticmethod
+    def iterZipEntryLines(zp, name):
+        """
+        Read an archive entry line by line, without holding the whole decoded content.
+        Lines are split on '\n' only and returned without it, as str.split('\n') does.
+        """
+        with io.TextIOWrapper(zp.open(name), encoding='latin-1', newline='\n') as fp:
+            for line in fp:
+                yield line[:-1] if line[-1:] == '\n' else line
+
+    # Archives opened to read lazily parsed bodies, by path
+    archives = {}
+
+    @staticmethod
+    @functools.lru_cache(maxsize=16)
+    def readArchiveEntry(path, name, crc):
+        """
+        Read an entry of an archive parsed in lazy mode (methods of a class are usually loaded one after the other)
+        """
+        zp = SmaliProject.archives.get(path)
+
+        if zp is None:
+            zp = SmaliProject.archives[path] = zipfile.ZipFile(path, 'r')
+
+        if zp.getinfo(name).CRC != crc:
+            raise ValueError('{} changed in {} since it was parsed'.format(name, path))
+
+        return SmaliProject.readZipEntry(zp, name)
+
+    @staticmethod
+    def parseZipEntries(zp, entries, streaming=False, lazy=False):
+        """
+        Parse the (name, op) entries of the archive (see keepThisFile for op values)
+        :return: a generator of (op, SmaliClass) for classes and (op, set of ids) for ressources
+        """
+        path = os.path.abspath(zp.filename) if lazy and zp.filename is not None else None
 
-        if '/' not in searchfor and '.' in searchfor:
-            searchfor = searchfor.replace('/', '.')
+        for n, op in entries:
+            if streaming:
+                lines = SmaliProject.iterZipEntryLines(zp, n)
+            else:
+                lines = SmaliProject.readZipEntry(zp, n).split('\n')
 
-        if not (searchfor[0] == 'L' and searchfor[-1] == ';'):
-            searchfor = 'L%s;' % (searchfor)
+            if op == 1:
+                location = (path, n, zp.getinfo(n).CRC) if path is not None else None
+                yield op, SmaliProject.parseClassLines(lines, location)
+            elif op == 2:
+                yield op, SmaliProject.findRessources(lines)
 
-        for c in self.classes:
-            if c is None or c.name is None:
+    @staticmethod
+    def parseZipEntriesWith(zp, entries, workers=None, streaming=False, lazy=False):
+        if workers is not None and workers > 1 and zp.filename is not None:
+            return SmaliProject.parseZipEntriesInParallel(zp.filename, entries, workers, streaming, lazy)
+        else:
+            return SmaliProject.parseZipEntries(zp, entries, streaming, lazy)
+
+    @staticmethod
+    def parseZipEntriesCached(zp, entries, entriescache, workers=None, streaming=False):
+        """
+        Same as parseZipEntries, but entries found in the SmaliCache.EntriesCache are not parsed again
+        :return: the list of parsed entries
+        """
+        keys = [SmaliCache.EntriesCache.entryKey(zp.getinfo(n), op) for n, op in entries]
+
+        with SmaliCache.gcDisabled():
+            parsed = [entriescache.get(k) for k in keys]
+
+        missing = [i for i in range(len(entries)) if parsed[i] is None]
+        tostore = []
+
+        for i, e in zip(missing, SmaliProject.parseZipEntriesWith(zp, [entries[i] for i in missing], workers,
+                                                                  streaming)):
+            parsed[i] = e
+            # Serialized now, before the class is attached to a project
+            tostore.append((keys[i], SmaliCache.EntriesCache.serialize(e)))
+
+        entriescache.put(tostore)
+
+        return parsed
+
+    @staticmethod
+    def parseZipEntriesChunk(path, entries, streaming=False, lazy=False):
+        with zipfile.ZipFile(path, 'r') as zp:
+            return list(SmaliProject.parseZipEntries(zp, entries, streaming, lazy))
+
+    @staticmethod
+    def parseZipEntriesInParallel(path, entries, workers, streaming=False, lazy=False):
+        """
+        Same as parseZipEntries but entries are split in chunks parsed by a pool of processes.
+        Results are yielded in the entries order.
+        """
+        chunksize = max(1, len(entries) // (workers * 4) + 1)
+        chunks = [entries[i:i + chunksize] for i in range(0, len(entries), chunksize)]
+
+        with SmaliCache.gcDisabled(), ProcessPoolExecutor(max_workers=workers) as executor:
+            for parsed in executor.map(SmaliProject.parseZipEntriesChunk, [path] * len(chunks), chunks,
+                                       [streaming] * len(chunks), [lazy] * len(chunks)):
+                for e in parsed:
+                    yield e
+
+    @staticmethod
+    def listDexEntries(dexes, package=None, skips=None, includes=None, include_unpackaged=False):
+        """
+        List the classes of the dex files to parse, in the order of the archive produced by sa-disassemble (dex
+        files one after the other, files of a folder before its sub folders). A class defined again in a later
+        dex file is ignored.
+        :param dexes: dict of the DexFile by name
+        :return: list of (dex name, class index, smali file path, op) (see keepThisFile for op values)
+        """
+        entries = []
+        seen = set()
+
+        for name, dex in dexes.items():
+            files = []
+
+            for i in range(dex.classesSize):
+                path = '{}.smali'.format(dex.className(i)[1:-1])
+
+                if path not in seen:
+                    seen.add(path)
+                    op = SmaliProject.keepThisFile(path, package, includes, skips, include_unpackaged)
+
+                    if op != 0:
+                        folders = path.split('/')
+                        files.append(([(1, f) for f in folders[:-1]] + [(0, folders[-1])], (name, i, path, op)))
+
+            files.sort(key=lambda f: f[0])
+            entries.extend(f[1] for f in files)
+
+        return entries
+
+    @staticmethod
+    def parseDexEntries(dexes, entries):
+        """
+        Same as parseZipEntries, for the (dex name, class index, path, op) entries of the dex files
+        """
+        for name, i, path, op in entries:
+            try:
+                lines = dexes[name].classLines(i)
+            except (ValueError, IndexError, struct.error) as e:
+                # Only this class is lost
+                sys.stderr.write("Skipping {}, which can not be read: {}.\n".format(path, e))
                 continue
 
-            if searchfor == c.name:
-                return c
+            # Same characters as the ones of an archive entry, baksmali writing UTF-8 (see readZipEntry)
+            lines = [l if MATCHERS.non_ascii.search(l) is None else l.encode('utf-8', 'replace').decode('latin-1')
+                     for l in lines]
+
+            if op == 1:
+                yield op, SmaliProject.parseClassLines(lines)
+            elif op == 2:
+                yield op, SmaliProject.findRessources(lines)
+
+    @staticmethod
+    def parseDexEntriesWith(zp, dexes, entries, workers=None):
+        if workers is not None and workers > 1 and zp.filename is not None:
+            return SmaliProject.parseDexEntriesInParallel(zp.filename, entries, workers)
+        else:
+            return SmaliProject.parseDexEntries(dexes, entries)
+
+    @staticmethod
+    def parseDexEntriesChunk(path, entries):
+        with zipfile.ZipFile(path, 'r') as zp:
+            dexes = {n: DexFile(zp.read(n)) for n in set(e[0] for e in entries)}
+            return list(SmaliProject.parseDexEntries(dexes, entries))
+
+    @staticmethod
+    def parseDexEntriesInParallel(path, entries, workers):
+        """
+        Same as parseZipEntriesInParallel, for the entries of the dex files of an APK
+        """
+        chunksize = max(1, len(entries) // (workers * 4) + 1)
+        chunks = [entries[i:i + chunksize] for i in range(0, len(entries), chunksize)]
+
+        with SmaliCache.gcDisabled(), ProcessPoolExecutor(max_workers=workers) as executor:
+            for parsed in executor.map(SmaliProject.parseDexEntriesChunk, [path] * len(chunks), chunks):
+                for e in parsed:
+                    yield e
+
+    @staticmethod
+    def normalizeClassName(clazzName):
+        """
+        :return: the smali name of a class given either as La/b/C;, a/b/C or a.b.C
+        """
+        if '/' not in clazzName and '.' in clazzName:
+            clazzName = clazzName.replace('.', '/')
+
+        if not (clazzName[0] == 'L' and clazzName[-1] == ';'):
+            clazzName = 'L%s;' % (clazzName)
+
+        return clazzName
+
+    def iterAllClasses(self):
+        """
+        Classes of the project, followed by their inner classes
+        """
+        pending = deque(filter(lambda x: x is not None, self.classes))
+
+        while len(pending) > 0:
+            c = pending.popleft()
+            yield c
+            pending.extend(c.innerclasses.values())
+
+    def classesIndex(self):
+        if self.index is None:
+            self.index = {}
+
+            for c in self.iterAllClasses():
+                if c.name is not None and c.name not in self.index:
+                    self.index[c.name] = c
 
-        return None
+        return self.index
+
+    def searchClass(self, clazzName):
+        return self.classesIndex().get(SmaliProject.normalizeClassName(clazzName))
+
+    def getSuperClasses(self, clazz):
+        """
+        Ancestors of clazz which are part of this project, nearest first.
+        Memoized per class, so that walking the hierarchy of many classes only resolves each class once.
+        """
+        key = id(clazz)
+
+        if key not in self.hierarchy:
+            # Guards against cyclic hierarchies
+            self.hierarchy[key] = []
+
+            parent = None if clazz.zuper is None else self.searchClass(clazz.zuper)
+
+            if parent is not None and parent is not clazz:
+                self.hierarchy[key] = [parent] + self.getSuperClasses(parent)
+
+        return self.hierarchy[key]
+
+    def getInterfaces(self, clazz):
+        """
+        Names of the interfaces implemented by clazz, its ancestors and the interfaces they extend (memoized per class)
+        """
+        key = id(clazz)
+
+        if key not in self.interfaces:
+            self.interfaces[key] = frozenset()
+
+            ret = set(clazz.implements)
+            for name in clazz.implements:
+                interface = self.searchClass(name)
+                if interface is not None and interface is not clazz:
+                    ret.update(self.getInterfaces(interface))
+
+            parent = None if clazz.zuper is None else self.searchClass(clazz.zuper)
+            if parent is not None and parent is not clazz:
+                ret.update(self.getInterfaces(parent))
+
+            self.interfaces[key] = frozenset(ret)
+
+        return self.interfaces[key]
+
+    def getSubClasses(self, clazzName, implementers=False):
+        """
+        Classes of the project (inner classes included) extending clazzName, directly or not
+        :param implementers: also include the classes (and interfaces) implementing clazzName and their subclasses
+        """
+        if self.subclasses is None:
+            self.subclasses = ({}, {})
+
+            for c in self.iterAllClasses():
+                if c.zuper is not None:
+                    self.subclasses[0].setdefault(c.zuper, []).append(c)
+                for i in c.implements:
+                    self.subclasses[1].setdefault(i, []).append(c)
+
+        ret = []
+        seen = set()
+        pending = deque([SmaliProject.normalizeClassName(clazzName)])
+
+        while len(pending) > 0:
+            name = pending.popleft()
+
+            for index in self.subclasses[:2 if implementers else 1]:
+                for c in index.get(name, []):
+                    if id(c) not in seen:
+                        seen.add(id(c))
+                        ret.append(c)
+                        if c.name is not None:
+                            pending.append(c.name)
+
+        return ret
+
+    @staticmethod
+    def popFirstUnmatched(index, key, cursors, matched):
+        """
+        Return the first class of index[key] not yet in matched (and mark it as matched).
+        Classes are only ever added to matched, so a per key cursor skipping the matched ones
+        keeps the whole matching linear.
+        """
+        candidates = index.get(key)
+
+        if candidates is None:
+            return None
+
+        pos = cursors.get(key, 0)
+        while pos < len(candidates) and id(candidates[pos]) in matched:
+            pos += 1
+        cursors[key] = pos
+
+        if pos == len(candidates):
+            return None
+
+        matched.add(id(candidates[pos]))
+        return candidates[pos]
 
     def matchClasses(self, other):
-        old = list(self.classes)
-        new = list(other.classes)
         old2 = list()
+        matched = set()
 
         differents = []
         similars = []
 
-        while len(old) > 0:
-            clazz = old.pop()
-
-            found = False
-            for c in new:
-                if clazz.name == c.name:
-                    similars.append([clazz, c])
-                    new.remove(c)
-                    found = True
-                    break
+        # First pass: same full name
+        cursors = {}
+        for clazz in reversed(self.classes):
+            c = SmaliProject.popFirstUnmatched(other.namesindex, clazz.name, cursors, matched)
 
-            if not found:
+            if c is not None:
+                similars.append([clazz, c])
+            else:
                 old2.append(clazz)
 
-        while len(old2) > 0:
-            clazz = old2.pop()
-
-            found = False
-            for c in new:
-                if clazz.name.split('/')[-1] == c.name.split('/')[-1]:
-                    similars.append([clazz, c])
-                    new.remove(c)
-                    found = True
-                    break
+        # Second pass: same simple name (ie. moved in another package)
+        cursors = {}
+        for clazz in reversed(old2):
+            c = SmaliProject.popFirstUnmatched(other.simplenamesindex, SmaliProject.simpleName(clazz.name),
+                                               cursors, matched)
 
-            if not found:
+            if c is not None:
+                similars.append([clazz, c])
+            else:
                 differents.append([clazz, None])
 
-        while len(new) > 0:
-            c = new.pop()
-            differents.append([None, c])
+        for c in reversed(other.classes):
+            if id(c) not in matched:
+                differents.append([None, c])
 
         return similars, differents
 
-    def differences(self, other, ignores, process_inner_classes=True):
-        ret = []
+    def differences(self, other, ignores, process_inner_classes=True, workers=None):
+        """
+        :return: the list of the records of iterDifferences()
+        """
+        return list(self.iterDifferences(other, ignores, process_inner_classes, workers))
+
+    def iterDifferences(self, other, ignores, process_inner_classes=True, workers=None, summarize=None):
+        """
+        Differences between the classes of self and of other, yielded class by class as soon as they are computed
+        :param workers: number of processes diffing the matched classes (inner classes are diffed afterwards, with
+                        the mappings of all the matched classes). The result is the same as without workers.
+        :param summarize: if not None, function (pair of matched classes, differences) -> summary, yielded instead
+                          of the differences. It is called as soon as a pair is diffed, by the worker process which
+                          diffed it if any: the differences are dropped right away, and are never sent back.
+        :return: generator of [[old class, new class], differences] records, where a missing class is None (and
+                 differences are None too)
+        """
         dd = self.matchClasses(other)
-        classesMatching = {}
+        classesMatching = smalanalysis.smali.SmaliObject.Mappings()
 
-        def appendMatchedCase(sim):
+        def matchedCase(sim, diff=None):
             classesMatching[sim[0].name] = sim[1].name
-            rret = list()
-            diff = sim[0].differences(sim[1], ignores)
-            if len(diff) > 0:
-                rret.extend(diff)
 
-            ret.append([sim, rret])
+            if sim[0].getDigest() == sim[1].getDigest():
+                # Nothing to compare (see SmaliClass.getDigest)
+                diff = []
+            elif diff is None:
+                diff = sim[0].differences(sim[1], ignores)
+            elif summarize is not None:
+                # Already summarized by a worker
+                return [sim, diff]
+
+            if summarize is not None:
+                return [sim, summarize(sim, diff)]
+
+            return [sim, list(diff)]
+
+        if workers is not None and workers > 1 and SmaliProject.canDiffInParallel():
+            diffed = SmaliProject.diffPairsInParallel(
+                [sim for sim in dd[0] if sim[0].getDigest() != sim[1].getDigest()], ignores, workers, summarize)
 
-        for sim in dd[0]:
-            appendMatchedCase(sim)
+            for sim in dd[0]:
+                yield matchedCase(sim, None if sim[0].getDigest() == sim[1].getDigest() else next(diffed))
+        else:
+            for sim in dd[0]:
+                yield matchedCase(sim)
 
         for diff in dd[1]:
-            ret.append([diff, None])
+            yield [diff, None]
 
         """
         Additional code for handling inner classes
@@ -309,27 +764,27 @@ class SmaliProject(object):
                 result = SmaliProject.diffAnonymousInnerClasses(old, new, classesMatching)
 
                 for matched in result[0]:
-                    appendMatchedCase(matched)
+                    yield matchedCase(matched)
                     if matched[0].hasInnerClasses() or matched[1].hasInnerClasses():
                         processClasses.append((matched[0], matched[1]))
 
                 for droppedInnerClasses in result[1]:
-                    ret.append([[droppedInnerClasses, None], None])
+                    yield [[droppedInnerClasses, None], None]
 
                 for insertedInnerClasses in result[2]:
-                    ret.append([[None, insertedInnerClasses], None])
+                    yield [[None, insertedInnerClasses], None]
 
                 result = SmaliProject.diffNonAnonymousInnerClasses(old, new, classesMatching)
                 for matched in result[0]:
-                    appendMatchedCase(matched)
+                    yield matchedCase(matched)
                     if matched[0].hasInnerClasses() or matched[1].hasInnerClasses():
                         processClasses.append((matched[0], matched[1]))
 
                 for droppedInnerClasses in result[1]:
-                    ret.append([[droppedInnerClasses, None], None])
+                    yield [[droppedInnerClasses, None], None]
 
                 for insertedInnerClasses in result[2]:
-                    ret.append([[None, insertedInnerClasses], None])
+                    yield [[None, insertedInnerClasses], None]
 
             # Not matched inner classes
             for diff in dd[1]:
@@ -343,12 +798,20 @@ class SmaliProject(object):
 
                 for r in map(lambda x: [[None if diff[0] is None else x, x if diff[0] is None else None], None],
                              innerclasses):
-                    ret.append(r)
-
-        return ret
+                    yield r
 
     @staticmethod
     def parseClass(ccontent):
+        return SmaliProject.parseClassLines(ccontent.split('\n'))
+
+    @staticmethod
+    def parseClassLines(lines, location=None):
+        """
+        Build a class from an iterable of lines (a list, a text file object...).
+        Lines are consumed one at a time, a trailing new line character is ignored.
+        :param location: (archive path, entry name, entry CRC) of the lines. If given, methods bodies are not
+                         parsed but loaded from there when first used (see SmaliWithLines.setBodyLocation)
+        """
         clazz = smalanalysis.smali.SmaliObject.SmaliClass(None)
 
         # Class declaration
@@ -356,15 +819,25 @@ class SmaliProject(object):
         readingannotation = None
         currentobj = clazz
 
+        # Position of the current line and of the body of the method being read, in the entry
+        offset, bodyoffset = 0, 0
+
         linenr = -1
-        for line in ccontent.split('\n'):
+        for line in lines:
             linenr += 1
+            lineoffset = offset
+            if line[-1:] == '\n':
+                line = line[:-1]
+            offset += len(line) + 1
+
             if len(line) > 0 and line[0:1] != '#':
                 if readingmethod is not None:
                     if line == '.end method':
+                        if location is not None:
+                            readingmethod.setBodyLocation(location + (bodyoffset, lineoffset - bodyoffset))
                         readingmethod = None
                         currentobj = clazz
-                    else:
+                    elif location is None:
                         readingmethod.addLine(line.strip())
                     continue
 
@@ -380,26 +853,31 @@ class SmaliProject(object):
                         readingannotation.addLine(line.strip())
                     continue
 
-                matched = MATCHERS.clazz.match(line)
+                # Only try the matcher of the directive if known
+                directive = line.lstrip().partition(' ')[0]
+                if directive not in MATCHERS.directives:
+                    directive = None
+
+                matched = MATCHERS.clazz.match(line) if directive in (None, '.class') else None
                 if matched is not None:
                     clazz.setName('%s;' % (matched.group(2).strip()))
                     clazz.addModifiersFromList(
                         matched.group(1).strip().split(' ') if matched.group(1) is not None else None)
                     continue
 
-                if line.startswith('.super '):
+                if directive in (None, '.super') and line.startswith('.super '):
                     clazz.setSuper(line[len('.super'):].strip())
                     continue
 
-                if line.startswith('.source '):
+                if directive in (None, '.source') and line.startswith('.source '):
                     clazz.setSource(line[len('.source'):].replace('"', '').strip())
                     continue
 
-                if line.startswith('.implements '):
+                if directive in (None, '.implements') and line.startswith('.implements '):
                     clazz.addImplementedInterface(line[len('.implements'):].strip())
                     continue
 
-                matched = MATCHERS.annotation.match(line.strip())
+                matched = MATCHERS.annotation.match(line.strip()) if directive in (None, '.annotation') else None
                 if matched is not None:
                     modifiers = matched.group(1).strip().split(' ')
                     name = matched.group(2)
@@ -407,7 +885,7 @@ class SmaliProject(object):
                     readingannotation = smalanalysis.smali.SmaliObject.SmaliAnnotation(name, modifiers, clazz)
                     continue
 
-                matched = MATCHERS.method.match(line)
+                matched = MATCHERS.method.match(line) if directive in (None, '.method') else None
                 if matched is not None:
                     # Well this is a method...
                     modifiers = None
@@ -423,11 +901,12 @@ class SmaliProject(object):
                     returnval = matched.group(4)
 
                     readingmethod = smalanalysis.smali.SmaliObject.SmaliMethod(name, parameters, returnval, modifiers, clazz)
+                    bodyoffset = offset
                     currentobj = readingmethod
                     clazz.addMethod(readingmethod)
                     continue
 
-                matched = MATCHERS.fields.match(line)
+                matched = MATCHERS.fields.match(line) if directive in (None, '.field') else None
                 if matched is not None:
                     type = matched.group(3)
                     init = None
@@ -446,13 +925,15 @@ class SmaliProject(object):
                 sys.stderr.write("Parsing error.\nLine: %s.\n" % line)
                 sys.exit(1)
 
+        if readingmethod is not None and location is not None:
+            # No end of method
+            readingmethod.setBodyLocation(location + (bodyoffset, offset - bodyoffset))
+
         return clazz
 
     def parseAddClass(self, file):
-        fp = open(file, 'r')
-        ccontent = fp.read()
-        fp.close()
-        cls = SmaliProject.parseClass(ccontent)
+        with open(file, 'r') as fp:
+            cls = SmaliProject.parseClassLines(fp)
         cls.parent = self
         self.addClass(cls)
 
@@ -467,6 +948,144 @@ class SmaliProject(object):
     # def signatureEq(self, other):
     #     return compareListsBoolean(self.classes, other.classes, True)
 
+    @staticmethod
+    def anonymousClassFingerprint(clazz):
+        """
+        Structure two anonymous classes share when diffAnonymousInnerClasses() matches them:
+        the names of their methods (revised ones included) and the modifiers and init values of their fields.
+        Nothing depending on mappings (class names, types...) is part of it.
+        """
+        return tuple(sorted(m.name for m in clazz.methods)), \
+            tuple(sorted((repr(f.init), tuple(sorted(f.modifiers))) for f in clazz.fields))
+
+    # Pairs of classes diffed by the processes forked in diffPairsInParallel()
+    diffing = None
+
+    @staticmethod
+    def canDiffInParallel():
+        """
+        diffPairsInParallel() forks processes (not available on Windows) and needs Python 3.7 (gc.freeze()).
+        Otherwise classes are diffed in the current process.
+        """
+        return hasattr(gc, 'freeze') and 'fork' in multiprocessing.get_all_start_methods()
+
+    @staticmethod
+    def diffPairsInParallel(pairs, ignores, workers, summarize=None):
+        """
+        Diff pairs of classes in processes forked once the classes are loaded, so that they are shared (copy-on-write)
+        :param summarize: see iterDifferences, called by the worker processes (its summaries are sent back)
+        :return: generator of the differences (or of the summaries) of each pair, in order
+        """
+        if len(pairs) == 0:
+            return
+
+        chunksize = max(1, len(pairs) // (workers * 4) + 1)
+        chunks = [range(i, min(i + chunksize, len(pairs))) for i in range(0, len(pairs), chunksize)]
+
+        SmaliProject.diffing = (pairs, ignores, summarize)
+        # Objects alive before forking are not scanned by the GC of the children (which would touch their pages)
+        gc.freeze()
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                                     initializer=SmaliProject.forgetArchives) as executor:
+                for diffed in executor.map(SmaliProject.diffPairsChunk, chunks):
+                    for i, diff in diffed:
+                        yield SmaliProject.resolveDiffReferences(diff, pairs[i]) if summarize is None else diff
+        finally:
+            gc.unfreeze()
+            SmaliProject.diffing = None
+
+    @staticmethod
+    def forgetArchives(paths=None):
+        """
+        Close the archives opened to read lazily parsed bodies, and forget the entries read from them.
+        Archives opened by the parent process are not shared with forked ones (their file positions would be).
+        :param paths: paths of the archives to close, all of them if None
+        """
+        if paths is None:
+            paths = list(SmaliProject.archives)
+
+        for path in paths:
+            zp = SmaliProject.archives.pop(path, None)
+            if zp is not None:
+                zp.close()
+
+        SmaliProject.readArchiveEntry.cache_clear()
+
+    def close(self):
+        """
+        Close the archives of the lazily parsed methods bodies of this project, once it is discarded.
+        Bodies which have not been loaded yet can still be read: their archive is opened again.
+        """
+        SmaliProject.forgetArchives(self.lazyarchives)
+
+    @staticmethod
+    def diffPairsChunk(indexes):
+        pairs, ignores, summarize = SmaliProject.diffing
+        ret = []
+
+        for i in indexes:
+            old, new = pairs[i]
+            diff = old.differences(new, ignores)
+
+            if summarize is None:
+                ret.append((i, SmaliProject.diffReferences(diff, pairs[i])))
+            else:
+                ret.append((i, summarize(pairs[i], diff)))
+
+        return ret
+
+    @staticmethod
+    def diffReferences(diff, pair):
+        """
+        Replace the objects of a pair of classes (the classes, their methods and fields) found in a diff by
+        references to them, so that the diff can be sent back by a worker process
+        :return: the diff where objects are (side, kind, position) tuples
+        """
+        refs = {}
+
+        for side, clazz in enumerate(pair):
+            refs[id(clazz)] = (side, 'C', 0)
+
+            for i, m in enumerate(clazz.methods):
+                refs[id(m)] = (side, 'M', i)
+
+            for i, f in enumerate(clazz.fields):
+                refs[id(f)] = (side, 'F', i)
+
+        def replace(obj):
+            if isinstance(obj, list):
+                return list(map(replace, obj))
+
+            if isinstance(obj, smalanalysis.smali.SmaliObject.SmaliAnnotableModifiable):
+                return refs[id(obj)]
+
+            return obj
+
+        return replace(diff)
+
+    @staticmethod
+    def resolveDiffReferences(diff, pair):
+        """
+        Inverse of diffReferences(). Strings are interned as the changes types are sometimes compared by identity.
+        """
+        def resolve(obj):
+            if isinstance(obj, list):
+                return list(map(resolve, obj))
+
+            if isinstance(obj, tuple):
+                side, kind, i = obj
+                clazz = pair[side]
+                return clazz if kind == 'C' else clazz.methods[i] if kind == 'M' else clazz.fields[i]
+
+            if isinstance(obj, str):
+                return sys.intern(obj)
+
+            return obj
+
+        return resolve(diff)
+
     @staticmethod
     def diffAnonymousInnerClasses(old, new, mappings):
         def onlyUnmatched(innerclasses, matchState):
@@ -487,19 +1106,28 @@ class SmaliProject(object):
 
         # Let's compare inner classes to try to match them :)
         matches = []
-        matchedOld = []
-        matchedNew = []
+        matchedOld = set()
+        matchedNew = set()
+
+        # Only classes with the same fingerprint can be matched, so diffs are only run within buckets
+        # (in the original order, hence the same greedy matching)
+        buckets = {}
+        for newinnerclassname in new.getAnonymousInnerClasses():
+            fingerprint = SmaliProject.anonymousClassFingerprint(new.innerclasses[newinnerclassname])
+            buckets.setdefault(fingerprint, []).append(newinnerclassname)
 
         for oldinnerclassname in old.getAnonymousInnerClasses():
-            for newinnerclassname in onlyUnmatched(new.getAnonymousInnerClasses(), matchedNew):
+            fingerprint = SmaliProject.anonymousClassFingerprint(old.innerclasses[oldinnerclassname])
+
+            for newinnerclassname in onlyUnmatched(buckets.get(fingerprint, []), matchedNew):
                 diffs = thisContextDiff(old.innerclasses[oldinnerclassname], new.innerclasses[newinnerclassname],
                                         mappings)
 
                 if len(diffs) == 0:
                     # print("\tMatched old ${} and new ${}".format(oldinnerclassname, newinnerclassname))
                     matches.append((old.innerclasses[oldinnerclassname], new.innerclasses[newinnerclassname]))
-                    matchedOld.append(oldinnerclassname)
-                    matchedNew.append(newinnerclassname)
+                    matchedOld.add(oldinnerclassname)
+                    matchedNew.add(newinnerclassname)
                     # mappings[old.innerclasses[oldinnerclassname].name] = new.innerclasses[newinnerclassname].name
                     # found = True
                     break
@@ -4,6 +4,7 @@
 
 import os
 import subprocess
+import sys
 import smalanalysis.smali.SmaliProject
 from smalanalysis.smali.Metrics import initMetricsDict, splitInnerOuterChanged, computeMetrics
 
@@ -18,6 +19,15 @@ class TestHelper:
         if not os.path.exists(v1):
             subprocess.run(['bash', 'src/extractsmali.sh', 'src/%s'%v1], stdout=subprocess.PIPE, cwd=TestHelper.getTestFolder())
 
+    @staticmethod
+    def disassemble(apk, output):
+        """
+        Disassemble an APK of the tests folder with sa-disassemble (and the bundled baksmali) in the output archive
+        """
+        root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+        subprocess.run([sys.executable, os.path.join(root, 'bin', 'sa-disassemble'), apk, output],
+                       stdout=subprocess.PIPE, cwd=TestHelper.getTestFolder(), env=env, check=True)
 
     @staticmethod
     def runTestForTwoVersions(self, v1, v2, notNullValues, splitInnerOuter = False):
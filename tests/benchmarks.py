@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+import zipfile
+
+# Benchmarks of the parsing, matching, diffing and metrics stages
+# Date: October 18, 2026
+#
+# Usage (from the repository root):
+#   python -m tests.benchmarks --scale 10000 100000 --method-lines 10000 --output bench.json
+# Bundled fixtures are used: tests/src/vX/smali.zip if they have been built, and the series of APKs of tests/apks and
+# tests/apks1 (Version1.apk, Version2.apk...), which are parsed without being disassembled.
+from smalanalysis.smali import Metrics
+from smalanalysis.smali.SmaliProject import SmaliProject
+
+TYPES = ['I', 'Z', 'J', 'Ljava/lang/String;', 'Ljava/lang/Object;', '[I', 'Landroid/content/Context;']
+
+
+def naturalKey(path):
+    return [int(p) if p.isdigit() else p for p in re.split('([0-9]+)', path)]
+
+
+def apkSeries(folder):
+    """
+    :return: the APKs of a folder by series (Version1.apk, Version2.apk... or Versiona.apk, Versionb.apk...), each
+             series in versions order
+    """
+    series = {}
+
+    for name in sorted(os.listdir(folder), key=naturalKey):
+        m = re.fullmatch('(.*?)([0-9]+|[a-z])\\.apk', name)
+        if m is not None:
+            series.setdefault((m.group(1), m.group(2).isdigit()), []).append(os.path.join(folder, name))
+
+    return series
+
+
+class SyntheticApp:
+    """
+    Generates smali archives of a fake app, and of a next version with a few changes
+    """
+
+    def __init__(self, classes, methodlines=0, seed=0):
+        self.random = random.Random(seed)
+        self.classes = [self.generateClass(i) for i in range(classes)]
+
+        if methodlines > 0:
+            self.classes[0]['methods'].append(self.generateMethod(self.classes[0], 'huge', methodlines))
+
+    def generateClass(self, i):
+        clazz = {
+            'name': 'Lcom/bench/p{}/C{};'.format(i % 100, i),
+            'super': 'Ljava/lang/Object;',
+            'fields': [('f{}'.format(j), self.random.choice(TYPES)) for j in range(4)],
+            'methods': [],
+            'inner': []
+        }
+
+        clazz['methods'] = [self.generateMethod(clazz, 'm{}'.format(j), self.random.randint(3, 20)) for j in range(6)]
+
+        if i % 10 == 0:
+            for inner in ['1', '2', 'Holder']:
+                innerclazz = {
+                    'name': '{}${};'.format(clazz['name'][:-1], inner),
+                    'super': 'Ljava/lang/Object;',
+                    'fields': [('this$0', clazz['name'])],
+                    'methods': [],
+                    'inner': []
+                }
+                innerclazz['methods'] = [self.generateMethod(innerclazz, 'run', 5)]
+                clazz['inner'].append(innerclazz)
+
+        return clazz
+
+    def generateMethod(self, clazz, name, nblines):
+        lines = ['.registers 4', '.prologue']
+
+        for k in range(nblines):
+            op = k % 6
+            if op == 0:
+                lines.append('.line {}'.format(k + 1))
+                lines.append('const v0, 0x{:x}'.format(self.random.randint(0, 0x7f0a0000)))
+            elif op == 1:
+                fname, ftype = self.random.choice(clazz['fields'])
+                lines.append('iget-object v1, p0, {}->{}:{}'.format(clazz['name'], fname, ftype))
+            elif op == 2:
+                lines.append('invoke-virtual {{p0, v0}}, {}->m{}(I)V'.format(clazz['name'], self.random.randint(0, 5)))
+            elif op == 3:
+                lines.append('const-string v2, "s{}"'.format(self.random.randint(0, 1000)))
+            elif op == 4:
+                lines.append('if-eqz v0, :cond_{}'.format(k))
+                lines.append(':cond_{}'.format(k))
+            else:
+                lines.append('add-int/lit8 v0, v0, 0x{:x}'.format(self.random.randint(1, 100)))
+
+        lines.append('return-void')
+
+        return {'name': name, 'params': ['I'], 'ret': 'V', 'modifiers': 'public', 'lines': lines}
+
+    def evolve(self, ratio=0.05):
+        """
+        Change some classes: revised and renamed methods, added fields, deleted and added classes
+        """
+        classes = []
+
+        for clazz in self.classes:
+            pick = self.random.random()
+
+            if pick < ratio / 4:
+                continue
+
+            if pick < ratio:
+                clazz = dict(clazz, methods=list(clazz['methods']), fields=list(clazz['fields']))
+                method = dict(clazz['methods'][0], lines=list(clazz['methods'][0]['lines']))
+                method['lines'].insert(-1, 'nop')
+                clazz['methods'][0] = method
+                clazz['methods'][1] = dict(clazz['methods'][1], name='renamed')
+                clazz['fields'].append(('added', 'I'))
+
+            classes.append(clazz)
+
+        for i in range(int(len(self.classes) * ratio / 4)):
+            classes.append(self.generateClass(len(self.classes) + i))
+
+        self.classes = classes
+
+    @staticmethod
+    def renderClass(clazz):
+        lines = ['.class public {}'.format(clazz['name']),
+                 '.super {}'.format(clazz['super']),
+                 '.source "Bench.java"',
+                 '']
+
+        for name, type in clazz['fields']:
+            lines.append('.field private {}:{}'.format(name, type))
+
+        for method in clazz['methods']:
+            lines.append('')
+            lines.append('.method {} {}({}){}'.format(method['modifiers'], method['name'], ''.join(method['params']),
+                                                      method['ret']))
+            lines.extend(map(lambda x: '    {}'.format(x), method['lines']))
+            lines.append('.end method')
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as zp:
+            for clazz in self.classes:
+                for c in [clazz] + clazz['inner']:
+                    zp.writestr('{}.smali'.format(c['name'][1:-1]), SyntheticApp.renderClass(c))
+
+
+class Benchmark:
+    def __init__(self, repeat=1, workers=None):
+        self.repeat = repeat
+        self.workers = workers
+        self.results = []
+
+    def timeit(self, dataset, stage, func):
+        best, ret = None, None
+
+        for i in range(self.repeat):
+            start = time.perf_counter()
+            ret = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        self.results.append({'dataset': dataset, 'stage': stage, 'seconds': best})
+        print('{:>30} {:>12} {:10.3f}s'.format(dataset, stage, best), file=sys.stderr)
+
+        return ret
+
+    def parse(self, archive, package=None):
+        project = SmaliProject()
+        project.parseProject(archive, package, include_unpackaged=True, workers=self.workers)
+        return project
+
+    def runVersions(self, dataset, v1, v2, package=None):
+        old = self.timeit(dataset, 'parse', lambda: self.parse(v1, package))
+        new = self.parse(v2, package)
+
+        self.timeit(dataset, 'match', lambda: old.matchClasses(new))
+        diff = self.timeit(dataset, 'differences', lambda: old.differences(new, [], workers=self.workers))
+
+        def metrics():
+            ret = {}
+            innerDiff, outerDiff = Metrics.splitInnerOuterChanged(diff)
+            Metrics.initMetricsDict("OUT", ret)
+            Metrics.initMetricsDict("IN", ret)
+            Metrics.computeMetrics(outerDiff, ret, "OUT")
+            Metrics.computeMetrics(innerDiff, ret, "IN")
+            return ret
+
+        self.timeit(dataset, 'metrics', metrics)
+        self.results.append({'dataset': dataset, 'stage': 'size', 'classes': [len(old.classes), len(new.classes)],
+                             'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+
+    def runSynthetic(self, classes, methodlines):
+        app = SyntheticApp(classes, methodlines)
+
+        with tempfile.TemporaryDirectory() as folder:
+            v1, v2 = os.path.join(folder, 'v1.zip'), os.path.join(folder, 'v2.zip')
+            app.write(v1)
+            app.evolve()
+            app.write(v2)
+
+            self.runVersions('synthetic-{}-{}'.format(classes, methodlines), v1, v2)
+
+    def runFixtures(self):
+        testfolder = os.path.dirname(os.path.realpath(__file__))
+
+        srcs = os.path.join(testfolder, 'src')
+        versions = sorted(filter(lambda x: os.path.isfile(os.path.join(srcs, x, 'smali.zip')), os.listdir(srcs)),
+                          key=naturalKey)
+        for v1, v2 in zip(versions, versions[1:]):
+            self.runVersions('src-{}-{}'.format(v1, v2), os.path.join(srcs, v1, 'smali.zip'),
+                             os.path.join(srcs, v2, 'smali.zip'))
+
+        for folder in ['apks', 'apks1']:
+            for key, apks in sorted(apkSeries(os.path.join(testfolder, folder)).items()):
+                for v1, v2 in zip(apks, apks[1:]):
+                    self.runVersions('{}-{}-{}'.format(folder, os.path.basename(v1)[:-4], os.path.basename(v2)[:-4]),
+                                     v1, v2)
+
+    def write(self, output):
+        report = {
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': self.repeat,
+            'workers': self.workers,
+            'results': self.results
+        }
+
+        with open(output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the parse, match, diff and metrics stages.')
+    parser.add_argument('--scale', '-s', type=int, nargs='*', default=[10000],
+                        help='Number of classes of the synthetic apps')
+    parser.add_argument('--method-lines', '-l', type=int, default=10000,
+                        help='Number of lines of one huge method in each synthetic app')
+    parser.add_argument('--no-fixtures', '-F', action='store_true',
+                        help='Do not run on the bundled tests fixtures')
+    parser.add_argument('--repeat', '-r', type=int, default=1,
+                        help='Repeat each stage and keep the best time')
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                        help='Number of processes used for parsing and diffing')
+    parser.add_argument('--output', '-o', type=str, default='bench_output.json',
+                        help='JSON file where results are written')
+
+    args = parser.parse_args()
+
+    bench = Benchmark(args.repeat, args.workers)
+
+    if not args.no_fixtures:
+        bench.runFixtures()
+
+    for scale in args.scale:
+        bench.runSynthetic(scale, args.method_lines)
+
+    bench.write(args.output)
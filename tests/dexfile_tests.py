@@ -0,0 +1,329 @@
+import hashlib
+import os
+import struct
+import unittest
+import zipfile
+import zlib
+
+# Unit test for the reading of dex files
+# Date: October 18, 2026
+from smalanalysis.smali import DexFile
+from smalanalysis.smali.SmaliProject import SmaliProject
+
+
+def uleb128(value):
+    ret = bytearray()
+
+    while True:
+        b = value & 0x7f
+        value >>= 7
+        if value == 0:
+            ret.append(b)
+            return bytes(ret)
+        ret.append(b | 0x80)
+
+
+class DexBuilder(object):
+    """
+    Writes a dex file with a single class (public static methods only), the ids being indexes in the order the
+    items are declared
+    """
+    def __init__(self):
+        self.strings, self.types, self.protos, self.methods, self.handles, self.callSites = [], [], [], [], [], []
+
+    @staticmethod
+    def index(items, item):
+        if item not in items:
+            items.append(item)
+        return items.index(item)
+
+    def string(self, s):
+        return DexBuilder.index(self.strings, s)
+
+    def type(self, t):
+        return DexBuilder.index(self.types, self.string(t))
+
+    def proto(self, params, ret):
+        shorty = ''.join(t if len(t) == 1 else 'L' for t in [ret] + list(params))
+        return DexBuilder.index(self.protos, (self.string(shorty), self.type(ret), tuple(map(self.type, params))))
+
+    def method(self, clazz, name, params, ret):
+        return DexBuilder.index(self.methods, (self.type(clazz), self.proto(params, ret), self.string(name)))
+
+    def handle(self, kind, member):
+        return DexBuilder.index(self.handles, (kind, member))
+
+    def callSite(self, handle, name, proto, arguments=b''):
+        """
+        :param arguments: encoded values of the extra arguments, with their count
+        """
+        self.string(name)
+        return DexBuilder.index(self.callSites, (handle, name, proto, arguments))
+
+    def build(self, clazz, codes):
+        """
+        :param codes: list of (method index, registers, instructions code units)
+        """
+        classIdx, superIdx = self.type(clazz), self.type('Ljava/lang/Object;')
+        sizes = (len(self.strings), len(self.types), len(self.protos), len(self.methods), len(self.callSites),
+                 len(self.handles))
+        offset = 0x70 + 4 * sizes[0] + 4 * sizes[1] + 12 * sizes[2] + 8 * sizes[3] + 32 + 4 * sizes[4] + \
+            8 * sizes[5]
+        data = bytearray()
+
+        def add(item, align=1):
+            while (offset + len(data)) % align != 0:
+                data.append(0)
+            position = offset + len(data)
+            data.extend(item)
+            return position
+
+        strings = [add(uleb128(len(s)) + s.encode('utf-8') + b'\0') for s in self.strings]
+        params = [add(struct.pack('<I%dH' % len(p[2]), len(p[2]), *p[2]), 4) if len(p[2]) > 0 else 0
+                  for p in self.protos]
+        callSites = [add(uleb128(3 + arguments[0] if arguments else 3) +
+                         bytes([0x16, handle, 0x17, self.strings.index(name), 0x15, proto]) + arguments[1:])
+                     for handle, name, proto, arguments in self.callSites]
+        code = [add(struct.pack('<4HII%dH' % len(insns), registers, 0, registers, 0, 0, len(insns), *insns), 4)
+                for method, registers, insns in codes]
+
+        classData = uleb128(0) + uleb128(0) + uleb128(len(codes)) + uleb128(0)
+        previous = 0
+        for (method, registers, insns), c in sorted(zip(codes, code)):
+            classData += uleb128(method - previous) + uleb128(0x9) + uleb128(c)
+            previous = method
+        classData = add(classData)
+
+        items = [(0x0, 1, 0), (0x1, sizes[0], 0x70)]
+        mapOffset = offset + len(data) + (-(offset + len(data)) % 4)
+        mapItems = [(0x2002, len(strings), strings[0] if strings else 0), (0x2000, 1, classData),
+                    (0x1000, 1, mapOffset)]
+        add(b'', 4)
+
+        header = bytearray(0x70)
+        tables = bytearray()
+        position = 0x70 + 4 * sizes[0]
+        tables += struct.pack('<%dI' % sizes[0], *strings)
+        items.append((0x2, sizes[1], position))
+        tables += struct.pack('<%dI' % sizes[1], *self.types)
+        position += 4 * sizes[1]
+        items.append((0x3, sizes[2], position))
+        for (shorty, ret, p), o in zip(self.protos, params):
+            tables += struct.pack('<3I', shorty, ret, o)
+        position += 12 * sizes[2]
+        items.append((0x5, sizes[3], position))
+        for m in self.methods:
+            tables += struct.pack('<HHI', *m)
+        position += 8 * sizes[3]
+        items.append((0x6, 1, position))
+        tables += struct.pack('<8I', classIdx, 0x1, superIdx, 0, DexFile.NO_INDEX, 0, classData, 0)
+        position += 32
+        if sizes[4] > 0:
+            items.append((0x7, sizes[4], position))
+            tables += struct.pack('<%dI' % sizes[4], *callSites)
+        position += 4 * sizes[4]
+        if sizes[5] > 0:
+            items.append((0x8, sizes[5], position))
+            for kind, member in self.handles:
+                tables += struct.pack('<4H', kind, 0, member, 0)
+
+        mapItems = items + mapItems
+        data += struct.pack('<I', len(mapItems))
+        for kind, size, o in mapItems:
+            data += struct.pack('<2H2I', kind, 0, size, o)
+
+        content = header + tables + data
+        struct.pack_into('<8s', content, 0, b'dex\n038\0')
+        struct.pack_into('<8I', content, 32, len(content), 0x70, 0x12345678, 0, 0, mapOffset, sizes[0], 0x70)
+        struct.pack_into('<10I', content, 64, sizes[1], 0x70 + 4 * sizes[0], sizes[2], items[3][2], 0, 0,
+                         sizes[3], items[4][2], 1, items[5][2])
+        struct.pack_into('<2I', content, 104, len(data), offset)
+        content[12:32] = hashlib.sha1(content[32:]).digest()
+        struct.pack_into('<I', content, 8, zlib.adler32(bytes(content[12:])))
+
+        return bytes(content)
+
+
+class DexFileTesting(unittest.TestCase):
+
+    @staticmethod
+    def getTestFolder():
+        return os.path.realpath(__file__)[:-1 * len(os.path.basename(__file__))]
+
+    @staticmethod
+    def classLines(apk, name):
+        """
+        :return: the lines of a class of an APK, as parseClassLines() reads them
+        """
+        with zipfile.ZipFile(os.path.join(DexFileTesting.getTestFolder(), apk)) as zp:
+            dex = DexFile.DexFile(zp.read('classes.dex'))
+
+        for i in range(dex.classesSize):
+            if dex.className(i) == name:
+                return [l.strip() for l in dex.classLines(i)]
+
+    @staticmethod
+    def methodLines(lines, signature):
+        start = lines.index('.method %s' % signature)
+        return lines[start + 1:lines.index('.end method', start)]
+
+    def test_floating_points(self):
+        self.assertEqual(DexFile.javaFloatToString(1.0), '1.0')
+        self.assertEqual(DexFile.javaFloatToString(0.1), '0.1')
+        self.assertEqual(DexFile.javaFloatToString(1e7), '1.0E7')
+        self.assertEqual(DexFile.javaFloatToString(123456.789), '123456.789')
+        self.assertEqual(DexFile.javaFloatToString(0.001), '0.001')
+        self.assertEqual(DexFile.javaFloatToString(0.0001), '1.0E-4')
+        self.assertEqual(DexFile.javaFloatToString(-0.0), '-0.0')
+        self.assertEqual(DexFile.javaFloatToString(float('inf')), 'Infinity')
+        self.assertEqual(DexFile.javaFloatToString(struct.unpack('<f', struct.pack('<f', 0.1))[0], True), '0.1')
+        self.assertEqual(DexFile.javaFloatToString(struct.unpack('<f', b'\xff\xff\x7f\x7f')[0], True), '3.4028235E38')
+
+        self.assertEqual(DexFile.floatComment(0x3f800000), '    # 1.0f')
+        self.assertEqual(DexFile.floatComment(0x40200000), '    # 2.5f')
+        self.assertEqual(DexFile.floatComment(-0x40800000), '    # -1.0f')
+        self.assertEqual(DexFile.floatComment(0x7f800000), '    # Float.POSITIVE_INFINITY')
+        self.assertEqual(DexFile.floatComment(0x40490fdb), '    # (float)Math.PI')
+        self.assertEqual(DexFile.floatComment(0x7fc00000), '    # NaNf')
+        # Integers and resources ids are not commented
+        self.assertEqual(DexFile.floatComment(0x1), '')
+        self.assertEqual(DexFile.floatComment(0x7fffffff), '')
+        self.assertEqual(DexFile.floatComment(0x7f04001b), '')
+
+        self.assertEqual(DexFile.doubleComment(0x3ff0000000000000), '    # 1.0')
+        self.assertEqual(DexFile.doubleComment(0x400921fb54442d18), '    # Math.PI')
+        self.assertEqual(DexFile.doubleComment(-0x10000000000000), '    # Double.NEGATIVE_INFINITY')
+        self.assertEqual(DexFile.doubleComment(0x3e8), '')
+
+    def test_strings(self):
+        self.assertEqual(DexFile.escapeString('plain [text] ~'), 'plain [text] ~')
+        self.assertEqual(DexFile.escapeString('a "b" \'c\' \\d'), 'a \\"b\\" \\\'c\\\' \\\\d')
+        self.assertEqual(DexFile.escapeString('\n\r\t\x00\x7f'), '\\n\\r\\t\\u0000\\u007f')
+        self.assertEqual(DexFile.escapeString('é€\U0001f600'), '\\u00e9\\u20ac\\ud83d\\ude00')
+
+        # MUTF-8: encoded NUL, 2 and 3 bytes characters, surrogate pairs encoded separately
+        self.assertEqual(DexFile.decodeMutf8(b'a\xc0\x80b'), 'a\0b')
+        self.assertEqual(DexFile.decodeMutf8('é€'.encode('utf-8')), 'é€')
+        self.assertEqual(DexFile.decodeMutf8(b'\xed\xa0\xbd\xed\xb8\x80'), '\U0001f600')
+
+    def test_accessors(self):
+        def accessor(*ops):
+            return DexFile.accessorType([(i, op, a, literal, 0) for i, (op, a, literal) in enumerate(ops)])
+
+        # sget, return / sput, return-void / invoke-static, move-result, return
+        self.assertEqual(accessor((0x60, 0, None), (0x0f, 0, None)), DexFile.GETTER)
+        self.assertEqual(accessor((0x67, 0, None), (0x0e, 0, None)), -1)
+        self.assertEqual(accessor((0x67, 0, None), (0x0f, 0, None)), DexFile.SETTER)
+        self.assertEqual(accessor((0x71, 0, None), (0x0a, 0, None), (0x0f, 0, None)), DexFile.METHOD_ACCESS)
+        # iget, add-int/lit8 1, iput, return the new or the old value
+        self.assertEqual(accessor((0x52, 0, None), (0xd8, 1, 1), (0x59, 1, None), (0x0f, 1, None)),
+                         DexFile.PREFIX_INCREMENT)
+        self.assertEqual(accessor((0x52, 0, None), (0xd8, 1, 1), (0x59, 1, None), (0x0f, 0, None)),
+                         DexFile.POSTFIX_INCREMENT)
+        self.assertEqual(accessor((0x52, 0, None), (0xd8, 1, -1), (0x59, 1, None), (0x0f, 1, None)),
+                         DexFile.PREFIX_DECREMENT)
+        # iget, const/4 1, sub-int/2addr, iput, return
+        self.assertEqual(accessor((0x52, 0, None), (0x12, 1, 1), (0xb1, 0, None), (0x59, 0, None),
+                                  (0x0f, 0, None)), DexFile.PREFIX_DECREMENT)
+        # iget, int-to-long, or-long/2addr, long-to-int, iput, return
+        access = accessor((0x52, 0, None), (0x81, 0, None), (0xc1, 0, None), (0x84, 0, None), (0x59, 0, None),
+                          (0x0f, 0, None))
+        self.assertEqual(DexFile.ACCESSOR_COMMENTS[access], '|= operator for: ')
+
+        # Callers of synthetic accessors
+        lines = DexFileTesting.classLines('apks1/app1.apk',
+                                          'Landroid/support/transition/TransitionSet$TransitionSetListener;')
+        body = DexFileTesting.methodLines(lines, 'public onTransitionEnd(Landroid/support/transition/Transition;)V')
+        self.assertEqual([l for l in body if l.startswith('#')], [
+            '# --operator for: Landroid/support/transition/TransitionSet;->mCurrentListeners:I',
+            '# getter for: Landroid/support/transition/TransitionSet;->mCurrentListeners:I',
+            '# setter for: Landroid/support/transition/TransitionSet;->mStarted:Z'])
+        self.assertEqual(body[:5], ['.registers 4',
+                                    '.param p1, "transition"    # Landroid/support/transition/Transition;',
+                                    '.annotation build Landroid/support/annotation/NonNull;', '.end annotation',
+                                    '.end param'])
+
+    def test_payloads(self):
+        # Expected lines are the ones of baksmali 2.2.1
+        lines = DexFileTesting.classLines('apks1/app1.apk', 'Landroid/support/v7/widget/Toolbar;')
+        self.assertEqual(DexFileTesting.methodLines(lines, 'private getChildVerticalGravity(I)I'), [
+            '.registers 4', '.param p1, "gravity"    # I', '.prologue', '.line 1998', 'and-int/lit8 v0, p1, 0x70',
+            '.line 1999', '.local v0, "vgrav":I', 'sparse-switch v0, :sswitch_data_a', '.line 2005',
+            'iget v1, p0, Landroid/support/v7/widget/Toolbar;->mGravity:I', 'and-int/lit8 v0, v1, 0x70',
+            '.end local v0    # "vgrav":I', ':sswitch_9', 'return v0', '.line 1999', ':sswitch_data_a',
+            '.sparse-switch', '0x10 -> :sswitch_9', '0x30 -> :sswitch_9', '0x50 -> :sswitch_9', '.end sparse-switch'])
+
+        lines = DexFileTesting.classLines('apks1/app1.apk', 'Landroid/support/v4/text/TextDirectionHeuristicsCompat;')
+        self.assertEqual(DexFileTesting.methodLines(lines, 'static isRtlText(I)I'), [
+            '.registers 2', '.param p0, "directionality"    # I', '.prologue', '.line 79',
+            'packed-switch p0, :pswitch_data_a', '.line 86', 'const/4 v0, 0x2', ':goto_4', 'return v0', '.line 81',
+            ':pswitch_5', 'const/4 v0, 0x1', 'goto :goto_4', '.line 84', ':pswitch_7', 'const/4 v0, 0x0',
+            'goto :goto_4', '.line 79', 'nop', ':pswitch_data_a', '.packed-switch 0x0', ':pswitch_5', ':pswitch_7',
+            ':pswitch_7', '.end packed-switch'])
+
+        lines = DexFileTesting.classLines('apks1/app1.apk', 'Landroid/support/v7/view/menu/ExpandedMenuView;')
+        self.assertEqual(DexFileTesting.methodLines(lines, 'static constructor <clinit>()V'), [
+            '.registers 1', '.prologue', '.line 41', 'const/4 v0, 0x2', 'new-array v0, v0, [I',
+            'fill-array-data v0, :array_a',
+            'sput-object v0, Landroid/support/v7/view/menu/ExpandedMenuView;->TINT_ATTRS:[I', 'return-void', 'nop',
+            ':array_a', '.array-data 4', '0x10100d4', '0x1010129', '.end array-data'])
+
+    def test_tries(self):
+        lines = DexFileTesting.classLines('apks1/app1.apk', 'Landroid/support/v4/os/CancellationSignal;')
+        self.assertEqual(DexFileTesting.methodLines(lines, 'public isCanceled()Z'), [
+            '.registers 2', '.prologue', '.line 44', 'monitor-enter p0', '.line 45', ':try_start_1',
+            'iget-boolean v0, p0, Landroid/support/v4/os/CancellationSignal;->mIsCanceled:Z', 'monitor-exit p0',
+            'return v0', '.line 46', ':catchall_5', 'move-exception v0', 'monitor-exit p0', ':try_end_7',
+            '.catchall {:try_start_1 .. :try_end_7} :catchall_5', 'throw v0'])
+
+    def test_debug_locals(self):
+        lines = DexFileTesting.classLines('apks1/app1.apk', 'Landroid/support/v4/graphics/ColorUtils;')
+        self.assertEqual(DexFileTesting.methodLines(lines, 'private static constrain(III)I'), [
+            '.registers 3', '.param p0, "amount"    # I', '.param p1, "low"    # I', '.param p2, "high"    # I',
+            '.prologue', '.line 521', 'if-ge p0, p1, :cond_3', '.end local p1    # "low":I', ':goto_2', 'return p1',
+            '.restart local p1    # "low":I', ':cond_3', 'if-le p0, p2, :cond_7', 'move p1, p2', 'goto :goto_2',
+            ':cond_7', 'move p1, p0', 'goto :goto_2'])
+
+    def test_dex_038_instructions(self):
+        dex = DexBuilder()
+        foo = dex.method('La/A;', 'foo', [], 'V')
+        invoke = dex.method('Ljava/lang/invoke/MethodHandle;', 'invoke', ['[Ljava/lang/Object;'],
+                            'Ljava/lang/Object;')
+        proto = dex.proto(['I'], 'V')
+        bootstrap = dex.handle(4, dex.method('La/A;', 'bootstrap', [], 'Ljava/lang/invoke/CallSite;'))
+        site = dex.callSite(bootstrap, 'run', dex.proto([], 'Ljava/lang/Runnable;'), bytes([1, 0x04, 0x2a]))
+
+        content = dex.build('La/A;', [(foo, 3, [0x20fa, invoke, 0x0010, proto, 0x03fb, invoke, 0x0000, proto,
+                                                0x10fc, site, 0x0000, 0x02fd, site, 0x0000, 0x00fe, bootstrap,
+                                                0x01ff, proto, 0x000e])])
+        lines = DexFile.DexFile(content).classLines(0)
+        self.assertEqual(lines[:2], ['.class public La/A;', '.super Ljava/lang/Object;'])
+        self.assertEqual(lines[2:], [
+            '.method public static foo()V',
+            '    .registers 3',
+            '    invoke-polymorphic {v0, v1}, Ljava/lang/invoke/MethodHandle;->invoke([Ljava/lang/Object;)'
+            'Ljava/lang/Object;, (I)V',
+            '    invoke-polymorphic/range {v0 .. v2}, Ljava/lang/invoke/MethodHandle;->invoke([Ljava/lang/Object;)'
+            'Ljava/lang/Object;, (I)V',
+            '    invoke-custom {v0}, call_site_0("run", ()Ljava/lang/Runnable;, 0x2a)@La/A;->bootstrap()'
+            'Ljava/lang/invoke/CallSite;',
+            '    invoke-custom/range {v0 .. v1}, call_site_0("run", ()Ljava/lang/Runnable;, 0x2a)@La/A;->bootstrap()'
+            'Ljava/lang/invoke/CallSite;',
+            '    const-method-handle v0, invoke-static@La/A;->bootstrap()Ljava/lang/invoke/CallSite;',
+            '    const-method-type v1, (I)V',
+            '    return-void',
+            '.end method'])
+
+    def test_undecodable_class(self):
+        dex = DexBuilder()
+        foo = dex.method('La/A;', 'foo', [], 'V')
+        content = dex.build('La/A;', [(foo, 1, [0x003e, 0x000e])])
+
+        # Unused opcode 0x3e: the class is skipped
+        sm = SmaliProject()
+        sm.parseDex(content, include_unpackaged=True)
+        self.assertEqual(sm.classes, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
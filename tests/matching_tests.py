@@ -0,0 +1,122 @@
+import unittest
+
+# Unit test for classes matching between two projects
+# Date: October 18, 2026
+from smalanalysis.smali import ChangesTypes
+from smalanalysis.smali.SmaliProject import SmaliProject
+
+
+class ClassesMatchingTesting(unittest.TestCase):
+
+    @staticmethod
+    def buildProject(names):
+        proj = SmaliProject()
+
+        for name in names:
+            cls = SmaliProject.parseClass(".class public %s\n.super Ljava/lang/Object;\n" % name)
+            cls.parent = proj
+            proj.addClass(cls)
+
+        return proj
+
+    @staticmethod
+    def names(pairs):
+        return [[None if c is None else c.name for c in p] for p in pairs]
+
+    def test_match_same_names(self):
+        old = ClassesMatchingTesting.buildProject(['La/A;', 'La/B;', 'La/C;'])
+        new = ClassesMatchingTesting.buildProject(['La/C;', 'La/A;', 'La/D;'])
+
+        similars, differents = old.matchClasses(new)
+
+        self.assertEqual(ClassesMatchingTesting.names(similars), [['La/C;', 'La/C;'], ['La/A;', 'La/A;']])
+        self.assertEqual(ClassesMatchingTesting.names(differents), [['La/B;', None], [None, 'La/D;']])
+
+    def test_match_moved_classes(self):
+        old = ClassesMatchingTesting.buildProject(['La/A;', 'La/B;', 'Lb/B;'])
+        new = ClassesMatchingTesting.buildProject(['Lc/B;', 'La/A;', 'Ld/B;', 'Le/B;'])
+
+        similars, differents = old.matchClasses(new)
+
+        self.assertEqual(ClassesMatchingTesting.names(similars),
+                         [['La/A;', 'La/A;'], ['La/B;', 'Lc/B;'], ['Lb/B;', 'Ld/B;']])
+        self.assertEqual(ClassesMatchingTesting.names(differents), [[None, 'Le/B;']])
+
+
+class MethodsMatchingTesting(unittest.TestCase):
+
+    @staticmethod
+    def buildClass(methods):
+        content = ".class public La/A;\n.super Ljava/lang/Object;\n"
+
+        for signature, lines in methods:
+            content += ".method public %s\n    .registers 2\n%s\n.end method\n" % (
+                signature, '\n'.join(map(lambda x: '    %s' % x, lines)))
+
+        return SmaliProject.parseClass(content)
+
+    def test_match_methods(self):
+        old = MethodsMatchingTesting.buildClass([
+            ('same()V', ['const v0, 0x1', 'return-void']),
+            ('revised()V', ['const v0, 0x1', 'return-void']),
+            ('renamed()V', ['const v0, 0x2', 'const v1, 0x3', 'return-void']),
+            ('sameName()V', ['return-void']),
+            ('dropped()V', ['const v0, 0x4', 'return-void']),
+        ])
+        new = MethodsMatchingTesting.buildClass([
+            ('added()V', ['const v0, 0x5', 'return-void']),
+            ('sameName(I)I', ['const v0, 0x6', 'return v0']),
+            ('newName()V', ['const v0, 0x2', 'const v1, 0x3', 'return-void']),
+            ('revised()V', ['const v0, 0x7', 'return-void']),
+            ('same()V', ['const v0, 0x1', 'return-void']),
+        ])
+
+        sames, diffs = old.methodsComparison(new, [])
+
+        self.assertEqual([[m.name for m in s] for s in sames], [['same', 'same']])
+        self.assertEqual([[None if m is None else m.name for m in d[0:2]] + [d[2]] for d in diffs], [
+            ['revised', 'revised', ChangesTypes.REVISED_METHOD],
+            ['renamed', 'newName', ChangesTypes.RENAMED_METHOD],
+            ['sameName', 'sameName', ChangesTypes.SAME_NAME],
+            ['dropped', None, ChangesTypes.NOT_FOUND],
+            [None, 'added', ChangesTypes.NOT_FOUND],
+        ])
+
+
+class AnonymousClassesMatchingTesting(unittest.TestCase):
+
+    @staticmethod
+    def buildOuterClass(anonymous):
+        outer = SmaliProject.parseClass(".class public La/A;\n.super Ljava/lang/Object;\n")
+
+        for name, methods in anonymous:
+            content = ".class La/A$%s;\n.super Ljava/lang/Object;\n.field final synthetic this$0:La/A;\n" % name
+
+            for method, line in methods:
+                content += ".method public %s()V\n    %s\n    return-void\n.end method\n" % (method, line)
+
+            outer.innerclasses[name] = SmaliProject.parseClass(content)
+
+        return outer
+
+    def test_match_anonymous_classes(self):
+        old = AnonymousClassesMatchingTesting.buildOuterClass([
+            ('1', [('run', 'const v0, 0x1')]),
+            ('2', [('onClick', 'const v0, 0x2')]),
+            ('3', [('run', 'const v0, 0x3'), ('cancel', 'nop')]),
+        ])
+        new = AnonymousClassesMatchingTesting.buildOuterClass([
+            ('1', [('onClick', 'const v0, 0x4')]),
+            ('2', [('run', 'const v0, 0x5')]),
+            ('3', [('run', 'const v0, 0x1')]),
+        ])
+
+        matches, unmatchedOld, unmatchedNew = SmaliProject.diffAnonymousInnerClasses(old, new, {'La/A;': 'La/A;'})
+
+        self.assertEqual([(o.name, n.name) for o, n in matches], [('La/A$1;', 'La/A$2;'), ('La/A$2;', 'La/A$1;')])
+        self.assertEqual([c.name for c in unmatchedOld], ['La/A$3;'])
+        self.assertEqual([c.name for c in unmatchedNew], ['La/A$3;'])
+
+
+if __name__ == '__main__':
+    unittest.main()
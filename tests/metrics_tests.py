@@ -0,0 +1,156 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+# Unit test for metrics computation
+# Date: October 18, 2026
+from smalanalysis.smali import Metrics
+from smalanalysis.smali.SmaliProject import SmaliProject
+
+
+class MetricsTesting(unittest.TestCase):
+
+    @staticmethod
+    def buildProject(classes):
+        sm = SmaliProject()
+
+        for content in classes:
+            c = SmaliProject.parseClass(content)
+            sm.addClass(c)
+            c.parent = sm
+
+        return sm
+
+    def test_merged_metrics(self):
+        header = ".class public La/{};\n.super Ljava/lang/Object;\n"
+        method = ".method public {}()V\n{}.end method\n"
+        old = MetricsTesting.buildProject([
+            header.format('A') + method.format('foo', '    const v0, 0x1\n    return-void\n'),
+            header.format('B') + ".field private i:I\n" + method.format('bar', '    return-void\n'),
+            header.format('C')])
+        new = MetricsTesting.buildProject([
+            header.format('A') + method.format('foo', '    const v0, 0x2\n    nop\n    nop\n    return-void\n'),
+            header.format('B') + method.format('bar', '    return-void\n') + method.format('baz', '    nop\n'),
+            header.format('D')])
+        diff = old.differences(new, [])
+
+        metrics = Metrics.MetricsAccumulator()
+        metrics[""].add(diff)
+        self.assertEqual((metrics[""]["MC"], metrics[""]["MA"], metrics[""]["FD"]), (1, 1, 1))
+        self.assertEqual(metrics[""].addedLines, {'const': 1, 'nop': 1})
+        self.assertEqual(metrics[""].removedLines, {'const': 1})
+
+        # Metrics of parts of the diff sum up to the metrics of the whole diff, as computed by computeMetrics()
+        merged = Metrics.MetricsAccumulator()
+        for part in [diff[:1], diff[1:]]:
+            shard = Metrics.MetricsAccumulator()
+            shard[""].add(part)
+            merged.merge(shard)
+
+        legacy = {}
+        Metrics.initMetricsDict("", legacy)
+        Metrics.computeMetrics(diff, legacy)
+
+        self.assertEqual(merged[""].counters, metrics[""].counters)
+        self.assertEqual(merged.toDict(), legacy)
+
+        # Shards changing the same classes are merged as if their records were added one after the other
+        merged[""].merge(shard[""]).merge(shard[""])
+        whole = Metrics.ScopeMetrics()
+        whole.add(diff + diff[1:] + diff[1:])
+        self.assertEqual(merged[""].counters, whole.counters)
+        self.assertEqual(merged[""].changedClasses, whole.changedClasses)
+
+    def test_versions_metrics(self):
+        header = ".class public La/A;\n.super Ljava/lang/Object;\n"
+        versions = {
+            'v1': header,
+            'v2': header + ".field private i:I\n",
+            'v3': header + ".field private i:I\n.method public foo()V\n    return-void\n.end method\n"}
+        parsed = []
+
+        def parse(version):
+            parsed.append(version)
+            return MetricsTesting.buildProject([versions[version]])
+
+        results = list(Metrics.versionsMetrics(['v1', 'v2', 'v3'], parse, False, countsOnly=True))
+
+        self.assertEqual(parsed, ['v1', 'v2', 'v3'])
+        self.assertEqual([(old, new) for old, new, metrics in results], [('v1', 'v2'), ('v2', 'v3')])
+        self.assertEqual([(metrics[""]["FA"], metrics[""]["MA"]) for old, new, metrics in results], [(1, 0), (0, 1)])
+
+    def test_counts_only_metrics(self):
+        header = ".class public La/{};\n.super Ljava/lang/Object;\n"
+        method = ".method public foo()V\n    {}\n.end method\n"
+        metrics = []
+
+        for countsOnly, workers in [(False, None), (True, None), (True, 2)]:
+            old = MetricsTesting.buildProject([header.format(n) + method.format('nop') for n in 'ABCDE'])
+            new = MetricsTesting.buildProject([header.format(n) + method.format('return-void' if n in 'BCE' else 'nop')
+                                               for n in 'ABCE'])
+            metrics.append(Metrics.projectsMetrics(old, new, workers=workers, countsOnly=countsOnly).toDict())
+
+            self.assertEqual(old.classes[1].methods[0].views is None, countsOnly)
+
+        # Differences are summed up class by class (CC adds up the classes changed so far)
+        self.assertEqual((metrics[0]["OUTMC"], metrics[0]["OUTCD"], metrics[0]["OUTCC"]), (3, 1, 1 + 2 + 3))
+        self.assertEqual(metrics[0], metrics[1])
+        self.assertEqual(metrics[0], metrics[2])
+
+    def test_counts_only_duplicated_classes(self):
+        header = ".class public Lcom/a/A;\n.super Ljava/lang/Object;\n"
+        method = ".method public foo()V\n    {}\n.end method\n"
+
+        # The same class in two dex files, changed in both
+        with tempfile.TemporaryDirectory() as folder:
+            versions = []
+            for i, body in enumerate(['nop', 'return-void']):
+                versions.append(os.path.join(folder, 'v{}.zip'.format(i + 1)))
+                with zipfile.ZipFile(versions[-1], 'w') as zp:
+                    for dex in ['classes', 'classes2']:
+                        zp.writestr('{}/com/a/A.smali'.format(dex), header + method.format(body))
+
+            metrics = []
+            for countsOnly, workers in [(False, None), (True, None), (True, 2)]:
+                old, new = Metrics.parseVersion(versions[0], 'com'), Metrics.parseVersion(versions[1], 'com')
+                metrics.append(Metrics.projectsMetrics(old, new, workers=workers, countsOnly=countsOnly).toDict())
+
+        self.assertEqual((metrics[0]["OUT#C-"], metrics[0]["OUTMC"], metrics[0]["OUTCC"]), (2, 2, 2))
+        self.assertEqual(metrics[0], metrics[1])
+        self.assertEqual(metrics[0], metrics[2])
+
+    def test_parallel_differences(self):
+        header = ".class public La/{};\n.super Ljava/lang/Object;\n"
+        method = ".method public foo()V\n    {}\n.end method\n"
+        old = MetricsTesting.buildProject([header.format(n) + method.format('nop') for n in 'ABCDE'])
+        new = MetricsTesting.buildProject([header.format(n) + method.format('return-void' if n in 'BD' else 'nop')
+                                           for n in 'ABCDE'])
+
+        serial = old.differences(new, [])
+        parallel = old.differences(new, [], workers=2)
+
+        records = old.iterDifferences(new, [])
+        self.assertIs(next(records)[0][0], serial[0][0][0])
+        self.assertEqual(len(list(records)), 4)
+
+        self.assertEqual(len(parallel), 5)
+        for s, p in zip(serial, parallel):
+            self.assertIs(s[0][0], p[0][0])
+            self.assertIs(s[0][1], p[0][1])
+            self.assertEqual(len(s[1]), len(p[1]))
+            for ds, dp in zip(s[1], p[1]):
+                self.assertIs(ds[0], dp[0])
+                self.assertIs(ds[1], dp[1])
+                self.assertIs(ds[2], dp[2])
+
+        # Without fork, classes are diffed in this process
+        with mock.patch.object(multiprocessing, 'get_all_start_methods', return_value=['spawn']):
+            self.assertEqual([[s[0], len(s[1])] for s in old.differences(new, [], workers=2)],
+                             [[s[0], len(s[1])] for s in serial])
+
+
+if __name__ == '__main__':
+    unittest.main()
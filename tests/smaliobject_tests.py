@@ -0,0 +1,203 @@
+import pickle
+import unittest
+
+# Unit test for smali objects
+# Date: October 18, 2026
+from smalanalysis.smali.SmaliObject import SmaliMethod, Modifiers, Mappings, InstructionTable, compareLists, \
+    bidirectCompareLists, compareWithMapping, SELF, OTHER
+from smalanalysis.smali.SmaliProject import SmaliProject
+
+
+class SmaliObjectTesting(unittest.TestCase):
+
+    @staticmethod
+    def buildMethod(name, lines):
+        m = SmaliMethod(name, [], 'V', ['public'], None)
+
+        for line in lines:
+            m.addLine(line)
+
+        return m
+
+    def test_lines_views(self):
+        m = SmaliObjectTesting.buildMethod('foo', ['.registers 2', 'const v0, 0x7f0a0001', ':cond_0', 'return-void'])
+
+        self.assertEqual(list(m.getCleanLines()), ['const v0, 0x7f0a0001', 'return-void'])
+        self.assertIs(m.getCleanLines(), m.getCleanLines())
+        self.assertEqual(list(m.getComparableLines()), ['const v0, <R_REF>', 'return-void'])
+
+        m.addLine('nop')
+        self.assertEqual(list(m.getCleanLines()), ['const v0, 0x7f0a0001', 'return-void', 'nop'])
+
+    def test_encoded_lines(self):
+        lines = ['.registers 2', '.line 3', 'const v0, 0x1', ':cond_0', '.line 4', 'return-void', '.end local v0']
+        m1 = SmaliObjectTesting.buildMethod('foo', lines)
+        m2 = SmaliObjectTesting.buildMethod('bar', ['const v0, 0x1', '# comment', 'return-void'])
+
+        self.assertEqual(m1.lines, lines)
+        self.assertEqual(m1.getLines(), lines)
+        self.assertEqual(len(m1.code), 2)
+        self.assertEqual(m1.code, m2.code)
+        self.assertTrue(m1.getCleanLines().sameAs(m2.getCleanLines()))
+        self.assertEqual(m1.getCleanLines()[1], 'return-void')
+
+        # Lines are built once, until the body changes
+        self.assertIs(m1.lines, m1.lines)
+        m1.addLine('nop')
+        self.assertEqual(m1.lines, lines + ['nop'])
+        m1.lines = lines[:3]
+        self.assertEqual(m1.lines, lines[:3])
+
+    def test_similar_source_code(self):
+        m1 = SmaliObjectTesting.buildMethod('foo', ['const v0, 0x7f0a0001', 'new-instance v0, La/A$1;'])
+        m2 = SmaliObjectTesting.buildMethod('bar', ['.line 3', 'const v0, 0x7f0a0002', 'new-instance v0, La/A$2;'])
+
+        self.assertTrue(m1.areSourceCodeSimilars(m2))
+        self.assertFalse(m1.areSourceCodeSimilars(m2, True))
+
+        m2.addLine('return-void')
+        self.assertFalse(m1.areSourceCodeSimilars(m2))
+
+    def test_class_digest(self):
+        content = ".class public La/A;\n.super Ljava/lang/Object;\n.field private i:I\n" \
+                  ".method public foo()V\n    .line %d\n    return-void\n.end method\n"
+        c1 = SmaliProject.parseClass(content % 1)
+        c2 = SmaliProject.parseClass(content % 2)
+
+        self.assertEqual(c1.getDigest(), c2.getDigest())
+        self.assertEqual(c1.differences(c2, []), [])
+
+        c2.methods[0].addLine('nop')
+        self.assertNotEqual(c1.getDigest(), c2.getDigest())
+
+        c1.methods[0].addLine('nop')
+        self.assertEqual(c1.getDigest(), c2.getDigest())
+
+        c1.fields[0].addModifiersFromList(['static'])
+        self.assertNotEqual(c1.getDigest(), c2.getDigest())
+
+    def test_class_hierarchy(self):
+        sm = SmaliProject()
+
+        for name, zuper, implements in [('La/A;', 'Ljava/lang/Object;', 'La/I;'), ('La/B;', 'La/A;', None),
+                                        ('La/C;', 'La/B;', None), ('La/B$1;', 'La/A;', 'La/J;'),
+                                        ('La/I;', 'Ljava/lang/Object;', 'La/J;')]:
+            c = SmaliProject.parseClass('.class public {}\n.super {}\n{}'.format(
+                name, zuper, '' if implements is None else '.implements {}\n'.format(implements)))
+            sm.addClass(c)
+            c.parent = sm
+
+        # Inner classes are attached to their outer class
+        sm.classes[1].innerclasses['1'] = sm.classes.pop(3)
+        sm.classes[1].innerclasses['1'].parent = sm.classes[1]
+        sm.indexesChanged()
+
+        a, b, c, anonymous = sm.searchClass('a.A'), sm.searchClass('a/B'), sm.searchClass('La/C;'), \
+            sm.searchClass('La/B$1;')
+        self.assertEqual(anonymous.name, 'La/B$1;')
+        self.assertEqual(c.determineParentClassHierarchy(), [b, a])
+        self.assertEqual(c.determineParentClassHierarchyNames(), ['La/B;', 'La/A;', 'Ljava/lang/Object;'])
+        self.assertEqual(anonymous.determineParentClassHierarchy(), [a])
+
+        self.assertEqual(sm.getInterfaces(c), {'La/I;', 'La/J;'})
+        self.assertEqual(sm.getSubClasses('La/A;'), [b, anonymous, c])
+        self.assertEqual(sm.getSubClasses('La/J;'), [])
+        self.assertEqual(set(map(lambda x: x.name, sm.getSubClasses('La/J;', True))),
+                         {'La/B$1;', 'La/I;', 'La/A;', 'La/B;', 'La/C;'})
+
+    def test_field_usages(self):
+        c = SmaliProject.parseClass(".class public La/A;\n.super Ljava/lang/Object;\n.field private i:I\n"
+                                    ".field private s:Ljava/lang/String;\n"
+                                    ".method public <init>()V\n    iput v0, p0, La/A;->i:I\n.end method\n"
+                                    ".method public foo()V\n    .line 2\n    iget v0, p0, La/A;->i:I\n"
+                                    "    iget-object v1, p0, La/A;->s:Ljava/lang/String;\n"
+                                    "    iput v0, p0, La/A;->i:I\n.end method\n")
+        foo = c.methods[1]
+
+        self.assertEqual(c.whereIsFieldUsed(c.fields[0]), [[foo, 0], [foo, 2]])
+        self.assertEqual(c.whereIsFieldUsed(c.fields[1]), [[foo, 1]])
+
+        foo.addLine('sget-object v1, La/A;->s:Ljava/lang/String;')
+        self.assertEqual(c.whereIsFieldUsed(c.fields[1]), [[foo, 1], [foo, 3]])
+
+    def test_compare_string_lists(self):
+        self.assertEqual(compareLists(['La/I;', 'La/J;', 'La/K;'], ['La/K;', 'La/I;']), ['La/J;'])
+        self.assertEqual(bidirectCompareLists(['La/I;', 'La/J;'], ['La/I;', 'La/L;']),
+                         [[SELF, 'La/J;'], [OTHER, 'La/L;']])
+
+        # Through mappings, an inner class is looked up by its outer class
+        mappings = {'La/A;': 'Lb/A;'}
+        self.assertEqual(compareLists(['La/A$1;', 'La/A$Inner;', 'La/B;'], ['Lb/A$2;', 'La/B;'], mappings=mappings),
+                         ['La/A$Inner;'])
+
+    def test_mappings(self):
+        mappings = Mappings({'La/A;': 'Lb/A;', 'La/AB;': 'Lb/X;'})
+        m = SmaliObjectTesting.buildMethod('foo', ['invoke-virtual {p0}, La/A$1;->run(La/AB;)V'])
+
+        self.assertEqual(m.transposeWithNewReferences(m.getCleanLines(), mappings),
+                         ['invoke-virtual {p0}, Lb/A$1;->run(Lb/X;)V'])
+        self.assertTrue(compareWithMapping('La/A$1;', 'Lb/A$2;', mappings))
+        self.assertFalse(compareWithMapping('La/C;', 'Lb/C;', mappings))
+
+        # Mappings added later are taken into account
+        mappings['La/C;'] = 'Lb/C;'
+        self.assertTrue(compareWithMapping('La/C$1;', 'Lb/C$1;', mappings))
+        self.assertEqual(mappings.transpose('new-instance v0, La/C;'), 'new-instance v0, Lb/C;')
+
+        # References are renamed at once, new names are not renamed again
+        swapped = Mappings({'La/A;': 'La/B;', 'La/B;': 'La/C;'})
+        self.assertEqual(swapped.transpose('La/A;->foo(La/B;)V'), 'La/B;->foo(La/C;)V')
+
+        # The longest old name is renamed, and the first old class is the leftmost one, whatever the mappings order
+        for items in [[('La/A;', 'Lb/A;'), ('La/AB;', 'Lb/X;')], [('La/AB;', 'Lb/X;'), ('La/A;', 'Lb/A;')]]:
+            ordered = Mappings(items)
+            self.assertEqual(ordered.transpose('La/AB;La/A;'), 'Lb/X;Lb/A;')
+            self.assertEqual(ordered.renameFirst('[La/AB;La/A;La/AB;'), '[Lb/X;La/A;Lb/X;')
+            self.assertEqual(ordered.renameFirst('La/C;'), 'La/C;')
+
+    def test_compact_lines(self):
+        content = '.class public La/A;\n.super Ljava/lang/Object;\n' \
+                  '.annotation runtime La/Kept;\n    value = "kept"\n.end annotation\n' \
+                  '.method public foo()V\n    .registers 1\n    const-string v0, "kept"\n    return-void\n.end method\n'
+        table = InstructionTable.texts, InstructionTable.ids, InstructionTable.kept, \
+            InstructionTable.normalizations, InstructionTable.compacted
+
+        try:
+            project = SmaliProject()
+            project.addClass(SmaliProject.parseClass(content))
+            foo = project.classes[0].methods[0]
+            discarded = SmaliObjectTesting.buildMethod('bar', ['const-string v0, "discarded"'])
+            lines, clean, annotation = foo.lines, list(foo.getCleanLines()), project.classes[0].annotations[0].lines
+
+            self.assertTrue(InstructionTable.compact([project], 0))
+            self.assertFalse(InstructionTable.compact([project]))
+
+            self.assertFalse('const-string v0, "discarded"' in InstructionTable.ids)
+            self.assertEqual(len(InstructionTable.texts), 4)
+            self.assertEqual(foo.lines, lines)
+            self.assertEqual(list(foo.getCleanLines()), clean)
+            self.assertEqual(project.classes[0].annotations[0].lines, annotation)
+            self.assertEqual(annotation, ['value = "kept"'])
+            self.assertIsNone(discarded.views)
+        finally:
+            InstructionTable.texts, InstructionTable.ids, InstructionTable.kept, \
+                InstructionTable.normalizations, InstructionTable.compacted = table
+
+    def test_modifiers(self):
+        m = SmaliObjectTesting.buildMethod('foo', ['return-void'])
+        m.addModifiersFromList(['static', 'final', 'some-new-modifier'])
+
+        self.assertEqual(len(m.modifiers), 4)
+        self.assertTrue('some-new-modifier' in m.modifiers)
+        self.assertFalse('private' in m.modifiers)
+        self.assertEqual(sorted(m.modifiers), ['final', 'public', 'some-new-modifier', 'static'])
+        self.assertEqual(m.modifiers ^ Modifiers(['public', 'static']), {'final', 'some-new-modifier'})
+
+        m2 = pickle.loads(pickle.dumps(m))
+        self.assertEqual(m2.modifiers, m.modifiers)
+        self.assertEqual(m2.lines, ['return-void'])
+        self.assertFalse(hasattr(m2, '__dict__'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,17 @@
+import contextlib
 import unittest
+import io
 import os
+import shutil
 import subprocess
+import tempfile
+import zipfile
 
 # Unit test for smali class generation
 # Date: November 7, 2017
 # Author: Vincenzo Musco (http://www.vmusco.com)
 from smalanalysis.smali.SmaliProject import SmaliProject
+from tests.TestHelper import TestHelper
 
 
 class SmaliParseTesting(unittest.TestCase):
@@ -124,5 +130,143 @@ class SmaliParseTesting(unittest.TestCase):
         self.assertTrue('private' in f.modifiers)
         self.assertIsNone(f.init)
 
+    def test_directive_dispatch(self):
+        header = '.class public La/A;\n.super Ljava/lang/Object;\n'
+
+        # Annotations are found whatever their indentation, at the class level and in fields
+        clazz = SmaliProject.parseClass(header + '.field private i:I\n    .annotation runtime La/B;\n'
+                                                 '    .end annotation\n.end field\n'
+                                                 '    .annotation system Ldalvik/annotation/MemberClasses;\n'
+                                                 '        value = {}\n    .end annotation\n')
+        self.assertEqual([a.name for a in clazz.annotations], ['Ldalvik/annotation/MemberClasses'])
+        self.assertEqual(clazz.annotations[0].lines, ['value = {}'])
+        self.assertEqual([(f.name, len(f.annotations)) for f in clazz.fields], [('i', 1)])
+
+        # Unknown directives, and known ones not followed by a space, go through all the matchers and are rejected
+        for content in [header + '.debug 1\n', '.class\tpublic La/A;\n.super Ljava/lang/Object;\n',
+                        header + '.source\t"A.java"\n']:
+            with contextlib.redirect_stderr(io.StringIO()) as err:
+                with self.assertRaises(SystemExit):
+                    SmaliProject.parseClass(content)
+
+            self.assertTrue(err.getvalue().startswith('Parsing error.'))
+
+    def test_zip_entries_reading(self):
+        content = b'.class public La/\xe9;\r\n.super Ljava/lang/Object;\n\n# no final new line'
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zp:
+            zp.writestr('a/A.smali', content)
+
+        with zipfile.ZipFile(buffer, 'r') as zp:
+            expected = "".join(map(chr, content))
+            self.assertEqual(SmaliProject.readZipEntry(zp, 'a/A.smali'), expected)
+            self.assertEqual(list(SmaliProject.iterZipEntryLines(zp, 'a/A.smali')), expected.split('\n'))
+
+    def test_cached_parsing(self):
+        with tempfile.TemporaryDirectory() as folder:
+            archive = os.path.join(folder, 'smali.zip')
+            with zipfile.ZipFile(archive, 'w') as zp:
+                zp.writestr('a/A.smali', '.class public La/A;\n.super Ljava/lang/Object;\n'
+                                         '.method public foo()V\n    return-void\n.end method\n')
+                zp.writestr('a/A$1.smali', '.class La/A$1;\n.super Ljava/lang/Object;\n')
+
+            cache = os.path.join(folder, 'cache')
+            for i in range(2):
+                sm = SmaliProject()
+                sm.parseProject(archive, None, cache=cache)
+
+                self.assertEqual(len([f for f in os.listdir(cache) if f.endswith('.pickle')]), 1)
+                self.assertEqual([c.name for c in sm.classes], ['La/A;'])
+                self.assertIs(sm.classes[0].parent, sm)
+                self.assertEqual(sm.classes[0].methods[0].lines, ['return-void'])
+                self.assertEqual(sm.classes[0].innerclasses['1'].parent, sm.classes[0])
+
+            # Corrupted entries are parsed again (archive entries being loaded from the entries cache)
+            entry = os.path.join(cache, [f for f in os.listdir(cache) if f.endswith('.pickle')][0])
+            with open(entry, 'r+b') as fp:
+                fp.seek(-5, os.SEEK_END)
+                fp.write(b'xxxxx')
+
+            sm = SmaliProject()
+            sm.parseProject(archive, None, cache=cache)
+            self.assertEqual([c.name for c in sm.classes], ['La/A;'])
+            self.assertEqual(sm.classes[0].innerclasses['1'].parent, sm.classes[0])
+
+    def test_lazy_parsing(self):
+        content = '.class public La/A;\n.super Ljava/lang/Object;\n.method public foo()V\n    .registers 1\n' \
+                  '# comment\n    const v0, 0x1\n\n    return-void\n.end method\n.method public bar()V\n    nop\n'
+
+        with tempfile.TemporaryDirectory() as folder:
+            archive = os.path.join(folder, 'smali.zip')
+            with zipfile.ZipFile(archive, 'w') as zp:
+                zp.writestr('a/A.smali', content)
+
+            sm = SmaliProject()
+            sm.parseProject(archive, None, lazy=True)
+            foo, bar = sm.classes[0].methods
+
+            self.assertEqual(foo.body[1:3], ('a/A.smali', zipfile.ZipFile(archive).getinfo('a/A.smali').CRC))
+            self.assertEqual(foo.lines, SmaliProject.parseClass(content).methods[0].lines)
+            self.assertIsNone(foo.body)
+            self.assertTrue(os.path.abspath(archive) in SmaliProject.archives)
+
+            # Archives are closed with the project, bodies not loaded yet open them again
+            sm.close()
+            self.assertFalse(os.path.abspath(archive) in SmaliProject.archives)
+            self.assertEqual(bar.getCleanLines()[0], 'nop')
+            sm.close()
+
+    def test_apk_parsing(self):
+        apk = os.path.join(SmaliParseTesting.getTestFolder(), 'apks', 'Version1.apk')
+
+        sm = SmaliProject()
+        sm.parseApk(apk, 'com.example.aakash.versiona')
+
+        self.assertEqual([c.name for c in sm.classes], ['Lcom/example/aakash/versiona/MainActivity;'])
+        self.assertEqual(sm.classes[0].getSuper(), 'android/support/v7/app/AppCompatActivity')
+        self.assertEqual([m.name for m in sm.classes[0].methods], ['<init>', 'method1', 'onCreate'])
+        self.assertTrue('0x7f04001b' in sm.ressources_id)
+
+        m = SmaliParseTesting.findMethod(sm.classes[0], 'onCreate')
+        self.assertEqual(m.params, ['Landroid/os/Bundle;'])
+        self.assertEqual(m.lines, ['.registers 3', '.param p1, "savedInstanceState"    # Landroid/os/Bundle;',
+                                   '.prologue', '.line 10',
+                                   'invoke-super {p0, p1}, Landroid/support/v7/app/AppCompatActivity;->'
+                                   'onCreate(Landroid/os/Bundle;)V',
+                                   '.line 11', 'const v0, 0x7f04001b',
+                                   'invoke-virtual {p0, v0}, Lcom/example/aakash/versiona/MainActivity;->'
+                                   'setContentView(I)V',
+                                   '.line 12', 'return-void'])
+
+        # Dex files are parsed by several processes the same way
+        parallel = SmaliProject()
+        parallel.parseApk(apk, 'com.example.aakash.versiona', workers=2)
+        self.assertEqual(parallel.classes[0].getDigest(), sm.classes[0].getDigest())
+        self.assertEqual(parallel.ressources_id, sm.ressources_id)
+
+    @staticmethod
+    def describe(project):
+        return [(c.name, c.zuper, c.source, c.implements, c.getDigest(), sorted(c.modifiers),
+                 [(m.name, m.params, m.ret, sorted(m.modifiers), m.lines) for m in c.methods],
+                 [(f.name, f.type, f.init, sorted(f.modifiers)) for f in c.fields])
+                for c in project.iterAllClasses()], project.ressources_id
+
+    @unittest.skipIf(shutil.which('java') is None, 'Java is needed to run baksmali')
+    def test_apk_parsing_as_baksmali(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for apk in ['apks/Version1.apk', 'apks1/app1.apk']:
+                # The bundled APKs disassembled by sa-disassemble (baksmali 2.2.1)
+                archive = os.path.join(folder, os.path.basename(apk) + '.smali')
+                TestHelper.disassemble(apk, archive)
+
+                disassembled = SmaliProject()
+                disassembled.parseProject(archive, include_unpackaged=True)
+                parsed = SmaliProject()
+                parsed.parseApk(os.path.join(SmaliParseTesting.getTestFolder(), apk), include_unpackaged=True)
+
+                self.assertEqual([c.name for c in parsed.classes], [c.name for c in disassembled.classes])
+                self.assertEqual(SmaliParseTesting.describe(parsed), SmaliParseTesting.describe(disassembled))
+
+
 if __name__ == '__main__':
     unittest.main()